@@ -9,6 +9,9 @@ import streamlit as st
 
 # 1. Importa a configuração global e o CSS
 from render_utils import render_global_config, render_custom_header
+from http_utils import iniciar_contagem_render, contagem_render
+from gravacao_utils import exibir_status_gravacao
+from storage_utils import migrar_arquivos_legados
 
 # 2. Importa as funções de cada página da pasta pages
 from pages.homepage import homepage
@@ -21,6 +24,11 @@ from pages.cashback_system import cashback_system # <<< Importação CORRETA do
 
 # --- 1. CONFIGURAÇÃO INICIAL ---
 render_global_config() 
+iniciar_contagem_render()  # Requisições HTTP/GitHub desta execução (exibidas no rodapé)
+try:
+    migrar_arquivos_legados()  # Uma vez por processo: tira colunas derivadas gravadas por versões antigas
+except Exception as e:
+    st.warning(f"⚠️ Migração de arquivos não concluída (nova tentativa na próxima execução): {e}")
 
 # --- 2. MAPA DE PÁGINAS ---
 PAGINAS = {
@@ -44,4 +52,12 @@ render_custom_header(paginas_ordenadas, PAGINAS)
 # --- 4. RENDERIZAÇÃO DO CONTEÚDO ---
 PAGINAS[st.session_state.pagina_atual]()
 
+# --- 5. GRAVAÇÕES EM SEGUNDO PLANO E REQUISIÇÕES DA PÁGINA ---
+exibir_status_gravacao()
+_req = contagem_render()
+st.caption(
+    f"🔌 Requisições nesta página: {_req['http']} HTTP · {_req['github_api']} API GitHub · "
+    f"{_req['repo_reutilizado']} repositório(s) reaproveitado(s)"
+)
+
 
@@ -0,0 +1,69 @@
+# benchmarks/saldo_acumulado.py
+# Saldo Acumulado: recálculo completo x estrutura incremental (ledger_utils.SaldoAcumulado).
+# Uso, a partir da raiz do repositório:  python benchmarks/saldo_acumulado.py
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ledger_utils import SaldoAcumulado  # noqa: E402
+
+
+def _saldo_recalculo_completo(df_proc: pd.DataFrame) -> pd.Series:
+    """Cálculo antigo do processar_dataframe: ordena as 'Realizada', faz cumsum e junta de volta (merge + ffill)."""
+    realizadas = df_proc[df_proc["Status"] == "Realizada"]
+    ordenadas = realizadas.sort_values(by=["Data_dt", "original_index"]).reset_index(drop=True)
+    ordenadas["TEMP_SALDO"] = ordenadas["Valor"].cumsum()
+    junto = pd.merge(df_proc, ordenadas[["original_index", "TEMP_SALDO"]], on="original_index", how="left")
+    return junto["TEMP_SALDO"].ffill().fillna(0)
+
+
+def _df_sintetico(linhas: int, meses: int = 36, semente: int = 42) -> pd.DataFrame:
+    rng = np.random.default_rng(semente)
+    inicio = np.datetime64("2023-01-01")
+    datas = inicio + rng.integers(0, meses * 30, size=linhas).astype("timedelta64[D]")
+    return pd.DataFrame({
+        "original_index": np.arange(linhas),
+        "Data_dt": pd.to_datetime(datas),
+        "Valor": np.round(rng.normal(50, 200, size=linhas), 2),
+        "Status": np.where(rng.random(linhas) < 0.9, "Realizada", "Pendente"),
+    })
+
+
+def benchmark_saldo(tamanhos=(10_000, 100_000, 1_000_000), repeticoes: int = 5):
+    print(f"{'linhas':>10} | {'completo (ms)':>14} | {'incluir 1 (ms)':>14} | {'editar 1 (ms)':>14} | {'construir (ms)':>14}")
+    for linhas in tamanhos:
+        df = _df_sintetico(linhas)
+        rng = np.random.default_rng(7)
+
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            _saldo_recalculo_completo(df)
+        completo = (time.perf_counter() - inicio) / repeticoes * 1000
+
+        inicio = time.perf_counter()
+        estrutura = SaldoAcumulado.construir(df)
+        construir = (time.perf_counter() - inicio) * 1000
+
+        inicio = time.perf_counter()
+        for i in range(repeticoes):
+            data = pd.Timestamp("2023-01-01") + pd.Timedelta(days=int(rng.integers(0, 36 * 30)))
+            estrutura.inserir(linhas + i, data, 10.0)
+        incluir = (time.perf_counter() - inicio) / repeticoes * 1000
+
+        alvos = df.loc[df["Status"] == "Realizada", "original_index"].to_numpy()[:repeticoes]
+        inicio = time.perf_counter()
+        for indice in alvos:
+            data = pd.Timestamp("2023-01-01") + pd.Timedelta(days=int(rng.integers(0, 36 * 30)))
+            estrutura.definir(int(indice), data, 99.0)
+        editar = (time.perf_counter() - inicio) / repeticoes * 1000
+
+        print(f"{linhas:>10,} | {completo:>14.2f} | {incluir:>14.3f} | {editar:>14.3f} | {construir:>14.2f}")
+
+
+if __name__ == "__main__":
+    benchmark_saldo()
@@ -0,0 +1,317 @@
+# cache_utils.py
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import pandas as pd
+import requests
+
+from http_utils import http_get
+from schema_utils import tabela_para_pandas
+
+try:
+    import pyarrow.parquet as pa_parquet
+except ImportError:  # Sem pyarrow: o DataFrame convertido fica só no pickle
+    pa_parquet = None
+
+# Pasta do cache HTTP em disco (corpo + ETag + DataFrame já convertido)
+DIR_CACHE_HTTP = os.environ.get("FLUXO_HTTP_CACHE_DIR", ".cache_http")
+# Snapshots Parquet dos DataFrames convertidos, por SHA do blob do CSV (o CSV continua sendo a fonte)
+DIR_SNAPSHOTS = os.path.join(DIR_CACHE_HTTP, "snapshots")
+
+_lock_cache = threading.Lock()
+_frames_memoria = {}  # (chave_url, parser) -> (etag, DataFrame) — evita até o unpickle
+_estatisticas = {"hits": 0, "misses": 0, "stale": 0, "local": 0, "snapshot": 0, "bytes_baixados": 0, "bytes_economizados": 0}
+# url -> (texto, expira_em | None): conteúdo gravado por este processo que o GitHub ainda não devolve
+_conteudo_local = {}
+# arquivo -> funções com @st.cache_data cujo resultado depende dele (ver depende_de / invalidar_arquivos)
+_dependencias = {}
+# Partição mensal ('livro_caixa_2025_10.csv') -> arquivo lógico ('livro_caixa.csv') na invalidação
+_SUFIXO_MENSAL = re.compile(r"_\d{4}_\d{2}(\.\w+)$")
+
+
+# =================================================================================
+# 🌐 Cache HTTP condicional (ETag / If-None-Match)
+# =================================================================================
+def _chave_url(url: str) -> str:
+    return hashlib.md5(url.encode("utf-8")).hexdigest()
+
+
+def _id_parser(parser) -> str:
+    return f"{getattr(parser, '__module__', '')}.{getattr(parser, '__qualname__', repr(parser))}"
+
+
+def _caminhos(chave: str, parser) -> tuple[str, str, str]:
+    sufixo_parser = hashlib.md5(_id_parser(parser).encode("utf-8")).hexdigest()[:10]
+    base = os.path.join(DIR_CACHE_HTTP, chave)
+    return f"{base}.json", f"{base}.csv", f"{base}_{sufixo_parser}.pkl"
+
+
+def _gravar_atomico(caminho: str, conteudo, modo: str = "w"):
+    tmp = f"{caminho}.tmp{threading.get_ident()}"
+    if modo == "wb":
+        with open(tmp, "wb") as f:
+            f.write(conteudo)
+    else:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(conteudo)
+    os.replace(tmp, caminho)
+
+
+def _contar(campo: str, valor: int = 1):
+    with _lock_cache:
+        _estatisticas[campo] += valor
+
+
+def sha_blob_git(conteudo: str) -> str:
+    """SHA que o git atribui ao blob com esse conteúdo (igual ao `sha` da API do GitHub)."""
+    dados = conteudo.encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(dados) + dados).hexdigest()
+
+
+# =================================================================================
+# 🧊 Snapshot Parquet por SHA do blob (colunas tipadas, categorias como dicionário)
+# =================================================================================
+def _caminho_snapshot(sha: str, parser) -> str:
+    sufixo_parser = hashlib.md5(_id_parser(parser).encode("utf-8")).hexdigest()[:10]
+    return os.path.join(DIR_SNAPSHOTS, f"{sha}_{sufixo_parser}.parquet")
+
+
+def _gravar_snapshot(sha: str, parser, df):
+    """Grava o DataFrame convertido como Parquet (uma vez por conteúdo; outros tipos não têm snapshot)."""
+    if pa_parquet is None or not sha or not isinstance(df, pd.DataFrame):
+        return
+    caminho = _caminho_snapshot(sha, parser)
+    if os.path.exists(caminho):
+        return
+    try:
+        os.makedirs(DIR_SNAPSHOTS, exist_ok=True)
+        tmp = f"{caminho}.tmp{threading.get_ident()}"
+        df.to_parquet(tmp, engine="pyarrow", index=False)
+        os.replace(tmp, caminho)
+    except Exception:
+        pass  # Sem snapshot a próxima leitura só volta a converter o CSV
+
+
+def _ler_snapshot(sha: str, parser) -> pd.DataFrame | None:
+    """DataFrame do snapshot (lido com memory map) ou None se não houver para esse SHA."""
+    if pa_parquet is None or not sha:
+        return None
+    caminho = _caminho_snapshot(sha, parser)
+    if not os.path.exists(caminho):
+        return None
+    try:
+        return tabela_para_pandas(pa_parquet.read_table(caminho, memory_map=True))
+    except Exception:
+        return None
+
+
+def _frame_em_cache(chave: str, parser, etag: str, caminho_corpo: str, caminho_pkl: str, sha: str = ""):
+    """DataFrame do cache (memória > snapshot Parquet > pickle > re-parse do corpo salvo) ou None."""
+    id_parser = _id_parser(parser)
+    em_memoria = _frames_memoria.get((chave, id_parser))
+    if em_memoria and em_memoria[0] == etag:
+        return em_memoria[1].copy()
+    df = _ler_snapshot(sha, parser)
+    if df is not None:
+        _frames_memoria[(chave, id_parser)] = (etag, df)
+        return df.copy()
+    try:
+        df = pd.read_pickle(caminho_pkl)
+    except Exception:
+        try:
+            with open(caminho_corpo, encoding="utf-8") as f:
+                df = parser(f.read())
+            pd.to_pickle(df, caminho_pkl)
+        except Exception:
+            return None
+    _frames_memoria[(chave, id_parser)] = (etag, df)
+    return df.copy()
+
+
+def registrar_conteudo_local(url: str, texto: str, ttl: float | None = None):
+    """
+    Faz `buscar_csv_com_cache(url)` devolver `texto` sem ir à rede: sem ttl, até nova chamada
+    (gravação ainda na fila); com ttl, por `ttl` segundos (commit feito, CDN do raw ainda desatualizado).
+    """
+    with _lock_cache:
+        _conteudo_local[url] = (texto, time.time() + ttl if ttl is not None else None)
+
+
+def remover_conteudo_local(url: str):
+    """Desfaz registrar_conteudo_local (ex.: gravação descartada): a URL volta a ser lida da rede."""
+    with _lock_cache:
+        _conteudo_local.pop(url, None)
+
+
+def _texto_local(url: str) -> str | None:
+    with _lock_cache:
+        registro = _conteudo_local.get(url)
+        if registro is None:
+            return None
+        texto, expira_em = registro
+        if expira_em is not None and expira_em < time.time():
+            del _conteudo_local[url]
+            return None
+        return texto
+
+
+def buscar_csv_com_cache(url: str, parser, timeout: int = 15, sha: str | None = None) -> pd.DataFrame:
+    """
+    Baixa um CSV revalidando com If-None-Match / If-Modified-Since.
+    Resposta 304 => nenhum byte baixado e nenhum parse: devolve o DataFrame guardado.
+    Resposta 200 => converte com `parser(texto)` e atualiza o cache em disco (e o snapshot Parquet do SHA).
+    Com `sha` (SHA do blob já conhecido, ex.: pela listagem da API) e snapshot desse SHA: nem a requisição é feita
+    (contado como "snapshot"); SHA diferente cai no fluxo normal do CSV.
+    Se a rede falhar e houver cópia em cache, ela é devolvida (contada como "stale").
+    Conteúdo registrado com registrar_conteudo_local tem prioridade (contado como "local").
+    O parser normalmente devolve um DataFrame, mas qualquer objeto com .copy() serve (ex.: dict de um JSON).
+    """
+    texto_local = _texto_local(url)
+    if texto_local is not None:
+        _contar("local")
+        sha_local = sha_blob_git(texto_local)
+        df = _ler_snapshot(sha_local, parser)
+        if df is None:
+            df = parser(texto_local)
+            _gravar_snapshot(sha_local, parser, df)
+        return df
+
+    if sha:
+        df = _ler_snapshot(sha, parser)
+        if df is not None:
+            _contar("snapshot")
+            return df
+
+    os.makedirs(DIR_CACHE_HTTP, exist_ok=True)
+    chave = _chave_url(url)
+    caminho_meta, caminho_corpo, caminho_pkl = _caminhos(chave, parser)
+
+    meta = {}
+    try:
+        with open(caminho_meta, encoding="utf-8") as f:
+            meta = json.load(f)
+    except Exception:
+        pass
+
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        response = http_get(url, headers=headers, timeout=timeout)
+    except requests.RequestException:
+        df = _frame_em_cache(chave, parser, meta.get("etag", ""), caminho_corpo, caminho_pkl, meta.get("sha", "")) if meta else None
+        if df is None:
+            raise
+        _contar("stale")
+        return df
+
+    if response.status_code == 304 and meta:
+        df = _frame_em_cache(chave, parser, meta.get("etag", ""), caminho_corpo, caminho_pkl, meta.get("sha", ""))
+        if df is not None:
+            _contar("hits")
+            _contar("bytes_economizados", int(meta.get("tamanho", 0)))
+            return df
+        # Cache corrompido: refaz a requisição sem condicionais
+        response = http_get(url, timeout=timeout)
+
+    response.raise_for_status()
+    _contar("misses")
+    _contar("bytes_baixados", len(response.content))
+
+    texto = response.text
+    df = parser(texto)
+
+    etag = response.headers.get("ETag", "")
+    sha_texto = sha_blob_git(texto)
+    try:
+        _gravar_atomico(caminho_corpo, texto)
+        if isinstance(df, pd.DataFrame) and pa_parquet is not None:
+            _gravar_snapshot(sha_texto, parser, df)
+        else:
+            pd.to_pickle(df, caminho_pkl)
+        _gravar_atomico(caminho_meta, json.dumps({
+            "url": url,
+            "etag": etag,
+            "last_modified": response.headers.get("Last-Modified", ""),
+            "tamanho": len(response.content),
+            "sha": sha_texto,
+        }))
+        _frames_memoria[(chave, _id_parser(parser))] = (etag, df)
+    except Exception:
+        pass  # Falha no cache em disco não pode impedir a leitura
+    return df.copy()
+
+
+def estatisticas_cache_http() -> dict:
+    """Contadores do cache HTTP: hits (304), misses (200), stale, local, snapshot, bytes baixados/economizados."""
+    with _lock_cache:
+        return dict(_estatisticas)
+
+
+# =================================================================================
+# 🧹 Invalidação por arquivo (em vez de st.cache_data.clear())
+# =================================================================================
+def _nome_arquivo(arquivo: str) -> str:
+    """
+    'pasta/produtos_estoque.csv' e 'produtos_estoque.csv' viram a mesma chave; as partições mensais
+    ('livro_caixa_2025_10.csv', 'itens_venda_2025_10.csv'...) contam como o arquivo lógico sem o sufixo.
+    """
+    return _SUFIXO_MENSAL.sub(r"\1", str(arquivo).rsplit("/", 1)[-1].lower())
+
+
+def depende_de(*arquivos):
+    """
+    Registra a função com cache como dependente dos arquivos informados.
+    Usar ACIMA do @st.cache_data, para registrar a função já com cache (que tem .clear()).
+    """
+    def registrar(funcao):
+        id_funcao = _id_parser(funcao)
+        with _lock_cache:
+            for arquivo in arquivos:
+                dependentes = _dependencias.setdefault(_nome_arquivo(arquivo), [])
+                # Módulo reexecutado: troca a versão antiga da mesma função
+                dependentes[:] = [f for f in dependentes if _id_parser(f) != id_funcao] + [funcao]
+        return funcao
+    return registrar
+
+
+def invalidar_arquivos(*arquivos) -> list[str]:
+    """Limpa só os caches que dependem dos arquivos gravados. Retorna os nomes das funções limpas."""
+    with _lock_cache:
+        funcoes = {}
+        for arquivo in arquivos:
+            for funcao in _dependencias.get(_nome_arquivo(arquivo), []):
+                funcoes.setdefault(_id_parser(funcao), funcao)
+    for funcao in funcoes.values():
+        try:
+            funcao.clear()
+        except Exception:
+            pass
+    return list(funcoes)
+
+
+def dependencias_registradas() -> dict:
+    """{arquivo: [funções dependentes]} (diagnóstico)."""
+    with _lock_cache:
+        return {arquivo: [_id_parser(f) for f in funcoes] for arquivo, funcoes in _dependencias.items()}
+
+
+def limpar_cache_http():
+    """Apaga o cache HTTP em disco (inclusive os snapshots Parquet) e em memória."""
+    with _lock_cache:
+        _frames_memoria.clear()
+    for pasta in (DIR_CACHE_HTTP, DIR_SNAPSHOTS):
+        if not os.path.isdir(pasta):
+            continue
+        for nome in os.listdir(pasta):
+            try:
+                os.remove(os.path.join(pasta, nome))
+            except Exception:
+                pass
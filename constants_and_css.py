@@ -4,6 +4,7 @@ import calendar
 import pandas as pd
 import json
 import hashlib
+import os
 
 # ==================== CONSTANTES DE NEGÓCIO E ARQUIVOS ====================
 FATOR_CARTAO = 0.8872
@@ -49,6 +50,14 @@ except Exception as e:
     GITHUB_REPO = f"{OWNER}/{REPO_NAME}"
     GITHUB_BRANCH = BRANCH
 
+# BACKEND DE ARMAZENAMENTO: "github" (CSVs no repositório) ou "sqlite" (banco local, funciona offline)
+try:
+    STORAGE_BACKEND = str(st.secrets.get("STORAGE_BACKEND", os.environ.get("FLUXO_STORAGE_BACKEND", "github"))).lower()
+    SQLITE_PATH = st.secrets.get("SQLITE_PATH", os.environ.get("FLUXO_SQLITE_PATH", "fluxo.db"))
+except Exception:
+    STORAGE_BACKEND = os.environ.get("FLUXO_STORAGE_BACKEND", "github").lower()
+    SQLITE_PATH = os.environ.get("FLUXO_SQLITE_PATH", "fluxo.db")
+
 # Caminhos dos arquivos no repositório
 URL_BASE_REPOS = f"https://raw.githubusercontent.com/{OWNER}/{REPO_NAME}/{BRANCH}/"
 ARQ_PRODUTOS = "produtos_estoque.csv"
@@ -56,6 +65,9 @@ ARQ_LOCAL = "livro_caixa_2025_10.csv"
 PATH_DIVIDAS = CSV_PATH # Usa o caminho lido dos secrets ou o fallback
 ARQ_COMPRAS = "historico_compras.csv"
 ARQ_PROMOCOES = "promocoes.csv" 
+ARQ_ITENS_VENDA = "itens_venda.csv"  # Uma linha por item vendido (derivada de "Produtos Vendidos")
+ARQ_MOVIMENTOS_ESTOQUE = "movimentos_estoque.csv"  # Livro de movimentos de estoque (só acréscimos)
+ARQ_SNAPSHOTS_ESTOQUE = "estoque_snapshots.csv"  # Estoque de todos os produtos a cada N movimentos
 COMMIT_MESSAGE = "Atualiza livro caixa via Streamlit (com produtos/categorias)"
 COMMIT_MESSAGE_DELETE = "Exclui movimentações do livro caixa"
 COMMIT_MESSAGE_EDIT = "Edita movimentação via Streamlit"
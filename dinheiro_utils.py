@@ -0,0 +1,132 @@
+# dinheiro_utils.py
+import re
+
+import numpy as np
+import pandas as pd
+
+# Valores monetários em centavos (int64): somas exatas, sem o desvio acumulado do float
+CENTAVOS_POR_REAL = 100
+_CASAS_ARREDONDAMENTO = 6  # Tira o ruído do float (ex.: 0.285 * 100 = 28.4999...) antes do arredondamento
+
+
+# =================================================================================
+# 🔢 Leitura de valores ("162.53", "1.234,56", "R$ 1.234,56", números)
+# =================================================================================
+def normalizar_texto_numero(serie: pd.Series) -> pd.Series:
+    """
+    Texto numérico -> texto com ponto decimal e sem separador de milhar.
+    Com vírgula: formato brasileiro (ponto = milhar, vírgula = decimal). Sem vírgula: mais de um ponto é milhar,
+    um ponto só é decimal (formato gravado pelo app).
+    """
+    texto = serie.astype(str).str.strip().str.replace(r"[R$\s]", "", regex=True)
+    tem_virgula = texto.str.contains(",", regex=False)
+    varios_pontos = texto.str.count(r"\.") > 1
+    sem_milhar = texto.str.replace(".", "", regex=False)
+    return texto.where(~(tem_virgula | varios_pontos), sem_milhar.str.replace(",", ".", regex=False))
+
+
+def normalizar_numero(texto) -> str:
+    """Versão escalar de normalizar_texto_numero (mesmas regras)."""
+    texto = re.sub(r"[R$\s]", "", str(texto).strip())
+    if "," in texto or texto.count(".") > 1:
+        texto = texto.replace(".", "").replace(",", ".")
+    return texto
+
+
+def _arredondar_centavos(valores: np.ndarray) -> np.ndarray:
+    """Arredonda para o inteiro mais próximo, com meio centavo para longe do zero (como no caixa)."""
+    valores = np.round(np.asarray(valores, dtype="float64"), _CASAS_ARREDONDAMENTO)
+    valores = np.where(np.isfinite(valores), valores, 0.0)
+    return (np.sign(valores) * np.floor(np.abs(valores) + 0.5)).astype("int64")
+
+
+def para_centavos(valores) -> pd.Series | np.ndarray:
+    """
+    Valores em reais (números ou texto, inclusive "1.234,56") -> centavos int64. Inválidos/vazios viram 0.
+    Series entra, Series sai (mesmo índice); lista/array devolvem array.
+    """
+    serie = valores if isinstance(valores, pd.Series) else pd.Series(np.asarray(valores, dtype=object))
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        reais = serie.to_numpy(dtype="float64", na_value=np.nan)
+    else:
+        reais = pd.to_numeric(normalizar_texto_numero(serie), errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    centavos = _arredondar_centavos(reais * CENTAVOS_POR_REAL)
+    if isinstance(valores, pd.Series):
+        return pd.Series(centavos, index=valores.index, name=valores.name)
+    return centavos
+
+
+def centavos(valor) -> int:
+    """Um valor em reais (número ou texto) -> centavos. Inválido/vazio vira 0."""
+    if isinstance(valor, (int, np.integer)) and not isinstance(valor, (bool, np.bool_)):
+        return int(valor) * CENTAVOS_POR_REAL
+    if isinstance(valor, str):
+        try:
+            valor = float(normalizar_numero(valor))
+        except ValueError:
+            return 0
+    try:
+        return int(_arredondar_centavos(float(valor) * CENTAVOS_POR_REAL))
+    except (TypeError, ValueError):
+        return 0
+
+
+def para_reais(valor_centavos):
+    """Centavos -> reais (float com no máximo 2 casas; Series/array vetorizado)."""
+    if isinstance(valor_centavos, pd.Series):
+        return valor_centavos.astype("int64") / CENTAVOS_POR_REAL
+    if isinstance(valor_centavos, np.ndarray):
+        return valor_centavos.astype("int64") / CENTAVOS_POR_REAL
+    return int(valor_centavos) / CENTAVOS_POR_REAL
+
+
+def arredondar_reais(valores):
+    """Reais -> reais exatos em centavos (substitui o round(x, 2) espalhado pelo código)."""
+    if isinstance(valores, (pd.Series, np.ndarray, list)):
+        return para_reais(para_centavos(valores))
+    return para_reais(centavos(valores))
+
+
+# =================================================================================
+# ➕ Aritmética em centavos
+# =================================================================================
+def somar(valores) -> int:
+    """Soma exata (centavos) de valores em reais."""
+    return int(np.asarray(para_centavos(valores)).sum())
+
+
+def aplicar_taxa(valor_centavos, taxa):
+    """Centavos × taxa (ex.: 0.03 de cashback, 1.3 de margem), arredondado ao centavo. Aceita arrays/Series."""
+    resultado = _arredondar_centavos(np.asarray(valor_centavos, dtype="float64") * np.asarray(taxa, dtype="float64"))
+    if isinstance(valor_centavos, pd.Series):
+        return pd.Series(resultado, index=valor_centavos.index, name=valor_centavos.name)
+    return int(resultado) if np.ndim(resultado) == 0 else resultado
+
+
+def dividir_em_parcelas(total_centavos: int, parcelas: int) -> list[int]:
+    """Divide um total em parcelas que somam exatamente o total (os centavos que sobram vão nas primeiras)."""
+    parcelas = max(int(parcelas), 1)
+    base, resto = divmod(abs(int(total_centavos)), parcelas)
+    sinal = -1 if total_centavos < 0 else 1
+    return [sinal * (base + (1 if i < resto else 0)) for i in range(parcelas)]
+
+
+# =================================================================================
+# 🖨️ Formatação (R$ 1.234,56)
+# =================================================================================
+def formatar_brl(valor_centavos: int) -> str:
+    """Centavos -> 'R$ 1.234,56' (negativos como '-R$ 1.234,56')."""
+    valor_centavos = int(valor_centavos)
+    reais, cent = divmod(abs(valor_centavos), CENTAVOS_POR_REAL)
+    texto = f"R$ {reais:,}".replace(",", ".") + f",{cent:02d}"
+    return f"-{texto}" if valor_centavos < 0 else texto
+
+
+def formatar_brl_serie(valores_centavos: pd.Series) -> pd.Series:
+    """Versão vetorizada de formatar_brl para uma coluna inteira."""
+    valores = valores_centavos.astype("int64")
+    absolutos = valores.abs()
+    reais = (absolutos // CENTAVOS_POR_REAL).map("{:,}".format).str.replace(",", ".", regex=False)
+    cent = (absolutos % CENTAVOS_POR_REAL).astype(str).str.zfill(2)
+    sinal = pd.Series(np.where(valores < 0, "-", ""), index=valores.index)
+    return sinal + "R$ " + reais + "," + cent
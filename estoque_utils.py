@@ -0,0 +1,560 @@
+# estoque_utils.py
+import ast
+import json
+import re
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import requests
+import streamlit as st
+
+from cache_utils import depende_de, invalidar_arquivos
+from constants_and_css import ARQ_MOVIMENTOS_ESTOQUE, ARQ_SNAPSHOTS_ESTOQUE
+from gravacao_utils import enfileirar_commit
+from ledger_utils import arquivo_mensal, baixar_particoes
+from schema_utils import ESQUEMA_MOVIMENTOS_ESTOQUE, ESQUEMA_SNAPSHOTS_ESTOQUE, FORMATO_DATA, aplicar_esquema
+from storage_utils import get_storage, ler_csv_texto
+
+# Chave do st.session_state com o índice de produtos (acompanha st.session_state.produtos)
+CHAVE_INDICE_PRODUTOS = "indice_produtos"
+
+# Livro de movimentos: um snapshot do estoque de todos os produtos a cada N movimentos gravados
+INTERVALO_SNAPSHOT_ESTOQUE = 500
+COMMIT_MOVIMENTOS_ESTOQUE = "Movimentos de estoque"
+
+
+def _chave(valor) -> str:
+    """ID/código de barras como texto sem espaços ('12', 12 e ' 12 ' são a mesma chave). Vazio/NaN vira ''."""
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+        return ""
+    return str(valor).strip()
+
+
+# =================================================================================
+# 🗂️ Índice de produtos (ID -> linha, código de barras -> ID, PaiID -> variações)
+# =================================================================================
+class IndiceProdutos:
+    """
+    Mapas em memória sobre o DataFrame de produtos da sessão: localizar um produto pelo ID ou pelo
+    código de barras vira uma consulta de dicionário, em vez de varrer o DataFrame a cada item da venda.
+    Guarda o rótulo (índice pandas) da linha, não os valores: débito/crédito de estoque no próprio
+    DataFrame não invalida nada. Código de barras repetido aponta para o primeiro produto (como o filtro antigo).
+    """
+
+    def __init__(self):
+        self._linhas = {}      # ID -> rótulo da linha no DataFrame
+        self._por_codigo = {}  # CodigoBarras -> ID
+        self._filhos = {}      # PaiID -> [IDs das variações]
+        self._atributos = {}   # ID -> (CodigoBarras, PaiID) indexados, para desfazer na edição/exclusão
+        self._df = None        # DataFrame ao qual o índice corresponde
+        self._tamanho = 0
+
+    # ---------- construção ----------
+    @classmethod
+    def construir(cls, produtos_df: pd.DataFrame) -> "IndiceProdutos":
+        indice = cls()
+        if produtos_df is not None and not produtos_df.empty:
+            indice.adicionar(produtos_df, produtos_df.index)
+        indice.vincular(produtos_df)
+        return indice
+
+    def vincular(self, produtos_df: pd.DataFrame):
+        self._df = produtos_df
+        self._tamanho = len(produtos_df) if produtos_df is not None else 0
+
+    def corresponde(self, produtos_df: pd.DataFrame) -> bool:
+        """O índice vale para este DataFrame (mesmo objeto e mesmo número de linhas)?"""
+        return self._df is produtos_df and produtos_df is not None and len(produtos_df) == self._tamanho
+
+    # ---------- atualização incremental ----------
+    def _registrar(self, id_produto: str, rotulo, codigo: str, pai: str):
+        if not id_produto or id_produto in self._linhas:
+            return
+        self._linhas[id_produto] = rotulo
+        self._atributos[id_produto] = (codigo, pai)
+        if codigo:
+            self._por_codigo.setdefault(codigo, id_produto)
+        if pai:
+            self._filhos.setdefault(pai, []).append(id_produto)
+
+    def _desregistrar(self, id_produto: str):
+        rotulo = self._linhas.pop(id_produto, None)
+        codigo, pai = self._atributos.pop(id_produto, ("", ""))
+        if pai and id_produto in self._filhos.get(pai, []):
+            self._filhos[pai].remove(id_produto)
+            if not self._filhos[pai]:
+                del self._filhos[pai]
+        if codigo and self._por_codigo.get(codigo) == id_produto:
+            del self._por_codigo[codigo]
+            # Código repetido: passa para o próximo produto com o mesmo código (o de menor rótulo)
+            outros = [i for i, (c, _) in self._atributos.items() if c == codigo]
+            if outros:
+                self._por_codigo[codigo] = min(outros, key=lambda i: self._linhas[i])
+        return rotulo
+
+    def adicionar(self, produtos_df: pd.DataFrame, rotulos):
+        """Indexa as linhas `rotulos` do DataFrame (ex.: as novas, no fim, de um pd.concat)."""
+        linhas = produtos_df.loc[rotulos]
+        pais = linhas["PaiID"] if "PaiID" in linhas.columns else pd.Series("", index=linhas.index)
+        codigos = linhas["CodigoBarras"] if "CodigoBarras" in linhas.columns else pd.Series("", index=linhas.index)
+        for rotulo, id_produto, codigo, pai in zip(linhas.index, linhas["ID"], codigos, pais):
+            self._registrar(_chave(id_produto), rotulo, _chave(codigo), _chave(pai))
+
+    def atualizar(self, produtos_df: pd.DataFrame, ids):
+        """Reindexa produtos editados (código de barras ou PaiID podem ter mudado; o rótulo não muda)."""
+        for id_produto in map(_chave, ids):
+            rotulo = self._desregistrar(id_produto)
+            if rotulo is not None:
+                self.adicionar(produtos_df, [rotulo])
+
+    def remover(self, ids) -> int:
+        """Tira os produtos do índice. Retorna quantos estavam indexados."""
+        return sum(self._desregistrar(id_produto) is not None for id_produto in map(_chave, ids))
+
+    # ---------- consulta ----------
+    def rotulo(self, id_produto):
+        """Rótulo da linha do produto no DataFrame, ou None se o ID não existir."""
+        return self._linhas.get(_chave(id_produto))
+
+    def id_por_codigo(self, codigo_barras) -> str | None:
+        return self._por_codigo.get(_chave(codigo_barras))
+
+    def filhos(self, pai_id) -> list[str]:
+        """IDs das variações de um produto pai (na ordem do DataFrame)."""
+        return list(self._filhos.get(_chave(pai_id), []))
+
+    def __contains__(self, id_produto) -> bool:
+        return _chave(id_produto) in self._linhas
+
+    def __len__(self) -> int:
+        return len(self._linhas)
+
+
+# =================================================================================
+# 🔄 Índice da sessão
+# =================================================================================
+def indice_produtos_sessao(produtos_df: pd.DataFrame | None = None) -> IndiceProdutos:
+    """Índice de st.session_state.produtos; só é reconstruído se a sessão passou a usar outro DataFrame."""
+    if produtos_df is None:
+        produtos_df = st.session_state.get("produtos")
+    indice = st.session_state.get(CHAVE_INDICE_PRODUTOS)
+    if indice is None or not indice.corresponde(produtos_df):
+        indice = IndiceProdutos.construir(produtos_df)
+        st.session_state[CHAVE_INDICE_PRODUTOS] = indice
+    return indice
+
+
+def substituir_produtos_sessao(produtos: pd.DataFrame, editados=(), removidos=()):
+    """
+    Troca st.session_state.produtos pelo DataFrame novo e aplica ao índice só o que mudou:
+    linhas novas no fim (pd.concat), `editados` (IDs alterados com .loc) e `removidos` (IDs filtrados fora).
+    Se o índice não correspondia ao DataFrame anterior, nada é feito: ele será reconstruído na próxima consulta.
+    """
+    anterior = st.session_state.get("produtos")
+    indice = st.session_state.get(CHAVE_INDICE_PRODUTOS)
+    st.session_state.produtos = produtos
+    if indice is None or anterior is None or not indice.corresponde(anterior):
+        return
+    if removidos:
+        # IDs repetidos/variações esquecidas: as contas não fecham e o índice é refeito
+        if indice.remover(removidos) != len(anterior) - len(produtos):
+            st.session_state.pop(CHAVE_INDICE_PRODUTOS, None)
+            return
+    else:
+        # pd.concat(ignore_index=True) só preserva os rótulos antigos se não havia buracos no índice
+        if not produtos.index[:len(anterior)].equals(anterior.index):
+            st.session_state.pop(CHAVE_INDICE_PRODUTOS, None)
+            return
+        if len(produtos) > len(anterior):
+            indice.adicionar(produtos, produtos.index[len(anterior):])
+    if editados:
+        indice.atualizar(produtos, editados)
+    indice.vincular(produtos)
+
+
+# =================================================================================
+# 🌳 Árvore de variações (produto pai -> grade)
+# =================================================================================
+def ler_detalhes_grade(valor) -> dict:
+    """'DetalhesGrade' (JSON ou dict gravado com str()) -> dict. Vazio ou inválido vira {}."""
+    if isinstance(valor, dict):
+        return valor
+    texto = _chave(valor)
+    if not texto or texto in ("{}", "nan"):
+        return {}
+    try:
+        detalhes = json.loads(texto)
+    except ValueError:
+        try:
+            detalhes = ast.literal_eval(texto)
+        except (ValueError, SyntaxError):
+            return {}
+    return detalhes if isinstance(detalhes, dict) else {}
+
+
+def _resumo_detalhes(detalhes: dict) -> str:
+    """Detalhes da grade como na lista de produtos ('**C:** Azul<br>**T:** 38')."""
+    partes = [f"**{str(k).split('/')[0][:1]}:** {v}" for k, v in detalhes.items() if v]
+    return "<br>".join(partes) if partes else "—"
+
+
+@st.cache_data(show_spinner=False)
+def arvore_variacoes(produtos_df: pd.DataFrame) -> dict:
+    """
+    Árvore das grades, montada uma vez por versão do DataFrame de produtos (mesmos rótulos de linha):
+      - "detalhes": DetalhesGrade lido uma vez, uma coluna por atributo (Cor, Tamanho...);
+      - "resumo": detalhes formatados para a lista; "busca": valores da grade em minúsculas (busca por detalhe);
+      - "filhos": {PaiID: [rótulos das variações]}, agrupado uma vez em vez de filtrar o DataFrame por pai;
+      - "estoque_pai": estoque somado das variações de cada pai.
+    """
+    if produtos_df is None or produtos_df.empty:
+        vazio = pd.Series(dtype=object)
+        return {"detalhes": pd.DataFrame(), "resumo": vazio, "busca": vazio, "filhos": {}, "estoque_pai": pd.Series(dtype="int64")}
+
+    # Grades costumam repetir o mesmo texto: cada valor distinto é lido uma vez só
+    brutos = produtos_df["DetalhesGrade"] if "DetalhesGrade" in produtos_df.columns else pd.Series("", index=produtos_df.index)
+    brutos = brutos.astype(object).where(brutos.notna(), "").astype(str)
+    lidos = {texto: ler_detalhes_grade(texto) for texto in brutos.unique()}
+    por_produto = brutos.map(lidos)
+
+    detalhes = pd.DataFrame.from_records(por_produto.tolist(), index=produtos_df.index)
+    resumo = brutos.map({texto: _resumo_detalhes(d) for texto, d in lidos.items()})
+    busca = brutos.map({texto: " | ".join(str(v).lower() for v in d.values()) for texto, d in lidos.items()})
+
+    pais = produtos_df["PaiID"].map(_chave) if "PaiID" in produtos_df.columns else pd.Series("", index=produtos_df.index)
+    eh_filho = pais != ""
+    filhos = {pai: list(rotulos) for pai, rotulos in pais[eh_filho].groupby(pais[eh_filho], sort=False).groups.items()}
+    quantidades = pd.to_numeric(produtos_df["Quantidade"], errors="coerce").fillna(0).astype("int64")
+    estoque_pai = quantidades[eh_filho].groupby(pais[eh_filho], sort=False).sum()
+    return {"detalhes": detalhes, "resumo": resumo, "busca": busca, "filhos": filhos, "estoque_pai": estoque_pai}
+
+
+# =================================================================================
+# 📦 Transação de estoque (todos os itens de uma venda/estorno de uma vez)
+# =================================================================================
+def movimentos_de_itens(itens, sinal: int = -1) -> list[tuple[str, int]]:
+    """
+    Itens de venda (DataFrame de itens_venda ou lista de dicts com Produto_ID/Quantidade) -> [(ID, delta)].
+    sinal=-1 debita (venda), sinal=+1 credita (estorno). Itens manuais (sem Produto_ID) ficam de fora.
+    """
+    if itens is None:
+        return []
+    df = itens if isinstance(itens, pd.DataFrame) else pd.DataFrame(list(itens))
+    if df.empty or "Produto_ID" not in df.columns or "Quantidade" not in df.columns:
+        return []
+    ids = df["Produto_ID"].map(_chave)
+    quantidades = pd.to_numeric(df["Quantidade"], errors="coerce").fillna(0).astype(int)
+    validos = (ids != "") & (ids != "None") & (quantidades != 0)
+    return list(zip(ids[validos], (sinal * quantidades[validos]).tolist()))
+
+
+def consolidar_movimentos(movimentos) -> pd.Series:
+    """[(ID, delta), ...] -> delta total por ID (o mesmo produto em várias linhas vira um movimento só)."""
+    if not movimentos:
+        return pd.Series(dtype="int64")
+    df = pd.DataFrame(list(movimentos), columns=["ID", "Delta"])
+    df["ID"] = df["ID"].map(_chave)
+    total = df.groupby("ID", sort=False)["Delta"].sum().astype("int64")
+    return total[(total.index != "") & (total != 0)]
+
+
+def aplicar_movimentos(produtos_df: pd.DataFrame, movimentos) -> tuple[pd.DataFrame | None, pd.DataFrame]:
+    """
+    Aplica de uma vez todos os movimentos [(ID, delta)] sobre uma cópia do DataFrame de produtos.
+    Retorna (produtos_atualizados, faltantes):
+      - faltantes lista os produtos que ficariam com estoque negativo; nesse caso nada é aplicado
+        (produtos_atualizados = None) e a operação inteira deve ser recusada;
+      - IDs que não existem no estoque são ignorados (como no ajuste item a item).
+    O DataFrame original não é alterado: a sessão só troca de DataFrame depois que a gravação der certo.
+    """
+    deltas = consolidar_movimentos(movimentos)
+    colunas_faltantes = ["ID", "Nome", "Quantidade", "Movimento"]
+    if deltas.empty:
+        return produtos_df, pd.DataFrame(columns=colunas_faltantes)
+
+    indice = indice_produtos_sessao(produtos_df)
+    rotulos = [indice.rotulo(id_produto) for id_produto in deltas.index]
+    encontrados = [r is not None for r in rotulos]
+    deltas = deltas[encontrados]
+    rotulos = [r for r in rotulos if r is not None]
+    if not rotulos:
+        return produtos_df, pd.DataFrame(columns=colunas_faltantes)
+
+    atuais = pd.to_numeric(produtos_df.loc[rotulos, "Quantidade"], errors="coerce").fillna(0).astype("int64").to_numpy()
+    novas = atuais + deltas.to_numpy()
+    negativos = novas < 0
+    if negativos.any():
+        linhas = produtos_df.loc[[r for r, neg in zip(rotulos, negativos) if neg]]
+        faltantes = pd.DataFrame({
+            "ID": linhas["ID"].to_numpy(),
+            "Nome": linhas["Nome"].to_numpy() if "Nome" in linhas.columns else "",
+            "Quantidade": atuais[negativos],
+            "Movimento": deltas.to_numpy()[negativos],
+        })
+        return None, faltantes
+
+    atualizados = produtos_df.copy()
+    atualizados.loc[rotulos, "Quantidade"] = novas
+    return atualizados, pd.DataFrame(columns=colunas_faltantes)
+
+
+def mensagem_estoque_insuficiente(faltantes: pd.DataFrame) -> str:
+    itens = "; ".join(
+        f"{linha.Nome or linha.ID}: estoque {linha.Quantidade}, saída {-linha.Movimento}"
+        for linha in faltantes.itertuples(index=False)
+    )
+    return f"❌ Estoque insuficiente — nada foi salvo. {itens}"
+
+
+# =================================================================================
+# 📜 Livro de movimentos de estoque (só acréscimos) e snapshots
+# =================================================================================
+# Cada entrada/saída vira uma linha (compra, venda, ajuste, estorno); nada é regravado no lugar.
+# Estoque atual ou em uma data = último snapshot válido + movimentos gravados depois dele (a cauda).
+# No GitHub o livro é dividido pelo mês de gravação (movimentos_estoque_AAAA_MM.csv): cada salvamento
+# regrava só o arquivo do mês corrente. O arquivo único das versões anteriores continua sendo lido.
+def _tipar_livro(df: pd.DataFrame | None, esquema: dict) -> pd.DataFrame:
+    df = aplicar_esquema(df if df is not None and not df.empty else None, esquema)
+    df["Produto_ID"] = df["Produto_ID"].astype(str).str.strip()
+    # Ordem de gravação (Seq crescente): as consultas usam busca binária sobre ela
+    return df.sort_values("Seq", kind="stable", ignore_index=True)
+
+
+def _ler_livro(arquivo: str, esquema: dict) -> pd.DataFrame:
+    try:
+        df = get_storage().ler(arquivo)
+    except Exception:
+        df = None
+    return _tipar_livro(df, esquema)
+
+
+def _eh_parte_do_livro(nome: str) -> bool:
+    base = ARQ_MOVIMENTOS_ESTOQUE[:-4]
+    return nome == ARQ_MOVIMENTOS_ESTOQUE or re.fullmatch(rf"{re.escape(base)}_\d{{4}}_\d{{2}}\.csv", nome) is not None
+
+
+def _ler_movimentos_github(storage) -> pd.DataFrame | None:
+    """
+    Arquivo antigo + arquivos mensais do livro, baixados em paralelo. Os meses corrente e anterior são tentados
+    mesmo fora da listagem (podem estar só na fila de gravação); falha em arquivo listado é erro.
+    """
+    hoje = pd.Timestamp.today()
+    provaveis = {arquivo_mensal(ARQ_MOVIMENTOS_ESTOQUE, hoje - pd.DateOffset(months=1)),
+                 arquivo_mensal(ARQ_MOVIMENTOS_ESTOQUE, hoje)}
+    try:
+        listados = {nome for nome in storage.listar(ARQ_MOVIMENTOS_ESTOQUE[:-4]) if _eh_parte_do_livro(nome)}
+    except Exception:
+        listados = set()
+        provaveis.add(ARQ_MOVIMENTOS_ESTOQUE)  # Sem listagem: o arquivo antigo também é só provável
+    partes, falhas = baixar_particoes({nome: storage.url_raw(nome) for nome in listados | provaveis}, ler_csv_texto)
+    if set(falhas) & listados:
+        raise RuntimeError(f"Livro de movimentos incompleto: {', '.join(sorted(set(falhas) & listados))}")
+    partes = [df for df in partes.values() if df is not None and not df.empty]
+    return pd.concat(partes, ignore_index=True) if partes else None
+
+
+def _ler_cauda_github(storage, arquivo: str) -> pd.DataFrame | None:
+    """Arquivo mensal do livro a ser regravado; None se ainda não existe (404)."""
+    try:
+        return storage.ler(arquivo)
+    except requests.HTTPError as e:
+        if e.response is not None and e.response.status_code == 404:
+            return None
+        raise
+
+
+@depende_de(ARQ_MOVIMENTOS_ESTOQUE)
+@st.cache_data(show_spinner=False)
+def carregar_movimentos_estoque() -> pd.DataFrame:
+    """Livro de movimentos gravado (GitHub ou banco local); vazio se ainda não existir."""
+    storage = get_storage()
+    if storage.local:
+        return _ler_livro(ARQ_MOVIMENTOS_ESTOQUE, ESQUEMA_MOVIMENTOS_ESTOQUE)
+    try:
+        df = _ler_movimentos_github(storage)
+    except Exception:
+        df = None
+    return _tipar_livro(df, ESQUEMA_MOVIMENTOS_ESTOQUE)
+
+
+@depende_de(ARQ_SNAPSHOTS_ESTOQUE)
+@st.cache_data(show_spinner=False)
+def carregar_snapshots_estoque() -> pd.DataFrame:
+    """Snapshots gravados: Quantidade de cada produto depois do movimento Seq."""
+    return _ler_livro(ARQ_SNAPSHOTS_ESTOQUE, ESQUEMA_SNAPSHOTS_ESTOQUE)
+
+
+def _fim_do_dia(data) -> np.datetime64:
+    return np.datetime64(pd.Timestamp(data).normalize(), "ns")
+
+
+def _snapshot_base(snapshots: pd.DataFrame, data=None) -> tuple[int, pd.Series]:
+    """(Seq coberto, Quantidade por produto) do último snapshot com Data <= data (sem data: o último gravado)."""
+    vazio = pd.Series(dtype="int64")
+    if snapshots is None or snapshots.empty:
+        return 0, vazio
+    fim = len(snapshots)
+    if data is not None:
+        # Seq e Data crescem juntos nos snapshots: busca binária em vez de filtrar o arquivo todo
+        datas = snapshots["Data"].to_numpy(dtype="datetime64[ns]")
+        fim = int(np.searchsorted(datas, _fim_do_dia(data), side="right"))
+        if fim == 0:
+            return 0, vazio
+    seqs = snapshots["Seq"].to_numpy()
+    seq = int(seqs[fim - 1])
+    inicio = int(np.searchsorted(seqs, seq, side="left"))
+    base = snapshots.iloc[inicio:fim]
+    return seq, pd.Series(base["Quantidade"].to_numpy(dtype="int64"), index=base["Produto_ID"].to_numpy())
+
+
+def estoque_em(data=None, movimentos: pd.DataFrame | None = None, snapshots: pd.DataFrame | None = None) -> pd.Series:
+    """
+    Quantidade por Produto_ID no fim do dia `data` (sem data: estoque atual), pelo livro de movimentos.
+    Só lê o snapshot de partida e a cauda de movimentos gravados depois dele: O(snapshot + cauda).
+    Produtos que nunca tiveram movimento não aparecem.
+    """
+    movimentos = carregar_movimentos_estoque() if movimentos is None else movimentos
+    snapshots = carregar_snapshots_estoque() if snapshots is None else snapshots
+    seq, base = _snapshot_base(snapshots, data)
+    inicio = int(np.searchsorted(movimentos["Seq"].to_numpy(), seq, side="right"))
+    cauda = movimentos.iloc[inicio:]
+    if data is not None:
+        cauda = cauda[cauda["Data"] <= pd.Timestamp(data).normalize()]
+    deltas = cauda.groupby("Produto_ID", sort=False)["Delta"].sum()
+    estoque = base.add(deltas, fill_value=0).astype("int64")
+    return estoque[estoque.index != ""]
+
+
+def aplicar_estoque_do_livro(produtos_df: pd.DataFrame) -> pd.DataFrame:
+    """Quantidade vinda do livro para os produtos que já estão nele; os demais ficam como no arquivo de produtos."""
+    if produtos_df is None or produtos_df.empty or "ID" not in produtos_df.columns:
+        return produtos_df
+    try:
+        atual = estoque_em()
+    except Exception:
+        return produtos_df  # Livro ilegível: vale o arquivo de produtos
+    if atual.empty:
+        return produtos_df
+    do_livro = produtos_df["ID"].astype(str).str.strip().map(atual)
+    if do_livro.notna().any():
+        arquivo = pd.to_numeric(produtos_df["Quantidade"], errors="coerce").fillna(0)
+        produtos_df["Quantidade"] = do_livro.fillna(arquivo).astype(int)
+    return produtos_df
+
+
+def linhas_movimento(grupos: dict, data=None, origem="", observacao: str = "", saldo_anterior: dict | None = None) -> pd.DataFrame:
+    """
+    {tipo: [(ID, delta), ...]} -> linhas novas do livro (o Seq é numerado na gravação); deltas zerados ficam de fora.
+    `saldo_anterior` ({ID: quantidade antes do movimento}) abre com um ajuste os produtos que ainda não estão
+    no livro, para que o saldo do livro parta do estoque que o cadastro já tinha.
+    """
+    dia = pd.Timestamp(data if data is not None else date.today()).normalize()
+    registrado = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    origem = _chave(origem)
+    linhas = []
+    for tipo, movimentos in grupos.items():
+        for id_produto, delta in consolidar_movimentos(movimentos).items():
+            linhas.append((id_produto, int(delta), tipo, observacao))
+
+    if saldo_anterior and linhas:
+        conhecidos = estoque_em().index
+        abertura = []
+        for id_produto in dict.fromkeys(linha[0] for linha in linhas):
+            saldo = int(saldo_anterior.get(id_produto, 0) or 0)
+            if saldo and id_produto not in conhecidos:
+                abertura.append((id_produto, saldo, "ajuste", "Saldo de abertura (cadastro de produtos)"))
+        linhas = abertura + linhas
+
+    df = pd.DataFrame(linhas, columns=["Produto_ID", "Delta", "Tipo", "Observacao"])
+    df = df.assign(Seq=0, Data=pd.Series([dia] * len(df), dtype="datetime64[ns]"), Origem=origem, Registrado=registrado)
+    return df[ESQUEMA_MOVIMENTOS_ESTOQUE["colunas"]]
+
+
+def preparar_transacao_estoque(produtos_df: pd.DataFrame, grupos: dict, data=None, origem="") -> tuple[dict | None, pd.DataFrame]:
+    """
+    Valida e aplica em memória os movimentos de uma operação ({tipo: [(ID, delta)]}) e monta as linhas do livro.
+    Retorna ({"produtos": DataFrame atualizado, "movimentos": linhas novas}, faltantes); com estoque insuficiente,
+    (None, faltantes). A gravação fica com o chamador (anexar_movimentos), junto das demais.
+    """
+    todos = [movimento for movimentos in grupos.values() for movimento in movimentos]
+    atualizados, faltantes = aplicar_movimentos(produtos_df, todos)
+    if atualizados is None:
+        return None, faltantes
+    # Só entram no livro produtos que existem no cadastro (como em aplicar_movimentos)
+    indice = indice_produtos_sessao(produtos_df)
+    grupos = {tipo: [m for m in movimentos if m[0] in indice] for tipo, movimentos in grupos.items()}
+    ids = {_chave(m[0]) for movimentos in grupos.values() for m in movimentos}
+    saldo_anterior = {
+        id_produto: pd.to_numeric(produtos_df.at[indice.rotulo(id_produto), "Quantidade"], errors="coerce")
+        for id_produto in ids
+    }
+    saldo_anterior = {k: 0 if pd.isna(v) else int(v) for k, v in saldo_anterior.items()}
+    return {"produtos": atualizados, "movimentos": linhas_movimento(grupos, data, origem, saldo_anterior=saldo_anterior)}, faltantes
+
+
+def _para_gravacao(df: pd.DataFrame) -> pd.DataFrame:
+    return df.assign(Data=df["Data"].dt.strftime(FORMATO_DATA).fillna(""))
+
+
+def _novo_snapshot(livro: pd.DataFrame, snapshots: pd.DataFrame) -> pd.DataFrame:
+    """Estoque de todos os produtos depois do último movimento do livro (datado pelo movimento mais recente)."""
+    seq_anterior, _ = _snapshot_base(snapshots)
+    estoque = estoque_em(movimentos=livro, snapshots=snapshots)
+    inicio = int(np.searchsorted(livro["Seq"].to_numpy(), seq_anterior, side="right"))
+    datas = [livro["Data"].iloc[inicio:].max()]
+    if not snapshots.empty:
+        datas.append(snapshots["Data"].iloc[-1])
+    return pd.DataFrame({
+        "Seq": int(livro["Seq"].iloc[-1]),
+        "Data": pd.Series([max(d for d in datas if pd.notna(d))] * len(estoque), dtype="datetime64[ns]"),
+        "Produto_ID": estoque.index.to_numpy(),
+        "Quantidade": estoque.to_numpy(),
+    })
+
+
+def anexar_movimentos(linhas: pd.DataFrame, commit_message: str = COMMIT_MOVIMENTOS_ESTOQUE, arquivos_commit: dict | None = None) -> pd.DataFrame:
+    """
+    Grava as linhas no fim do livro (Seq a partir do último) e, a cada INTERVALO_SNAPSHOT_ESTOQUE movimentos, um snapshot.
+    - Banco local: INSERT só das linhas novas (dentro de storage.transacao() do chamador, vai junto das outras gravações).
+    - GitHub: o CSV não tem append; só o arquivo do mês corrente (movimentos_estoque_AAAA_MM.csv) é regravado
+      e entra em `arquivos_commit` para ir no mesmo commit do chamador (sem `arquivos_commit`, vira um commit
+      próprio na fila de gravação).
+    Retorna as linhas gravadas, já com Seq.
+    """
+    if linhas is None or linhas.empty:
+        return linhas
+    storage = get_storage()
+    livro = carregar_movimentos_estoque()
+    snapshots = carregar_snapshots_estoque()
+    ultimo = int(livro["Seq"].iloc[-1]) if not livro.empty else 0
+    linhas = linhas.assign(Seq=np.arange(ultimo + 1, ultimo + 1 + len(linhas), dtype="int64"))
+    livro_novo = pd.concat([livro, linhas], ignore_index=True) if not livro.empty else linhas.reset_index(drop=True)
+
+    seq_snapshot, _ = _snapshot_base(snapshots)
+    snapshot = None
+    if int(linhas["Seq"].iloc[-1]) - seq_snapshot >= INTERVALO_SNAPSHOT_ESTOQUE:
+        snapshot = _novo_snapshot(livro_novo, snapshots)
+
+    if storage.local:
+        with storage.transacao():
+            storage.inserir(ARQ_MOVIMENTOS_ESTOQUE, _para_gravacao(linhas), commit_message)
+            if snapshot is not None:
+                storage.inserir(ARQ_SNAPSHOTS_ESTOQUE, _para_gravacao(snapshot), commit_message)
+    else:
+        conteudos = {} if arquivos_commit is None else arquivos_commit
+        arquivo_cauda = arquivo_mensal(ARQ_MOVIMENTOS_ESTOQUE, linhas["Registrado"].iloc[-1])
+        cauda = _ler_cauda_github(storage, arquivo_cauda)
+        cauda = _para_gravacao(linhas) if cauda is None or cauda.empty else pd.concat(
+            [aplicar_esquema(cauda, ESQUEMA_MOVIMENTOS_ESTOQUE, tipar=False), _para_gravacao(linhas)], ignore_index=True
+        )
+        conteudos[arquivo_cauda] = cauda.to_csv(index=False, encoding="utf-8-sig")
+        if snapshot is not None:
+            todos = pd.concat([snapshots, snapshot], ignore_index=True) if not snapshots.empty else snapshot
+            conteudos[ARQ_SNAPSHOTS_ESTOQUE] = _para_gravacao(todos).to_csv(index=False, encoding="utf-8-sig")
+        if arquivos_commit is None:
+            token, repo_owner, repo_name, branch = storage._credenciais()
+            enfileirar_commit(token, repo_owner, repo_name, branch, conteudos, commit_message)
+    invalidar_arquivos(ARQ_MOVIMENTOS_ESTOQUE, ARQ_SNAPSHOTS_ESTOQUE)
+    return linhas
+
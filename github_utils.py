@@ -0,0 +1,29 @@
+# github_utils.py
+from github import InputGitTreeElement
+
+
+# =================================================================================
+# 📦 Commit único com vários arquivos (Git Data API)
+# =================================================================================
+def commit_arquivos(repo, arquivos: dict, commit_message: str, branch: str = "main") -> str:
+    """
+    Grava vários arquivos em UM commit: monta uma árvore sobre a árvore atual do branch,
+    cria o commit e avança a referência. Retorna o SHA do novo commit.
+
+    `arquivos` é um dicionário {caminho_no_repo: conteudo_texto}.
+    Custa 5 chamadas à API, independentemente da quantidade de arquivos.
+    """
+    if not arquivos:
+        return ""
+
+    ref = repo.get_git_ref(f"heads/{branch}")
+    commit_base = repo.get_git_commit(ref.object.sha)
+
+    elementos = [
+        InputGitTreeElement(path=caminho, mode="100644", type="blob", content=conteudo)
+        for caminho, conteudo in arquivos.items()
+    ]
+    arvore = repo.create_git_tree(elementos, base_tree=commit_base.tree)
+    novo_commit = repo.create_git_commit(commit_message, arvore, [commit_base])
+    ref.edit(novo_commit.sha)
+    return novo_commit.sha
@@ -0,0 +1,293 @@
+# gravacao_utils.py
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import streamlit as st
+
+from cache_utils import invalidar_arquivos, registrar_conteudo_local, remover_conteudo_local
+from github_utils import commit_arquivos
+from http_utils import github_repo, get_script_run_ctx
+
+# Jobs ainda não confirmados no GitHub (sobrevivem a reinício do app)
+DIR_SPOOL_GRAVACAO = os.environ.get("FLUXO_SPOOL_DIR", ".spool_gravacao")
+# Jobs descartados após MAX_TENTATIVAS_GRAVACAO falhas seguidas (guardados para reenvio manual)
+DIR_SPOOL_FALHAS = os.path.join(DIR_SPOOL_GRAVACAO, "falhas")
+MAX_TENTATIVAS_GRAVACAO = 8
+# Espera após o primeiro job para juntar salvamentos em sequência no mesmo commit
+JANELA_AGRUPAMENTO = 0.5
+# Nova tentativa após falha: 2s, 4s, 8s... até o teto
+ESPERA_MAXIMA_RETENTATIVA = 300
+# Tempo em que o conteúdo recém-gravado vale mais que o raw.githubusercontent (cache do CDN ~5 min)
+TTL_CONTEUDO_LOCAL = 300
+MAX_TAMANHO_MENSAGEM = 250
+
+# nome -> função(caminhos) chamada quando um lote é descartado (ex.: cópias em memória montadas com ele)
+_ao_descartar = {}
+
+
+def _url_raw(owner: str, repo_name: str, branch: str, caminho: str) -> str:
+    return f"https://raw.githubusercontent.com/{owner}/{repo_name}/{branch}/{caminho}"
+
+
+def _gravar_json_atomico(caminho: str, dados: dict):
+    tmp = f"{caminho}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(dados, f, ensure_ascii=False)
+    os.replace(tmp, caminho)
+
+
+# =================================================================================
+# 📨 Fila de gravação em segundo plano (write-behind)
+# =================================================================================
+class FilaGravacao:
+    """
+    Recebe jobs {caminho: conteudo} e os grava no GitHub numa thread própria.
+    - Cada job vai antes para um arquivo de spool; só é apagado depois do commit.
+    - Jobs pendentes para o mesmo repositório viram UM commit; o mesmo arquivo salvo
+      várias vezes entra só com o conteúdo mais recente.
+    - Falhas são repetidas com espera exponencial; depois de MAX_TENTATIVAS_GRAVACAO seguidas o lote vai
+      para DIR_SPOOL_FALHAS, o conteúdo local dele deixa de valer e o erro fica permanente no status da sessão.
+    """
+
+    def __init__(self, token_padrao: str | None = None):
+        self.token_padrao = token_padrao
+        self._cond = threading.Condition()
+        self._jobs = []          # em ordem de chegada
+        self._tokens = {}        # (owner, repo) -> token (o token nunca vai para o disco)
+        self._status = {}        # sessão -> {"pendentes", "ok", "erro", "descartados", "evento"}
+        self._ids_descartados = set()
+        self._tentativas = 0
+        os.makedirs(DIR_SPOOL_GRAVACAO, exist_ok=True)
+        os.makedirs(DIR_SPOOL_FALHAS, exist_ok=True)
+        self._recuperar_spool()
+        self._thread = threading.Thread(target=self._executar, name="fila-gravacao", daemon=True)
+        self._thread.start()
+
+    # --- Spool ----------------------------------------------------------------------
+    def _recuperar_spool(self):
+        """
+        Recoloca na fila os jobs que não chegaram ao GitHub antes do último encerramento e, como em enfileirar,
+        registra o conteúdo deles como local: até o commit, quem ler (e salvar) parte do que está na fila.
+        """
+        for nome in sorted(os.listdir(DIR_SPOOL_GRAVACAO)):  # ordem de criação: o job mais novo prevalece
+            if not nome.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(DIR_SPOOL_GRAVACAO, nome), encoding="utf-8") as f:
+                    job = json.load(f)
+                job["sessao"] = ""
+                self._jobs.append(job)
+            except Exception:
+                continue
+            for caminho, conteudo in job["arquivos"].items():
+                registrar_conteudo_local(_url_raw(job["owner"], job["repo"], job["branch"], caminho), conteudo)
+
+    def _caminho_spool(self, job: dict) -> str:
+        return os.path.join(DIR_SPOOL_GRAVACAO, f"{job['id']}.json")
+
+    # --- API ------------------------------------------------------------------------
+    def enfileirar(self, token: str, owner: str, repo_name: str, branch: str,
+                   arquivos: dict, commit_message: str) -> str:
+        """Registra o job (spool + memória) e retorna na hora. Retorna o id do job."""
+        ctx = get_script_run_ctx(suppress_warning=True)
+        job = {
+            "id": f"{time.time_ns()}_{uuid.uuid4().hex[:8]}",
+            "owner": owner, "repo": repo_name, "branch": branch,
+            "arquivos": dict(arquivos), "mensagem": commit_message,
+            "criado_em": datetime.now().isoformat(timespec="seconds"),
+            "sessao": ctx.session_id if ctx is not None else "",
+        }
+        _gravar_json_atomico(self._caminho_spool(job), {k: v for k, v in job.items() if k != "sessao"})
+        # Leituras seguintes já enxergam o conteúdo novo, mesmo antes do commit
+        for caminho, conteudo in arquivos.items():
+            registrar_conteudo_local(_url_raw(owner, repo_name, branch, caminho), conteudo)
+        with self._cond:
+            if token:
+                self._tokens[(owner, repo_name)] = token
+            self._jobs.append(job)
+            self._status_sessao(job["sessao"])["pendentes"] += 1
+            self._cond.notify()
+        return job["id"]
+
+    def _status_sessao(self, sessao: str) -> dict:
+        return self._status.setdefault(
+            sessao, {"pendentes": 0, "ok": None, "erro": None, "descartados": [], "evento": 0}
+        )
+
+    def status(self, sessao: str) -> dict:
+        with self._cond:
+            status = dict(self._status_sessao(sessao))
+            status["descartados"] = list(status["descartados"])
+            return status
+
+    def pendentes(self) -> int:
+        with self._cond:
+            return len(self._jobs)
+
+    def situacao(self, job_id: str) -> str:
+        """"pendente" (na fila), "descartado" (foi para DIR_SPOOL_FALHAS) ou "gravado"."""
+        with self._cond:
+            if job_id in self._ids_descartados:
+                return "descartado"
+            if any(j["id"] == job_id for j in self._jobs):
+                return "pendente"
+            return "gravado"
+
+    def aguardar(self, timeout: float = 30) -> bool:
+        """Bloqueia até a fila esvaziar (útil em scripts/encerramento). True se esvaziou."""
+        limite = time.time() + timeout
+        with self._cond:
+            while self._jobs and time.time() < limite:
+                self._cond.wait(min(0.2, max(0.0, limite - time.time())))
+            return not self._jobs
+
+    # --- Thread de gravação ---------------------------------------------------------
+    def _executar(self):
+        while True:
+            with self._cond:
+                while not self._jobs:
+                    self._cond.wait()
+            time.sleep(JANELA_AGRUPAMENTO)
+            with self._cond:
+                lote = list(self._jobs)
+            destino = (lote[0]["owner"], lote[0]["repo"], lote[0]["branch"])
+            lote = [j for j in lote if (j["owner"], j["repo"], j["branch"]) == destino]
+            try:
+                self._gravar_lote(destino, lote)
+            except Exception as e:
+                self._registrar_falha(lote, e)
+                continue
+            self._registrar_sucesso(lote)
+
+    def _gravar_lote(self, destino: tuple, lote: list):
+        owner, repo_name, branch = destino
+        arquivos, mensagens = {}, []
+        for job in lote:  # ordem de chegada: o último conteúdo de cada arquivo prevalece
+            arquivos.update(job["arquivos"])
+            if job["mensagem"] not in mensagens:
+                mensagens.append(job["mensagem"])
+        mensagem = mensagens[0] if len(mensagens) == 1 else f"{len(lote)} salvamentos: " + "; ".join(mensagens)
+        token = self._tokens.get((owner, repo_name)) or self.token_padrao
+        repo = github_repo(token, f"{owner}/{repo_name}")
+        commit_arquivos(repo, arquivos, mensagem[:MAX_TAMANHO_MENSAGEM], branch)
+        for caminho, conteudo in arquivos.items():
+            registrar_conteudo_local(_url_raw(owner, repo_name, branch, caminho), conteudo, ttl=TTL_CONTEUDO_LOCAL)
+
+    def _registrar_sucesso(self, lote: list):
+        ids = {j["id"] for j in lote}
+        for job in lote:
+            try:
+                os.remove(self._caminho_spool(job))
+            except OSError:
+                pass
+        with self._cond:
+            self._jobs = [j for j in self._jobs if j["id"] not in ids]
+            self._tentativas = 0
+            for job in lote:
+                status = self._status_sessao(job["sessao"])
+                status["pendentes"] = max(0, status["pendentes"] - 1)
+                status["ok"] = (datetime.now().isoformat(timespec="seconds"), job["mensagem"])
+                status["erro"] = None
+                status["evento"] += 1
+            self._cond.notify_all()
+
+    def _registrar_falha(self, lote: list, erro: Exception):
+        with self._cond:
+            self._tentativas += 1
+            if self._tentativas >= MAX_TENTATIVAS_GRAVACAO:
+                self._descartar(lote, erro)
+                return
+            espera = min(2 ** self._tentativas, ESPERA_MAXIMA_RETENTATIVA)
+            for sessao in {j["sessao"] for j in lote}:
+                status = self._status_sessao(sessao)
+                status["erro"] = (datetime.now().isoformat(timespec="seconds"), f"{erro} (nova tentativa em {espera}s)")
+                status["evento"] += 1
+        time.sleep(espera)
+
+    def _descartar(self, lote: list, erro: Exception):
+        """
+        Tira o lote da fila (chamar com o lock): os jobs vão para o spool de falhas, as URLs deixam de
+        devolver o conteúdo não gravado e as sessões recebem o erro permanente. A fila segue com os demais.
+        """
+        ids = {j["id"] for j in lote}
+        self._jobs = [j for j in self._jobs if j["id"] not in ids]
+        self._ids_descartados |= ids
+        self._tentativas = 0
+        caminhos = set()
+        for job in lote:
+            try:
+                os.replace(self._caminho_spool(job), os.path.join(DIR_SPOOL_FALHAS, f"{job['id']}.json"))
+            except OSError:
+                pass
+            for caminho in job["arquivos"]:
+                remover_conteudo_local(_url_raw(job["owner"], job["repo"], job["branch"], caminho))
+                caminhos.add(caminho)
+            status = self._status_sessao(job["sessao"])
+            status["pendentes"] = max(0, status["pendentes"] - 1)
+            status["erro"] = (datetime.now().isoformat(timespec="seconds"), f"{erro} (gravação descartada)")
+            status["descartados"].append((datetime.now().isoformat(timespec="seconds"), job["mensagem"], str(erro)))
+            status["evento"] += 1
+        # Caches montados com o conteúdo descartado voltam a ler o que de fato está no GitHub
+        invalidar_arquivos(*caminhos)
+        for funcao in list(_ao_descartar.values()):
+            try:
+                funcao(caminhos)
+            except Exception:
+                pass
+        self._cond.notify_all()
+
+
+@st.cache_resource(show_spinner=False)
+def get_fila_gravacao() -> FilaGravacao:
+    """Fila única do processo (a thread de gravação é compartilhada entre as sessões)."""
+    from constants_and_css import GITHUB_TOKEN
+    return FilaGravacao(token_padrao=GITHUB_TOKEN)
+
+
+def enfileirar_commit(token: str, owner: str, repo_name: str, branch: str, arquivos: dict, commit_message: str) -> str:
+    """Agenda a gravação de {caminho: conteudo} no GitHub e retorna imediatamente."""
+    return get_fila_gravacao().enfileirar(token, owner, repo_name, branch, arquivos, commit_message)
+
+
+def situacao_gravacao(job_id: str) -> str:
+    """Situação de um job devolvido por enfileirar_commit: "pendente", "gravado" ou "descartado"."""
+    return get_fila_gravacao().situacao(job_id)
+
+
+def ao_descartar_gravacao(funcao):
+    """
+    Registra `funcao(caminhos)` para ser chamada (na thread de gravação) quando um lote com esses arquivos
+    for descartado. Usar como decorador em quem guarda cópias em memória do que foi enfileirado.
+    """
+    _ao_descartar[f"{funcao.__module__}.{funcao.__qualname__}"] = funcao
+    return funcao
+
+
+# =================================================================================
+# 🔔 Status das gravações na interface
+# =================================================================================
+CHAVE_EVENTO_GRAVACAO = "evento_gravacao_visto"
+
+
+def exibir_status_gravacao():
+    """Mostra pendências e avisa (toast) sobre gravações concluídas ou com erro desde a última execução."""
+    ctx = get_script_run_ctx(suppress_warning=True)
+    status = get_fila_gravacao().status(ctx.session_id if ctx is not None else "")
+    if status["evento"] != st.session_state.get(CHAVE_EVENTO_GRAVACAO, 0):
+        st.session_state[CHAVE_EVENTO_GRAVACAO] = status["evento"]
+        if status["erro"]:
+            st.toast(f"⚠️ Falha ao gravar no GitHub: {status['erro'][1]}")
+        elif status["ok"]:
+            st.toast(f"✅ Gravado no GitHub: {status['ok'][1]}")
+    if status["pendentes"]:
+        st.caption(f"⏳ {status['pendentes']} gravação(ões) aguardando envio ao GitHub.")
+    if status["descartados"]:
+        quando, mensagem, erro = status["descartados"][-1]
+        st.error(
+            f"❌ {len(status['descartados'])} gravação(ões) NÃO chegaram ao GitHub após {MAX_TENTATIVAS_GRAVACAO} "
+            f"tentativas e foram descartadas (cópia em {DIR_SPOOL_FALHAS}). Última: \"{mensagem}\" em {quando} — {erro}"
+        )
@@ -0,0 +1,199 @@
+# http_utils.py
+import threading
+import time
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:  # Versões antigas do Streamlit
+    def get_script_run_ctx(suppress_warning=False): return None
+    def add_script_run_ctx(thread=None, ctx=None): return thread
+
+# Conexões keep-alive mantidas por host (downloads paralelos usam até MAX_DOWNLOADS_PARALELOS)
+MAX_CONEXOES_POR_HOST = 16
+# Novas tentativas em falha de rede / 429 / 5xx, com espera exponencial: 0,5s, 1s, 2s...
+TENTATIVAS_HTTP = 3
+BACKOFF_HTTP = 0.5
+STATUS_REPETIR = (429, 500, 502, 503, 504)
+# API do GitHub: abaixo desta reserva de requisições, espera o reset do rate limit (até o teto abaixo)
+RESERVA_RATE_LIMIT = 50
+ESPERA_MAXIMA_RATE_LIMIT = 60
+# Contadores guardados só das execuções mais recentes (uma entrada por sessão; as mais antigas saem)
+MAX_CONTAGENS = 64
+# Métodos do Requester do PyGithub que efetivamente disparam uma requisição
+_METODOS_REQUESTER = ("requestJson", "requestMultipart", "requestBlob", "requestMemoryBlobAndCheck")
+
+
+# =================================================================================
+# 🔌 Pool de clientes HTTP / GitHub (um por processo)
+# =================================================================================
+def _chave_render() -> str:
+    """Sessão do Streamlit dona da thread atual ('' fora de uma execução de página)."""
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else ""
+
+
+class PoolClientes:
+    """
+    Sessão `requests` com conexões keep-alive e retry/backoff, clientes PyGithub reaproveitados
+    (um por token, repositórios em cache) e contadores de requisições por execução de página.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sessao = requests.Session()
+        retry = Retry(
+            total=TENTATIVAS_HTTP, backoff_factor=BACKOFF_HTTP, status_forcelist=STATUS_REPETIR,
+            allowed_methods=frozenset({"GET", "HEAD"}), respect_retry_after_header=True, raise_on_status=False,
+        )
+        adaptador = HTTPAdapter(pool_connections=8, pool_maxsize=MAX_CONEXOES_POR_HOST, max_retries=retry)
+        self.sessao.mount("https://", adaptador)
+        self.sessao.mount("http://", adaptador)
+        self._githubs = {}   # token -> Github
+        self._repos = {}     # (token, "dono/repo") -> Repository
+        self._contagens = {}  # chave_render -> {"http": n, "github_api": n, "repo_reutilizado": n} (só a execução atual)
+
+    # --- Contadores -----------------------------------------------------------------
+    def _nova_contagem(self, chave: str) -> dict:
+        """Zera a contagem da sessão (chamar com o lock); sessões além de MAX_CONTAGENS saem, da mais antiga."""
+        self._contagens.pop(chave, None)
+        self._contagens[chave] = contagem = {"http": 0, "github_api": 0, "repo_reutilizado": 0}
+        while len(self._contagens) > MAX_CONTAGENS:
+            del self._contagens[next(iter(self._contagens))]
+        return contagem
+
+    def _contar(self, campo: str):
+        chave = _chave_render()
+        with self._lock:
+            contagem = self._contagens.get(chave) or self._nova_contagem(chave)
+            contagem[campo] += 1
+
+    def iniciar_contagem(self):
+        with self._lock:
+            self._nova_contagem(_chave_render())
+
+    def contagem(self) -> dict:
+        with self._lock:
+            return dict(self._contagens.get(_chave_render(), {"http": 0, "github_api": 0, "repo_reutilizado": 0}))
+
+    # --- HTTP -----------------------------------------------------------------------
+    def get(self, url: str, **kwargs) -> requests.Response:
+        self._contar("http")
+        return self.sessao.get(url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        self._contar("http")
+        return self.sessao.post(url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        self._contar("http")
+        return self.sessao.put(url, **kwargs)
+
+    # --- GitHub ---------------------------------------------------------------------
+    def _aguardar_rate_limit(self, requester):
+        """Se a cota da API está quase no fim (cabeçalhos da última resposta), espera o reset."""
+        restante, limite = requester.rate_limiting
+        if limite < 0 or restante > RESERVA_RATE_LIMIT:
+            return
+        espera = requester.rate_limiting_resettime - time.time()
+        if espera > 0:
+            time.sleep(min(espera, ESPERA_MAXIMA_RATE_LIMIT))
+
+    def _instrumentar(self, requester):
+        for nome in _METODOS_REQUESTER:
+            original = getattr(requester, nome, None)
+            if original is None:
+                continue
+
+            def contado(*args, _original=original, **kwargs):
+                self._aguardar_rate_limit(requester)
+                self._contar("github_api")
+                return _original(*args, **kwargs)
+
+            setattr(requester, nome, contado)
+
+    def github(self, token: str):
+        from github import Auth, Github
+        from github.GithubRetry import GithubRetry
+
+        with self._lock:
+            cliente = self._githubs.get(token)
+            if cliente is None:
+                cliente = Github(
+                    auth=Auth.Token(token) if token else None,
+                    # A espera pelo reset do rate limit fica em _aguardar_rate_limit (GithubRetry do
+                    # PyGithub 2.3 repassa kwargs ao Retry do urllib3 e não aceita max_rate_limit_wait)
+                    retry=GithubRetry(total=TENTATIVAS_HTTP, backoff_factor=BACKOFF_HTTP),
+                    pool_size=MAX_CONEXOES_POR_HOST,
+                )
+                self._instrumentar(cliente.requester)
+                self._githubs[token] = cliente
+        return cliente
+
+    def repo(self, token: str, nome_completo: str):
+        """Repository reaproveitado entre salvamentos (evita o GET /repos a cada gravação)."""
+        chave = (token, nome_completo)
+        with self._lock:
+            repositorio = self._repos.get(chave)
+        if repositorio is not None:
+            self._contar("repo_reutilizado")
+            return repositorio
+        repositorio = self.github(token).get_repo(nome_completo)
+        with self._lock:
+            self._repos[chave] = repositorio
+        return repositorio
+
+
+@st.cache_resource(show_spinner=False)
+def get_pool_clientes() -> PoolClientes:
+    """Pool de clientes compartilhado por todas as sessões do processo."""
+    return PoolClientes()
+
+
+def http_get(url: str, **kwargs) -> requests.Response:
+    """requests.get pela sessão compartilhada (keep-alive + retry)."""
+    return get_pool_clientes().get(url, **kwargs)
+
+
+def http_post(url: str, **kwargs) -> requests.Response:
+    return get_pool_clientes().post(url, **kwargs)
+
+
+def http_put(url: str, **kwargs) -> requests.Response:
+    return get_pool_clientes().put(url, **kwargs)
+
+
+def github_repo(token: str, nome_completo: str):
+    """Repositório do GitHub pelo cliente compartilhado."""
+    return get_pool_clientes().repo(token, nome_completo)
+
+
+# =================================================================================
+# 📈 Requisições por execução de página
+# =================================================================================
+def iniciar_contagem_render():
+    """Zera os contadores da sessão atual (chamar no início de cada execução do app)."""
+    get_pool_clientes().iniciar_contagem()
+
+
+def contagem_render() -> dict:
+    """Requisições feitas pela sessão atual desde iniciar_contagem_render()."""
+    return get_pool_clientes().contagem()
+
+
+def herdar_contexto_render():
+    """
+    Inicializador para ThreadPoolExecutor: as threads de trabalho passam a contar
+    as requisições na sessão que as criou.
+    """
+    ctx = get_script_run_ctx(suppress_warning=True)
+
+    def _inicializar():
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+
+    return _inicializar
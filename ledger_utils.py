@@ -0,0 +1,616 @@
+# ledger_utils.py
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from io import StringIO
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from cache_utils import buscar_csv_com_cache, sha_blob_git
+from dinheiro_utils import centavos, para_centavos, para_reais, somar
+from gravacao_utils import ao_descartar_gravacao, situacao_gravacao
+from http_utils import herdar_contexto_render
+
+# Chave do st.session_state com os arquivos mensais alterados desde o último salvamento
+CHAVE_PARTICOES_ALTERADAS = "particoes_alteradas_livro_caixa"
+# Meses já enviados à fila de gravação, por job, até o commit ser confirmado ({job_id: {partições}})
+CHAVE_PARTICOES_ENVIADAS = "particoes_enviadas_livro_caixa"
+# Downloads simultâneos ao carregar os meses (limite para não estourar conexões/rate limit)
+MAX_DOWNLOADS_PARALELOS = 8
+TIMEOUT_DOWNLOAD_PARTICAO = 15
+# Manifesto das partições mensais (gravado no mesmo commit dos CSVs)
+ARQ_MANIFESTO = "livro_caixa_manifest.json"
+# Agregados loja × dia × tipo × categoria do relatório comparativo (fora do padrão livro_caixa_*.csv de propósito)
+ARQ_ROLLUP = "rollup_livro_caixa.csv"
+
+
+# =================================================================================
+# 🗂️ Partições mensais do Livro Caixa (livro_caixa_AAAA_MM.csv)
+# =================================================================================
+def arquivo_mensal(arquivo: str, data) -> str | None:
+    """'itens_venda.csv' + data (date, datetime ou 'YYYY-MM-DD') -> 'itens_venda_AAAA_MM.csv'; None se a data for inválida."""
+    data_dt = pd.to_datetime(data, errors='coerce')
+    if pd.isna(data_dt):
+        return None
+    base, extensao = arquivo.rsplit(".", 1)
+    return f"{base}_{data_dt.year}_{data_dt.month:02d}.{extensao}"
+
+
+def nome_particao(data) -> str | None:
+    """Retorna o arquivo mensal de uma data (date, datetime ou 'YYYY-MM-DD'), ou None se inválida."""
+    return arquivo_mensal("livro_caixa.csv", data)
+
+
+def marcar_particoes_alteradas(*datas):
+    """Registra na sessão os meses tocados por inclusão, edição, exclusão ou quitação."""
+    alteradas = st.session_state.setdefault(CHAVE_PARTICOES_ALTERADAS, set())
+    for data in datas:
+        particao = nome_particao(data)
+        if particao:
+            alteradas.add(particao)
+
+
+def _conciliar_enviadas():
+    """Esquece os jobs já gravados; os meses de um job descartado voltam a ficar marcados como alterados."""
+    enviadas = st.session_state.get(CHAVE_PARTICOES_ENVIADAS)
+    if not enviadas:
+        return
+    for job_id, particoes in list(enviadas.items()):
+        situacao = situacao_gravacao(job_id)
+        if situacao == "pendente":
+            continue
+        if situacao == "descartado":
+            st.session_state.setdefault(CHAVE_PARTICOES_ALTERADAS, set()).update(particoes)
+        del enviadas[job_id]
+
+
+def particoes_alteradas() -> set:
+    """Cópia do conjunto de meses pendentes de gravação."""
+    _conciliar_enviadas()
+    return set(st.session_state.get(CHAVE_PARTICOES_ALTERADAS, set()))
+
+
+def limpar_particoes_alteradas(particoes=None, job_id: str | None = None):
+    """
+    Remove da sessão os meses já gravados (todos, se `particoes` for None).
+    Com `job_id` (gravação ainda na fila), os meses voltam a ser marcados se a fila descartar o job.
+    """
+    if job_id and particoes:
+        st.session_state.setdefault(CHAVE_PARTICOES_ENVIADAS, {})[job_id] = set(particoes)
+    if particoes is None:
+        st.session_state[CHAVE_PARTICOES_ALTERADAS] = set()
+    else:
+        st.session_state[CHAVE_PARTICOES_ALTERADAS] = particoes_alteradas() - set(particoes)
+
+
+# =================================================================================
+# ⚡ Download paralelo das partições
+# =================================================================================
+def baixar_particoes(urls: dict, parser, max_workers: int = MAX_DOWNLOADS_PARALELOS,
+                     timeout: int = TIMEOUT_DOWNLOAD_PARTICAO, shas: dict | None = None) -> tuple[dict, dict]:
+    """
+    Baixa vários arquivos mensais ao mesmo tempo ({nome_arquivo: url}).
+    Com `shas` ({nome: SHA do blob}, do manifesto ou da listagem) os meses inalterados vêm do snapshot Parquet, sem requisição.
+    Retorna ({nome: DataFrame}, {nome: mensagem_de_erro}) — ambos ordenados pelo nome,
+    que para livro_caixa_AAAA_MM.csv é a ordem cronológica. Uma falha não derruba as demais.
+    """
+    if not urls:
+        return {}, {}
+    resultados, falhas = {}, {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(urls))),
+                            initializer=herdar_contexto_render()) as executor:
+        futuros = {
+            executor.submit(buscar_csv_com_cache, url, parser, timeout, (shas or {}).get(nome)): nome
+            for nome, url in urls.items()
+        }
+        for futuro in as_completed(futuros):
+            nome = futuros[futuro]
+            try:
+                resultados[nome] = futuro.result()
+            except Exception as e:
+                falhas[nome] = str(e)
+    return dict(sorted(resultados.items())), dict(sorted(falhas.items()))
+
+
+# =================================================================================
+# 📒 Manifesto das partições (livro_caixa_manifest.json)
+# =================================================================================
+# Formato:
+# {"versao": 1, "atualizado_em": "...", "particoes": {
+#     "livro_caixa_2025_10.csv": {"linhas": 42, "data_min": "2025-10-01", "data_max": "2025-10-31",
+#                                 "hash": "<md5 do CSV>", "sha": "<SHA do blob no git>",
+#                                 "derivados": ["itens_venda.csv"]}}}
+# "derivados": arquivos calculados do Livro Caixa que já têm a versão mensal deste mês (itens_venda_2025_10.csv).
+
+_manifesto_memoria = {"dados": None}  # Último manifesto gravado/montado neste processo
+
+
+def entrada_manifesto(df_mes: pd.DataFrame, csv_texto: str | None = None, sha: str | None = None) -> dict:
+    """Metadados de uma partição: linhas, intervalo de datas, hash do conteúdo e SHA do blob."""
+    datas = pd.to_datetime(df_mes["Data"], errors="coerce").dropna() if "Data" in df_mes.columns else pd.Series(dtype="datetime64[ns]")
+    return {
+        "linhas": int(len(df_mes)),
+        "data_min": datas.min().strftime("%Y-%m-%d") if not datas.empty else None,
+        "data_max": datas.max().strftime("%Y-%m-%d") if not datas.empty else None,
+        "hash": hashlib.md5(csv_texto.encode("utf-8")).hexdigest() if csv_texto is not None else "",
+        "sha": sha_blob_git(csv_texto) if csv_texto is not None else (sha or ""),
+    }
+
+
+def novo_manifesto(particoes: dict | None = None) -> dict:
+    return {"versao": 1, "atualizado_em": datetime.now().isoformat(timespec="seconds"), "particoes": dict(particoes or {})}
+
+
+def atualizar_manifesto(manifesto: dict | None, arquivos_csv: dict, dfs_mes: dict, derivados=()) -> dict:
+    """
+    Devolve um novo manifesto com as entradas dos arquivos regravados ({nome: csv_texto}).
+    `derivados`: arquivos cuja versão mensal vai no mesmo commit desses meses (ex.: ARQ_ITENS_VENDA).
+    """
+    atualizado = novo_manifesto((manifesto or {}).get("particoes"))
+    for nome, csv_texto in arquivos_csv.items():
+        df_mes = dfs_mes.get(nome, pd.DataFrame(columns=["Data"]))
+        atualizado["particoes"][nome] = entrada_manifesto(df_mes, csv_texto)
+        if derivados:
+            atualizado["particoes"][nome]["derivados"] = sorted(derivados)
+    atualizado["particoes"] = dict(sorted(atualizado["particoes"].items()))
+    return atualizado
+
+
+def manifesto_da_listagem(shas: dict, dfs_mes: dict) -> dict:
+    """
+    Monta o manifesto inicial a partir de uma listagem do repositório ({nome: sha}) e dos dados já em memória.
+    Arquivos sem dados em memória (ex.: download falhou) ficam com linhas=None: desconhecido, não vazio.
+    """
+    particoes = {}
+    for nome, sha in sorted(shas.items()):
+        if nome in dfs_mes:
+            particoes[nome] = entrada_manifesto(dfs_mes[nome], sha=sha)
+        else:
+            particoes[nome] = {"linhas": None, "data_min": None, "data_max": None, "hash": "", "sha": sha}
+    return novo_manifesto(particoes)
+
+
+def registrar_manifesto(manifesto: dict | None):
+    """Guarda o manifesto em memória: vale mais que a cópia do raw.githubusercontent (que demora a atualizar)."""
+    _manifesto_memoria["dados"] = manifesto
+
+
+def manifesto_em_memoria() -> dict | None:
+    return _manifesto_memoria["dados"]
+
+
+@ao_descartar_gravacao
+def _esquecer_gravacao_descartada(caminhos):
+    """Lote com o manifesto descartado: manifesto e rollup em memória descrevem meses que não chegaram ao GitHub."""
+    if ARQ_MANIFESTO in caminhos:
+        registrar_manifesto(None)
+        registrar_rollup(None)
+
+
+def _ler_manifesto_json(texto: str) -> dict:
+    return json.loads(texto)
+
+
+def buscar_manifesto(url: str) -> dict | None:
+    """Manifesto mais recente entre a memória do processo e o arquivo remoto; None se não existir."""
+    remoto = None
+    try:
+        remoto = buscar_csv_com_cache(url, _ler_manifesto_json, timeout=TIMEOUT_DOWNLOAD_PARTICAO)
+    except Exception:
+        pass
+    local = manifesto_em_memoria()
+    candidatos = [m for m in (remoto, local) if isinstance(m, dict) and "particoes" in m]
+    if not candidatos:
+        return None
+    return max(candidatos, key=lambda m: m.get("atualizado_em", ""))
+
+
+def intervalo_particao(nome: str, info: dict | None = None) -> tuple[pd.Timestamp, pd.Timestamp] | None:
+    """Intervalo de datas de uma partição: data_min/data_max do manifesto ou, na falta, o mês do nome do arquivo."""
+    info = info or {}
+    if info.get("data_min") and info.get("data_max"):
+        return pd.Timestamp(info["data_min"]), pd.Timestamp(info["data_max"])
+    try:
+        _, _, ano, mes = nome[:-4].split("_")
+        inicio = pd.Timestamp(year=int(ano), month=int(mes), day=1)
+    except (ValueError, TypeError):
+        return None
+    return inicio, inicio + pd.offsets.MonthEnd(0)
+
+
+def manifesto_para_json(manifesto: dict) -> str:
+    return json.dumps(manifesto, ensure_ascii=False, indent=2)
+
+
+# =================================================================================
+# 🧩 Arquivos derivados do Livro Caixa, também por mês (itens_venda_AAAA_MM.csv...)
+# =================================================================================
+def _mes_do_arquivo(nome: str) -> str:
+    """'itens_venda_2025_10.csv' -> '2025-10' (mesmo formato do início da coluna de data)."""
+    return nome[-11:-4].replace("_", "-")
+
+
+def arquivo_da_particao(arquivo: str, particao: str) -> str | None:
+    """Versão mensal de `arquivo` para o mês da partição ('itens_venda.csv' + 'livro_caixa_2025_10.csv' -> 'itens_venda_2025_10.csv')."""
+    intervalo = intervalo_particao(particao)
+    return arquivo_mensal(arquivo, intervalo[0]) if intervalo is not None else None
+
+
+def particoes_do_derivado(manifesto: dict | None, arquivo: str) -> tuple[list[str], list[str]]:
+    """(partições que já têm a versão mensal de `arquivo`, partições que ainda dependem do arquivo único)."""
+    com, sem = [], []
+    for nome, info in (manifesto or {}).get("particoes", {}).items():
+        if info.get("linhas") == 0:
+            continue
+        (com if arquivo in info.get("derivados", []) else sem).append(nome)
+    return com, sem
+
+
+def ler_derivado_mensal(arquivo: str, manifesto: dict | None, url_raw, parser, coluna_data: str = "Data") -> pd.DataFrame | None:
+    """
+    `arquivo` montado das versões mensais (meses marcados no manifesto) + linhas do arquivo único antigo
+    dos demais meses. Sem manifesto, só o arquivo único. Arquivo único inexistente conta como vazio.
+    """
+    com, sem = particoes_do_derivado(manifesto, arquivo)
+    urls = {arquivo_da_particao(arquivo, nome): url_raw(arquivo_da_particao(arquivo, nome)) for nome in com}
+    mensais, falhas = baixar_particoes(urls, parser)
+    if falhas:
+        raise RuntimeError(f"{arquivo}: {len(falhas)} arquivo(s) mensal(is) não carregado(s): {', '.join(falhas)}")
+    partes = list(mensais.values())
+    if sem or manifesto is None:
+        try:
+            unico = buscar_csv_com_cache(url_raw(arquivo), parser, timeout=TIMEOUT_DOWNLOAD_PARTICAO)
+        except Exception:
+            unico = None
+        if unico is not None and not unico.empty:
+            meses_mensais = {_mes_do_arquivo(nome) for nome in com}
+            partes.append(unico[~unico[coluna_data].astype(str).str[:7].isin(meses_mensais)])
+    partes = [p for p in partes if p is not None and not p.empty]
+    return pd.concat(partes, ignore_index=True) if partes else None
+
+
+def derivado_por_mes(df: pd.DataFrame, arquivo: str, particoes, coluna_data: str = "Data") -> dict:
+    """{versão mensal de `arquivo`: linhas de `df` do mês} para cada partição (mês sem linhas: só o cabeçalho)."""
+    meses = df[coluna_data].astype(str).str[:7]
+    arquivos = {}
+    for particao in particoes:
+        nome = arquivo_da_particao(arquivo, particao)
+        if nome is not None:
+            arquivos[nome] = df[meses == _mes_do_arquivo(nome)]
+    return arquivos
+
+
+# =================================================================================
+# 📊 Agregados materializados do relatório comparativo (rollup_livro_caixa.csv)
+# =================================================================================
+# Uma linha por (dia, loja, tipo, categoria) das movimentações Realizadas. O relatório soma
+# por MesAno; o dia é mantido para respeitar datas de início/fim no meio do mês.
+CHAVES_ROLLUP = ["MesAno", "Data", "Loja", "Tipo", "Categoria"]
+METRICAS_ROLLUP = ["Entradas", "Saídas", "Quantidade", "Saldo"]
+COLUNAS_ROLLUP = CHAVES_ROLLUP + METRICAS_ROLLUP
+
+_rollup_memoria = {"atualizado_em": None, "dados": None}
+
+
+def tipar_rollup(df: pd.DataFrame | None) -> pd.DataFrame:
+    """Garante colunas e tipos do rollup (chaves texto, métricas numéricas)."""
+    if df is None:
+        df = pd.DataFrame(columns=COLUNAS_ROLLUP)
+    df = df.copy()
+    for col in COLUNAS_ROLLUP:
+        if col not in df.columns:
+            df[col] = "" if col in CHAVES_ROLLUP else 0.0
+    for col in CHAVES_ROLLUP:
+        df[col] = df[col].fillna("").astype(str)
+    for col in METRICAS_ROLLUP:
+        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0.0)
+    return df[COLUNAS_ROLLUP].reset_index(drop=True)
+
+
+def ler_rollup_csv(texto: str) -> pd.DataFrame:
+    """Parser do rollup para o cache HTTP."""
+    return tipar_rollup(pd.read_csv(StringIO(texto), dtype=str, encoding="utf-8-sig"))
+
+
+def calcular_rollup(df: pd.DataFrame) -> pd.DataFrame:
+    """Agrega as movimentações Realizadas por dia × loja × tipo × categoria (uma passada vetorizada)."""
+    if df is None or df.empty:
+        return tipar_rollup(None)
+    realizadas = df[df["Status"] == "Realizada"]
+    datas = pd.to_datetime(realizadas["Data"], errors="coerce")
+    realizadas, datas = realizadas[datas.notna()], datas[datas.notna()]
+    if realizadas.empty:
+        return tipar_rollup(None)
+
+    valor = para_centavos(realizadas["Valor"])  # Soma em centavos; vira reais só no resultado
+    # Agrupa pelo dia ainda como datetime; só o resultado (bem menor) é formatado como texto
+    base = pd.DataFrame({
+        "Dia": datas.dt.normalize(),
+        "Loja": realizadas["Loja"].fillna("").astype(str),
+        "Tipo": realizadas["Tipo"].fillna("").astype(str),
+        "Categoria": realizadas["Categoria"].fillna("").astype(str) if "Categoria" in realizadas.columns else "",
+        "Entradas": valor.clip(lower=0),
+        "Saídas": (-valor).clip(lower=0),
+        "Quantidade": 1,
+    })
+    rollup = base.groupby(["Dia", "Loja", "Tipo", "Categoria"], sort=True, as_index=False)[["Entradas", "Saídas", "Quantidade"]].sum()
+    rollup.insert(0, "MesAno", rollup["Dia"].dt.strftime("%Y-%m"))
+    rollup.insert(1, "Data", rollup.pop("Dia").dt.strftime("%Y-%m-%d"))
+    rollup["Saldo"] = para_reais(rollup["Entradas"] - rollup["Saídas"])
+    rollup["Entradas"] = para_reais(rollup["Entradas"])
+    rollup["Saídas"] = para_reais(rollup["Saídas"])
+    return tipar_rollup(rollup)
+
+
+def rollup_dos_meses(df: pd.DataFrame, particoes) -> tuple[list[str], pd.DataFrame]:
+    """(MesAno das partições informadas, rollup recalculado de `df` só para esses meses)."""
+    meses = {}
+    for nome in particoes:
+        intervalo = intervalo_particao(nome)
+        if intervalo is not None:
+            meses[intervalo[0].year * 100 + intervalo[0].month] = intervalo[0].strftime("%Y-%m")
+    datas = pd.to_datetime(df["Data"], errors="coerce")
+    return sorted(meses.values()), calcular_rollup(df[(datas.dt.year * 100 + datas.dt.month).isin(list(meses))])
+
+
+def atualizar_rollup(rollup: pd.DataFrame | None, df: pd.DataFrame, particoes=None) -> pd.DataFrame:
+    """
+    Recalcula só os meses das partições informadas (livro_caixa_AAAA_MM.csv) a partir de `df`
+    e mantém os demais. Sem rollup anterior ou sem partições, recalcula tudo.
+    """
+    if rollup is None or not particoes:
+        return calcular_rollup(df)
+    meses, recalculado = rollup_dos_meses(df, particoes)
+    mantido = rollup[~rollup["MesAno"].isin(meses)]
+    partes = [p for p in (mantido, recalculado) if not p.empty]
+    if not partes:
+        return tipar_rollup(None)
+    return tipar_rollup(pd.concat(partes, ignore_index=True).sort_values(CHAVES_ROLLUP))
+
+
+def rollup_para_csv(rollup: pd.DataFrame) -> str:
+    return rollup.to_csv(index=False, encoding="utf-8-sig")
+
+
+def registrar_rollup(rollup: pd.DataFrame, manifesto: dict | None = None):
+    """Guarda o rollup recém-gravado, associado ao manifesto do mesmo commit."""
+    _rollup_memoria["atualizado_em"] = (manifesto or {}).get("atualizado_em")
+    _rollup_memoria["dados"] = rollup
+
+
+def rollup_em_memoria(manifesto: dict | None = None) -> pd.DataFrame | None:
+    """Rollup em memória se ele corresponde ao manifesto vigente (mesmo atualizado_em)."""
+    if _rollup_memoria["dados"] is None:
+        return None
+    if manifesto is not None and manifesto.get("atualizado_em") != _rollup_memoria["atualizado_em"]:
+        return None
+    return _rollup_memoria["dados"]
+
+
+def resumo_comparativo(rollup: pd.DataFrame, data_inicio, data_fim, lojas, tipo: str = "Ambos") -> pd.DataFrame:
+    """Tabela do relatório comparativo (Entradas, Saídas, Saldo e crescimento por MesAno) lida só do rollup."""
+    inicio, fim = pd.Timestamp(data_inicio).strftime("%Y-%m-%d"), pd.Timestamp(data_fim).strftime("%Y-%m-%d")
+    filtro = (rollup["Data"] >= inicio) & (rollup["Data"] <= fim) & rollup["Loja"].isin(list(lojas))
+    if tipo != "Ambos":
+        filtro &= rollup["Tipo"] == tipo
+    selecionado = rollup[filtro]
+    if selecionado.empty:
+        return pd.DataFrame(columns=["MesAno", "Entradas", "Saídas", "Saldo"])
+
+    base = pd.DataFrame({
+        "MesAno": selecionado["MesAno"],
+        "Entradas": para_centavos(selecionado["Entradas"]),
+        "Saídas": para_centavos(selecionado["Saídas"]),
+    })
+    df_agrupado = base.groupby("MesAno", sort=True, as_index=False)[["Entradas", "Saídas"]].sum()
+    df_agrupado["Saldo"] = para_reais(df_agrupado["Entradas"] - df_agrupado["Saídas"])
+    df_agrupado["Entradas"] = para_reais(df_agrupado["Entradas"])
+    df_agrupado["Saídas"] = para_reais(df_agrupado["Saídas"])
+    df_agrupado["Crescimento Entradas (%)"] = (df_agrupado["Entradas"].pct_change() * 100).fillna(0)
+    df_agrupado["Crescimento Saídas (%)"] = (df_agrupado["Saídas"].pct_change() * 100).fillna(0)
+    return df_agrupado.reset_index(drop=True)
+
+
+# =================================================================================
+# 💰 Saldo Acumulado incremental (saldo de abertura por mês + índice ordenado no mês)
+# =================================================================================
+CHAVE_SALDO_SESSAO = "saldo_acumulado_livro_caixa"
+
+
+class _MesSaldo:
+    """
+    Lançamentos 'Realizada' de um mês ordenados por (data, índice) com o acumulado dentro do mês.
+    Valores e acumulados em centavos (int64): o saldo não desvia em históricos longos.
+    """
+    __slots__ = ("datas", "indices", "valores", "acumulado")
+
+    def __init__(self, datas=None, indices=None, valores=None, acumulado=None):
+        self.datas = np.asarray(datas if datas is not None else [], dtype="int64")
+        self.indices = np.asarray(indices if indices is not None else [], dtype="int64")
+        self.valores = np.asarray(valores if valores is not None else [], dtype="int64")
+        self.acumulado = (np.asarray(acumulado, dtype="int64") if acumulado is not None
+                          else np.cumsum(self.valores))
+
+    @property
+    def total(self) -> int:
+        return int(self.acumulado[-1]) if len(self.acumulado) else 0
+
+    def posicao(self, data: int, indice: int) -> int:
+        """Posição de (data, índice) na ordem do mês (busca binária nas duas chaves)."""
+        inicio = int(np.searchsorted(self.datas, data, side="left"))
+        fim = int(np.searchsorted(self.datas, data, side="right"))
+        return inicio + int(np.searchsorted(self.indices[inicio:fim], indice, side="left"))
+
+    def _recalcular_sufixo(self, pos: int):
+        base = self.acumulado[pos - 1] if pos > 0 else 0
+        self.acumulado = np.concatenate([self.acumulado[:pos], base + np.cumsum(self.valores[pos:])])
+
+    def inserir(self, data: int, indice: int, valor: int):
+        pos = self.posicao(data, indice)
+        self.datas = np.insert(self.datas, pos, data)
+        self.indices = np.insert(self.indices, pos, indice)
+        self.valores = np.insert(self.valores, pos, valor)
+        self.acumulado = np.insert(self.acumulado, pos, 0)
+        self._recalcular_sufixo(pos)
+
+    def remover(self, data: int, indice: int):
+        pos = self.posicao(data, indice)
+        self.datas = np.delete(self.datas, pos)
+        self.indices = np.delete(self.indices, pos)
+        self.valores = np.delete(self.valores, pos)
+        self.acumulado = np.delete(self.acumulado, pos)
+        self._recalcular_sufixo(pos)
+
+
+class SaldoAcumulado:
+    """
+    Saldo Acumulado dos lançamentos 'Realizada' em ordem (Data_dt, original_index), mantido de forma incremental:
+    incluir/editar um lançamento recalcula só o restante do mês dele e os saldos de abertura dos meses seguintes,
+    em vez de reordenar e refazer o cumsum do Livro Caixa inteiro.
+    """
+
+    def __init__(self):
+        self._meses = {}      # AAAAMM -> _MesSaldo
+        self._abertura = {}   # AAAAMM -> saldo (centavos) antes do 1º lançamento do mês
+        self._lancamentos = {}  # original_index -> (AAAAMM, data_ns)
+        self.assinatura = None  # Identifica o DataFrame ao qual a estrutura corresponde
+
+    # ---------- construção ----------
+    @classmethod
+    def construir(cls, df_proc: pd.DataFrame) -> "SaldoAcumulado":
+        """Monta a estrutura a partir de um DataFrame processado (Data_dt, Valor, Status, original_index)."""
+        estrutura = cls()
+        realizadas = df_proc[df_proc["Status"] == "Realizada"]
+        if realizadas.empty:
+            return estrutura
+        datas = pd.to_datetime(realizadas["Data_dt"]).to_numpy(dtype="datetime64[ns]").astype("int64")
+        indices = realizadas["original_index"].to_numpy(dtype="int64")
+        valores = para_centavos(realizadas["Valor"]).to_numpy(dtype="int64")
+
+        ordem = np.lexsort((indices, datas))
+        datas, indices, valores = datas[ordem], indices[ordem], valores[ordem]
+        acumulado_global = np.cumsum(valores)
+        meses = _mes_de_ns(datas)
+
+        limites = np.flatnonzero(np.diff(meses)) + 1
+        inicios = np.concatenate([[0], limites])
+        fins = np.concatenate([limites, [len(meses)]])
+        for inicio, fim in zip(inicios, fins):
+            mes = int(meses[inicio])
+            abertura = int(acumulado_global[inicio - 1]) if inicio > 0 else 0
+            estrutura._abertura[mes] = abertura
+            estrutura._meses[mes] = _MesSaldo(datas[inicio:fim], indices[inicio:fim], valores[inicio:fim],
+                                              acumulado_global[inicio:fim] - abertura)
+        estrutura._lancamentos = dict(zip(indices.tolist(), zip(meses.tolist(), datas.tolist())))
+        return estrutura
+
+    # ---------- atualização incremental ----------
+    def _recalcular_aberturas(self, a_partir_de: int):
+        meses = sorted(self._meses)
+        saldo = 0
+        for mes in meses:
+            if mes >= a_partir_de:
+                self._abertura[mes] = saldo
+            saldo = self._abertura[mes] + self._meses[mes].total
+
+    def inserir(self, indice: int, data, valor: float):
+        data_ns = int(pd.Timestamp(data).value)
+        mes = int(_mes_de_ns(np.array([data_ns]))[0])
+        if mes not in self._meses:
+            self._meses[mes] = _MesSaldo()
+        self._meses[mes].inserir(data_ns, int(indice), centavos(valor))
+        self._lancamentos[int(indice)] = (mes, data_ns)
+        self._recalcular_aberturas(mes)
+
+    def remover(self, indice: int):
+        if int(indice) not in self._lancamentos:
+            return
+        mes, data_ns = self._lancamentos.pop(int(indice))
+        self._meses[mes].remover(data_ns, int(indice))
+        if not len(self._meses[mes].indices):
+            del self._meses[mes]
+            self._abertura.pop(mes, None)
+        self._recalcular_aberturas(mes)
+
+    def definir(self, indice: int, data, valor: float, realizada: bool = True):
+        """Inclui ou edita um lançamento (só 'Realizada' entra no saldo)."""
+        self.remover(indice)
+        if realizada and pd.notna(pd.to_datetime(data, errors="coerce")):
+            self.inserir(indice, data, valor)
+
+    # ---------- consulta ----------
+    def saldo_de(self, indice: int) -> float:
+        mes, data_ns = self._lancamentos[int(indice)]
+        bloco = self._meses[mes]
+        return para_reais(self._abertura[mes] + int(bloco.acumulado[bloco.posicao(data_ns, int(indice))]))
+
+    def serie(self) -> pd.Series:
+        """Saldo de cada lançamento 'Realizada', indexado por original_index."""
+        if not self._meses:
+            return pd.Series(dtype="float64")
+        meses = sorted(self._meses)
+        indices = np.concatenate([self._meses[m].indices for m in meses])
+        saldos = np.concatenate([self._abertura[m] + self._meses[m].acumulado for m in meses])
+        return pd.Series(para_reais(saldos), index=indices)
+
+    def coluna_saldo(self, df_proc: pd.DataFrame) -> pd.Series:
+        """
+        Coluna 'Saldo Acumulado' alinhada ao df_proc. Lançamentos não realizados herdam o saldo
+        do lançamento anterior na ordem original (mesma regra do ffill antigo).
+        """
+        saldos = df_proc["original_index"].map(self.serie())
+        ordem_original = df_proc["original_index"].sort_values().index
+        return saldos.loc[ordem_original].ffill().fillna(0.0).reindex(df_proc.index)
+
+
+def _mes_de_ns(datas_ns: np.ndarray) -> np.ndarray:
+    """AAAAMM de cada data em nanossegundos."""
+    meses = datas_ns.astype("datetime64[ns]").astype("datetime64[M]").astype("int64")
+    return (1970 + meses // 12) * 100 + (meses % 12) + 1
+
+
+def assinatura_livro_caixa(df_proc: pd.DataFrame) -> tuple:
+    """Resumo barato do DataFrame processado para saber se a estrutura da sessão ainda vale."""
+    if df_proc.empty:
+        return (0, -1, 0, 0)
+    realizadas = df_proc["Status"] == "Realizada"
+    return (
+        len(df_proc),
+        int(df_proc["original_index"].max()),
+        int(realizadas.sum()),
+        somar(df_proc.loc[realizadas, "Valor"]),
+    )
+
+
+def saldo_acumulado_sessao(df_proc: pd.DataFrame) -> SaldoAcumulado:
+    """Estrutura de saldo da sessão; só é reconstruída do zero se não corresponder mais ao DataFrame."""
+    assinatura = assinatura_livro_caixa(df_proc)
+    estrutura = st.session_state.get(CHAVE_SALDO_SESSAO)
+    if estrutura is None or estrutura.assinatura != assinatura:
+        estrutura = SaldoAcumulado.construir(df_proc)
+        estrutura.assinatura = assinatura
+        st.session_state[CHAVE_SALDO_SESSAO] = estrutura
+    return estrutura
+
+
+def atualizar_saldo_sessao(df_anterior: pd.DataFrame, df_atualizado: pd.DataFrame, indice, data, valor, status):
+    """
+    Aplica uma inclusão/edição na estrutura da sessão (só o sufixo do mês é recalculado).
+    Se a estrutura não corresponder a df_anterior, nada é feito: ela será reconstruída na próxima exibição.
+    """
+    estrutura = st.session_state.get(CHAVE_SALDO_SESSAO)
+    if estrutura is None or estrutura.assinatura != _assinatura_bruta(df_anterior):
+        return
+    estrutura.definir(indice, data, valor, status == "Realizada")
+    estrutura.assinatura = _assinatura_bruta(df_atualizado)
+
+
+def _assinatura_bruta(df: pd.DataFrame) -> tuple:
+    """Mesma assinatura de assinatura_livro_caixa, calculada sobre o DataFrame ainda não processado."""
+    if df.empty:
+        return (0, -1, 0, 0)
+    realizadas = df["Status"] == "Realizada"
+    return (len(df), int(df.index.max()), int(realizadas.sum()), somar(df.loc[realizadas, "Valor"]))
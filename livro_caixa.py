@@ -8,7 +8,7 @@ import ast
 # Importa tudo que o Livro Caixa precisa
 from utils import (
     carregar_livro_caixa, processar_dataframe, inicializar_produtos, 
-    calcular_valor_em_aberto, to_float, salvar_dados_no_github, ajustar_estoque, 
+    calcular_valor_em_aberto, to_float, salvar_dados_no_github, 
     calcular_resumo, format_produtos_resumo, add_months, ler_codigo_barras_api, 
     callback_adicionar_manual, callback_adicionar_estoque
 )
@@ -1,7 +1,8 @@
 import pandas as pd
 import streamlit as st
-import requests
 import base64
+from http_utils import http_get, http_put
+from cache_utils import depende_de
 from io import StringIO
 from datetime import date
 
@@ -16,13 +17,14 @@ HEADERS = {"Authorization": f"token {TOKEN}", "Accept": "application/vnd.github.
 
 COLUNAS_PROMOCOES_MARKETING = ["ID_PROMO", "DATA_ENVIO", "TEMPLATE_NOME", "FOTO_URL", "TEXTO_VAR1", "TEXTO_VAR2", "STATUS"]
 
+@depende_de(ARQ_PROMOCOES_MARKETING)
 @st.cache_data(show_spinner="Carregando agenda de marketing...")
 def carregar_agenda_marketing():
     """Carrega a agenda de promoções de marketing do GitHub."""
     url_raw = f"https://raw.githubusercontent.com/{OWNER}/{REPO_NAME}/{BRANCH}/{ARQ_PROMOCOES_MARKETING}"
     
     try:
-        response = requests.get(url_raw)
+        response = http_get(url_raw)
         if response.status_code == 404:
              return pd.DataFrame(columns=COLUNAS_PROMOCOES_MARKETING)
              
@@ -52,7 +54,7 @@ def salvar_agenda_marketing(df_novo: pd.DataFrame, commit_message: str):
     
     try:
         # 1. Obter o SHA do arquivo atual (necessário para atualização)
-        response = requests.get(api_url, headers=HEADERS)
+        response = http_get(api_url, headers=HEADERS)
         sha = response.json().get('sha') if response.status_code == 200 else None
         
         # 2. Preparar o novo conteúdo
@@ -67,7 +69,7 @@ def salvar_agenda_marketing(df_novo: pd.DataFrame, commit_message: str):
         if sha: payload["sha"] = sha 
         
         # 3. Fazer o commit
-        put_response = requests.put(api_url, headers=HEADERS, json=payload)
+        put_response = http_put(api_url, headers=HEADERS, json=payload)
         
         if put_response.status_code in [200, 201]:
             carregar_agenda_marketing.clear()
@@ -10,20 +10,15 @@ import io, os
 import base64
 import pytz
 import json 
+from cache_utils import buscar_csv_com_cache, depende_de, invalidar_arquivos
+from snapshot_utils import snapshot
+from schema_utils import ESQUEMA_CLIENTES_CASHBACK, ESQUEMA_LANCAMENTOS_CASHBACK, ESQUEMA_PRODUTOS_TURBO, aplicar_esquema, ler_csv_rapido
+from http_utils import http_post
+from gravacao_utils import enfileirar_commit
+from utils import hash_df
+from dinheiro_utils import aplicar_taxa, centavos, formatar_brl, para_centavos, para_reais
 import pytz
 
-# Tenta importar PyGithub para persistência.
-try:
-    from github import Github
-except ImportError:
-    # Classe dummy para evitar crash se PyGithub não estiver instalado
-    class Github:
-        def __init__(self, token): pass
-        def get_repo(self, repo_name): return self
-        def get_contents(self, path, ref): return type('Contents', (object,), {'sha': 'dummy_sha'})
-        def update_file(self, path, msg, content, sha, branch): pass
-        def create_file(self, path, msg, content, sha, branch): pass
-
 # --- Nomes dos arquivos CSV e Configuração ---
 CLIENTES_CSV = 'clientes_cash.csv'
 LANÇAMENTOS_CSV = 'lancamentos.csv'
@@ -83,67 +78,106 @@ def enviar_mensagem_telegram(mensagem: str):
     payload = {'chat_id': TELEGRAM_CHAT_ID, 'text': mensagem, 'parse_mode': 'Markdown'}
     if TELEGRAM_THREAD_ID: payload['message_thread_id'] = TELEGRAM_THREAD_ID
     try:
-        requests.post(url, data=payload, timeout=5)
+        http_post(url, data=payload, timeout=5)
     except requests.exceptions.RequestException as e:
         print(f"Erro ao enviar para o Telegram: {e}")
 
 # --- Funções de Persistência, Salvamento e Carregamento ---
 
+def _ler_csv_cashback(texto: str) -> pd.DataFrame:
+    try:
+        return ler_csv_rapido(texto, sep=',')
+    except Exception:
+        pass
+    # --- NOVO TRATAMENTO PARA ARQUIVOS COM ASPAS DUPLAS ---
+    return pd.read_csv(
+        StringIO(texto), 
+        sep=',', 
+        encoding="utf-8", 
+        engine="python", # Usa engine Python para lidar melhor com o formato CSV complexo (aspas dentro de aspas)
+        on_bad_lines="warn", # Apenas avisa sobre linhas mal-formadas, não falha
+        dtype=str
+    )
+    # -----------------------------------------------------
+
 def load_csv_github(url: str) -> pd.DataFrame | None:
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        
-        # --- NOVO TRATAMENTO PARA ARQUIVOS COM ASPAS DUPLAS ---
-        return pd.read_csv(
-            StringIO(response.text), 
-            sep=',', 
-            encoding="utf-8", 
-            engine="python", # Usa engine Python para lidar melhor com o formato CSV complexo (aspas dentro de aspas)
-            on_bad_lines="warn", # Apenas avisa sobre linhas mal-formadas, não falha
-            dtype=str
-        )
-        # -----------------------------------------------------
+        # Revalida com ETag: sem mudança no GitHub, não baixa nem converte o CSV de novo
+        return buscar_csv_com_cache(url, _ler_csv_cashback, timeout=10)
     except Exception as e:
         # st.error(f"Erro detalhado ao ler CSV do GitHub: {e}") # Descomente para debug
         return None
 
-def salvar_dados_no_github(df: pd.DataFrame, file_path: str, commit_message: str):
-    if PERSISTENCE_MODE != "GITHUB": return False
+def _csv_para_github(df: pd.DataFrame) -> str:
     df_temp = df.copy()
     for col in ['Data', 'Data Início', 'Data Fim']:
         if col in df_temp.columns:
             df_temp[col] = pd.to_datetime(df_temp[col], errors='coerce').apply(lambda x: x.strftime('%Y-%m-%d') if pd.notna(x) else '')
+    return df_temp.to_csv(index=False, encoding="utf-8-sig")
+
+def salvar_arquivos_no_github(dfs: dict, commit_message: str):
+    """Grava vários arquivos ({caminho: DataFrame}) em UM commit, pela fila de gravação em segundo plano."""
+    if PERSISTENCE_MODE != "GITHUB": return False
     try:
-        g = Github(TOKEN)
-        repo = g.get_repo(f"{REPO_OWNER}/{REPO_NAME}")
-        csv_string = df_temp.to_csv(index=False, encoding="utf-8-sig")
-        try:
-            contents = repo.get_contents(file_path, ref=BRANCH)
-            repo.update_file(contents.path, commit_message, csv_string, contents.sha, branch=BRANCH)
-            st.toast(f"✅ Arquivo {file_path} atualizado no GitHub.")
-        except Exception:
-            repo.create_file(file_path, commit_message, csv_string, branch=BRANCH)
-            st.toast(f"✅ Arquivo {file_path} criado no GitHub.")
+        arquivos = {file_path: _csv_para_github(df) for file_path, df in dfs.items()}
+        # Gravação em segundo plano: retorna na hora; a fila faz o commit e avisa ao concluir
+        enfileirar_commit(TOKEN, REPO_OWNER, REPO_NAME, BRANCH, arquivos, commit_message)
+        st.toast(f"✅ {', '.join(arquivos)} salvo(s) (enviando ao GitHub em segundo plano).")
         return True
     except Exception as e:
-        st.error(f"❌ ERRO CRÍTICO ao salvar '{file_path}' no GitHub. Verifique as permissões 'repo' do seu GITHUB_TOKEN.")
+        nomes = ', '.join(dfs)
+        st.error(f"❌ ERRO CRÍTICO ao salvar '{nomes}' no GitHub. Verifique as permissões 'repo' do seu GITHUB_TOKEN.")
         error_message = str(e)
         if hasattr(e, 'data') and 'message' in e.data: error_message = f"{e.status} - {e.data['message']}"
         st.error(f"Detalhes: {error_message}")
-        print(f"--- ERRO DETALHADO GITHUB [{file_path}] ---\n{repr(e)}\n-----------------------------------------")
+        print(f"--- ERRO DETALHADO GITHUB [{nomes}] ---\n{repr(e)}\n-----------------------------------------")
         return False
 
+def salvar_dados_no_github(df: pd.DataFrame, file_path: str, commit_message: str):
+    return salvar_arquivos_no_github({file_path: df}, commit_message)
+
+# Hashes do conteúdo gravado/carregado de cada arquivo (detecção de mudança no autosave)
+CHAVE_HASHES_CASHBACK = "hashes_arquivos_cashback"
+
+def _frames_cashback() -> dict:
+    """{arquivo: (DataFrame da sessão, rótulo)} dos três arquivos do autosave."""
+    return {
+        CLIENTES_CSV: (st.session_state.clientes, "Clientes"),
+        LANÇAMENTOS_CSV: (st.session_state.lancamentos, "Lançamentos"),
+        PRODUTOS_TURBO_CSV: (st.session_state.produtos_turbo, "Produtos Turbo"),
+    }
+
+def registrar_hashes_cashback():
+    """Guarda o hash atual dos três DataFrames (chamado após carregar e após salvar)."""
+    st.session_state[CHAVE_HASHES_CASHBACK] = {arq: hash_df(df) for arq, (df, _) in _frames_cashback().items()}
+
 def salvar_dados():
+    """
+    Autosave do cashback: grava só os arquivos cujo conteúdo mudou desde o último carregamento/salvamento,
+    todos em um único commit, e invalida apenas os caches que dependem desses arquivos.
+    """
+    hashes_salvos = st.session_state.get(CHAVE_HASHES_CASHBACK, {})
+    alterados = {}
+    for arquivo, (df, rotulo) in _frames_cashback().items():
+        hash_atual = hash_df(df)
+        if hash_atual != hashes_salvos.get(arquivo):
+            alterados[arquivo] = (df, rotulo, hash_atual)
+    if not alterados:
+        return
+
     if PERSISTENCE_MODE == "GITHUB":
-        salvar_dados_no_github(st.session_state.clientes, CLIENTES_CSV, "AUTOSAVE: Clientes")
-        salvar_dados_no_github(st.session_state.lancamentos, LANÇAMENTOS_CSV, "AUTOSAVE: Lançamentos")
-        salvar_dados_no_github(st.session_state.produtos_turbo, PRODUTOS_TURBO_CSV, "AUTOSAVE: Produtos Turbo")
+        rotulos = ", ".join(rotulo for _, rotulo, _ in alterados.values())
+        if not salvar_arquivos_no_github({arq: dados[0] for arq, dados in alterados.items()}, f"AUTOSAVE: {rotulos}"):
+            return
     else:
-        st.session_state.clientes.to_csv(CLIENTES_CSV, index=False)
-        st.session_state.lancamentos.to_csv(LANÇAMENTOS_CSV, index=False)
-        st.session_state.produtos_turbo.to_csv(PRODUTOS_TURBO_CSV, index=False)
-    st.cache_data.clear()
+        for arquivo, (df, _, _) in alterados.items():
+            df.to_csv(arquivo, index=False)
+
+    # clientes_cash.csv também alimenta o Livro Caixa: o registro limpa os loaders de todas as páginas
+    invalidar_arquivos(*alterados)
+    st.session_state[CHAVE_HASHES_CASHBACK] = {
+        **hashes_salvos, **{arquivo: hash_atual for arquivo, (_, _, hash_atual) in alterados.items()}
+    }
 
 def carregar_dados_pedidos():
     """Carrega os pedidos do Catálogo para processamento no painel Admin."""
@@ -179,51 +213,48 @@ def carregar_dados_pedidos():
     return df_pedidos.sort_values(by='DATA_HORA', ascending=False, ignore_index=True)
 
 
-@st.cache_data(show_spinner="Carregando dados dos arquivos...")
-def carregar_dados():
-    def carregar_dados_do_csv(file_path, df_columns):
-        df = pd.DataFrame(columns=df_columns)
-        if PERSISTENCE_MODE == "GITHUB":
-            url_raw = f"{URL_BASE_REPOS}{file_path}"
-            df_carregado = load_csv_github(url_raw)
-            if df_carregado is not None: df = df_carregado
-        elif os.path.exists(file_path):
-            try: df = pd.read_csv(file_path, dtype=str)
-            except pd.errors.EmptyDataError: pass
-        for col in df_columns:
-            if col not in df.columns: df[col] = ""
-        if 'Cashback Disponível' in df.columns: df['Cashback Disponível'] = df['Cashback Disponível'].fillna('0.0')
-        if 'Gasto Acumulado' in df.columns: df['Gasto Acumulado'] = df['Gasto Acumulado'].fillna('0.0')
-        if 'Nivel Atual' in df.columns: df['Nivel Atual'] = df['Nivel Atual'].fillna('Prata')
-        if 'Indicado Por' in df.columns: df['Indicado Por'] = df['Indicado Por'].fillna('')
-        if 'Primeira Compra Feita' in df.columns: df['Primeira Compra Feita'] = df['Primeira Compra Feita'].fillna('False')
-        if 'Venda Turbo' in df.columns: df['Venda Turbo'] = df['Venda Turbo'].fillna('Não')
-        return df[df_columns]
-
-    CLIENTES_COLS = ['Nome', 'Apelido/Descrição', 'Telefone', 'Cashback Disponível', 'Gasto Acumulado', 'Nivel Atual', 'Indicado Por', 'Primeira Compra Feita']
-    df_clientes = carregar_dados_do_csv(CLIENTES_CSV, CLIENTES_COLS)
-    df_clientes['Cashback Disponível'] = pd.to_numeric(df_clientes['Cashback Disponível'], errors='coerce').fillna(0.0)
-    df_clientes['Gasto Acumulado'] = pd.to_numeric(df_clientes['Gasto Acumulado'], errors='coerce').fillna(0.0)
-    df_clientes['Primeira Compra Feita'] = df_clientes['Primeira Compra Feita'].astype(str).str.lower().map({'true': True, 'false': False}).fillna(False).astype(bool)
-    df_clientes['Nivel Atual'] = df_clientes['Nivel Atual'].fillna('Prata')
-
-    LANÇAMENTOS_COLS = ['Data', 'Cliente', 'Tipo', 'Valor Venda/Resgate', 'Valor Cashback', 'Venda Turbo']
-    df_lancamentos = carregar_dados_do_csv(LANÇAMENTOS_CSV, LANÇAMENTOS_COLS)
+def carregar_dados_do_csv(file_path, esquema):
+    """Lê o arquivo e aplica o esquema (colunas faltantes, tipos e padrões dos vazios)."""
+    df = None
+    if PERSISTENCE_MODE == "GITHUB":
+        url_raw = f"{URL_BASE_REPOS}{file_path}"
+        df = load_csv_github(url_raw)
+    elif os.path.exists(file_path):
+        try:
+            with open(file_path, encoding="utf-8-sig") as f: df = ler_csv_rapido(f.read())
+        except pd.errors.EmptyDataError: pass
+    return aplicar_esquema(df, esquema)
+
+# Um loader com cache por arquivo: o autosave invalida só os do arquivo gravado
+@depende_de(CLIENTES_CSV)
+@snapshot(show_spinner="Carregando clientes...")
+def carregar_clientes():
+    return carregar_dados_do_csv(CLIENTES_CSV, ESQUEMA_CLIENTES_CASHBACK)
+
+@depende_de(LANÇAMENTOS_CSV)
+@snapshot(show_spinner="Carregando lançamentos...")
+def carregar_lancamentos():
+    df_lancamentos = carregar_dados_do_csv(LANÇAMENTOS_CSV, ESQUEMA_LANCAMENTOS_CASHBACK)
     if not df_lancamentos.empty:
-        df_lancamentos['Data'] = pd.to_datetime(df_lancamentos['Data'], errors='coerce').dt.date
-        df_lancamentos['Venda Turbo'] = df_lancamentos['Venda Turbo'].astype(str).replace({'True': 'Sim', 'False': 'Não', '': 'Não'}).fillna('Não')
+        # Arquivos antigos gravavam a marca Turbo como booleano
+        df_lancamentos['Venda Turbo'] = df_lancamentos['Venda Turbo'].astype(str).replace({'True': 'Sim', 'False': 'Não'})
+    return df_lancamentos
 
-    PRODUTOS_TURBO_COLS = ['Nome Produto', 'Data Início', 'Data Fim', 'Ativo']
-    df_produtos_turbo = carregar_dados_do_csv(PRODUTOS_TURBO_CSV, PRODUTOS_TURBO_COLS)
-    if not df_produtos_turbo.empty:
-        df_produtos_turbo['Data Início'] = pd.to_datetime(df_produtos_turbo['Data Início'], errors='coerce')
-        df_produtos_turbo['Data Fim'] = pd.to_datetime(df_produtos_turbo['Data Fim'], errors='coerce')
-        df_produtos_turbo['Ativo'] = df_produtos_turbo['Ativo'].astype(str).str.lower().map({'true': True, 'false': False}).fillna(False).astype(bool)
+@depende_de(PRODUTOS_TURBO_CSV)
+@snapshot(show_spinner="Carregando produtos turbo...")
+def carregar_produtos_turbo():
+    return carregar_dados_do_csv(PRODUTOS_TURBO_CSV, ESQUEMA_PRODUTOS_TURBO)
 
-    return df_clientes, df_lancamentos, df_produtos_turbo
+def carregar_dados():
+    return carregar_clientes(), carregar_lancamentos(), carregar_produtos_turbo()
 
 # --- Funções de Lógica de Negócio ---
 
+def _somar_em_centavos(linhas, coluna: str, valor: float):
+    """Soma `valor` (reais) à coluna dos clientes selecionados, em centavos: saldos sem desvio do float."""
+    clientes = st.session_state.clientes
+    clientes.loc[linhas, coluna] = para_reais(para_centavos(clientes.loc[linhas, coluna]) + centavos(valor))
+
 def calcular_nivel_e_beneficios(gasto_acumulado: float):
     if gasto_acumulado >= NIVEIS['Diamante']['min_gasto']: nivel = 'Diamante'
     elif gasto_acumulado >= NIVEIS['Ouro']['min_gasto']: nivel = 'Ouro'
@@ -351,7 +382,7 @@ def lancar_venda(cliente_nome, valor_venda, valor_cashback_manual, data_venda, v
         taxa_final = cb_normal_rate 
         if era_primeira_compra and cliente_data_antes['Indicado Por']:
             taxa_final = CASHBACK_INDICADO_PRIMEIRA_COMPRA
-        valor_cashback = valor_venda * taxa_final
+        valor_cashback = para_reais(aplicar_taxa(centavos(valor_venda), taxa_final))
     else:
         # Fluxo Lançamento Manual: Usa o valor calculado na interface de lançamento.
         valor_cashback = valor_cashback_manual
@@ -366,8 +397,8 @@ def lancar_venda(cliente_nome, valor_venda, valor_cashback_manual, data_venda, v
     data_venda = data_venda if data_venda else date.today()
 
     # Lógica de Atualização de Saldos e Níveis
-    st.session_state.clientes.loc[idx_cliente, 'Cashback Disponível'] += valor_cashback
-    st.session_state.clientes.loc[idx_cliente, 'Gasto Acumulado'] += valor_venda
+    _somar_em_centavos(idx_cliente, 'Cashback Disponível', valor_cashback)
+    _somar_em_centavos(idx_cliente, 'Gasto Acumulado', valor_venda)
     
     novo_gasto_acumulado = st.session_state.clientes.loc[idx_cliente, 'Gasto Acumulado'].iloc[0]
     novo_nivel, _, _ = calcular_nivel_e_beneficios(novo_gasto_acumulado)
@@ -378,14 +409,14 @@ def lancar_venda(cliente_nome, valor_venda, valor_cashback_manual, data_venda, v
         indicador_nome = cliente_data_antes['Indicado Por']
         idx_indicador = st.session_state.clientes[st.session_state.clientes['Nome'] == indicador_nome].index
         if not idx_indicador.empty:
-            bonus = valor_venda * BONUS_INDICACAO_PERCENTUAL
-            st.session_state.clientes.loc[idx_indicador, 'Cashback Disponível'] += bonus
+            bonus = para_reais(aplicar_taxa(centavos(valor_venda), BONUS_INDICACAO_PERCENTUAL))
+            _somar_em_centavos(idx_indicador, 'Cashback Disponível', bonus)
             bonus_lanc = pd.DataFrame([{'Data': data_venda, 'Cliente': indicador_nome, 'Tipo': 'Bônus Indicação', 'Valor Venda/Resgate': valor_venda, 'Valor Cashback': bonus, 'Venda Turbo': 'Não'}])
             st.session_state.lancamentos = pd.concat([st.session_state.lancamentos, bonus_lanc], ignore_index=True)
             st.success(f"🎁 Bônus de R$ {bonus:.2f} creditado para {indicador_nome}!")
             if TELEGRAM_ENABLED:
                 nivel_indicador = st.session_state.clientes.loc[idx_indicador, 'Nivel Atual'].iloc[0]
-                bonus_str = f"R$ {bonus:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+                bonus_str = formatar_brl(centavos(bonus))
                 mensagem_indicador = (
                     f"Oi, {indicador_nome}! Agradecemos demais a sua indicação da {cliente_nome}! "
                     f"Você acaba de ganhar *{bonus_str}* extras! Seu nível atual é: *{nivel_indicador}*."
@@ -403,8 +434,8 @@ def lancar_venda(cliente_nome, valor_venda, valor_cashback_manual, data_venda, v
         fuso_horario_brasil = pytz.timezone('America/Sao_Paulo')
         agora_brasil = datetime.now(fuso_horario_brasil)
         data_hora_lancamento = agora_brasil.strftime('%d/%m/%Y às %H:%M')
-        cashback_ganho_str = f"R$ {valor_cashback:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-        saldo_atual_str = f"R$ {saldo_atualizado:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+        cashback_ganho_str = formatar_brl(centavos(valor_cashback))
+        saldo_atual_str = formatar_brl(centavos(saldo_atualizado))
         mensagem_header = (
             "✨ *Novidade imperdível na Doce&Bella! a partir desse mes de outubro* ✨\n\n"
             "Agora você pode aproveitar ainda mais as suas compras favoritas com o nosso Programa de Fidelidade 🛍💖\n\n"
@@ -437,11 +468,11 @@ def lancar_venda(cliente_nome, valor_venda, valor_cashback_manual, data_venda, v
     return True # Retorna True em caso de sucesso
 
 def resgatar_cashback(cliente_nome, valor_resgate, valor_venda_atual, data_resgate, saldo_disponivel):
-    max_resgate = valor_venda_atual * 0.50
+    max_resgate = para_reais(aplicar_taxa(centavos(valor_venda_atual), 0.50))
     if valor_resgate < 20: st.error("Erro: O resgate mínimo é de R$ 20,00."); return
     if valor_resgate > max_resgate: st.error(f"Erro: O resgate máximo é 50% da venda atual (R$ {max_resgate:.2f})."); return
     if valor_resgate > saldo_disponivel: st.error(f"Erro: Saldo insuficiente (Disponível: R$ {saldo_disponivel:.2f})."); return
-    st.session_state.clientes.loc[st.session_state.clientes['Nome'] == cliente_nome, 'Cashback Disponível'] -= valor_resgate
+    _somar_em_centavos(st.session_state.clientes['Nome'] == cliente_nome, 'Cashback Disponível', -valor_resgate)
     novo_lancamento = pd.DataFrame([{'Data': data_resgate, 'Cliente': cliente_nome, 'Tipo': 'Resgate', 'Valor Venda/Resgate': valor_venda_atual, 'Valor Cashback': -valor_resgate, 'Venda Turbo': 'Não'}])
     st.session_state.lancamentos = pd.concat([st.session_state.lancamentos, novo_lancamento], ignore_index=True)
     salvar_dados()
@@ -453,8 +484,8 @@ def resgatar_cashback(cliente_nome, valor_resgate, valor_venda_atual, data_resga
         agora_brasil = datetime.now(fuso_horario_brasil)
         data_hora_lancamento = agora_brasil.strftime('%d/%m/%Y às %H:%M')
         
-        valor_resgate_str = f"R$ {valor_resgate:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-        saldo_apos_resgate_str = f"R$ {saldo_apos_resgate:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+        valor_resgate_str = formatar_brl(centavos(valor_resgate))
+        saldo_apos_resgate_str = formatar_brl(centavos(saldo_apos_resgate))
         
         mensagem_telegram = (
             f"🛒 *Loja Doce&Bella: RESGATE DE CASHBACK*\n\n"
@@ -488,8 +519,8 @@ def excluir_lancamento_venda(lancamento_index: int):
     if not idx_cliente.empty:
         cliente_data_antes = st.session_state.clientes.loc[idx_cliente].iloc[0].copy()
         
-        st.session_state.clientes.loc[idx_cliente, 'Gasto Acumulado'] -= valor_venda
-        st.session_state.clientes.loc[idx_cliente, 'Cashback Disponível'] -= valor_cashback
+        _somar_em_centavos(idx_cliente, 'Gasto Acumulado', -valor_venda)
+        _somar_em_centavos(idx_cliente, 'Cashback Disponível', -valor_cashback)
         
         novo_gasto_acumulado = st.session_state.clientes.loc[idx_cliente, 'Gasto Acumulado'].iloc[0]
         novo_nivel, _, _ = calcular_nivel_e_beneficios(novo_gasto_acumulado)
@@ -502,8 +533,8 @@ def excluir_lancamento_venda(lancamento_index: int):
             
             idx_indicador = st.session_state.clientes[st.session_state.clientes['Nome'] == indicador_nome].index
             if not idx_indicador.empty:
-                bonus_a_reverter = valor_venda * BONUS_INDICACAO_PERCENTUAL
-                st.session_state.clientes.loc[idx_indicador, 'Cashback Disponível'] -= bonus_a_reverter
+                bonus_a_reverter = para_reais(aplicar_taxa(centavos(valor_venda), BONUS_INDICACAO_PERCENTUAL))
+                _somar_em_centavos(idx_indicador, 'Cashback Disponível', -bonus_a_reverter)
                 
                 idx_bonus = st.session_state.lancamentos[
                     (st.session_state.lancamentos['Cliente'] == indicador_nome) &
@@ -558,7 +589,7 @@ def render_lancamento():
                 venda_turbo_selecionada = st.checkbox(f"Venda contém Produtos Turbo (aplica taxa de {int(cb_turbo_rate * 100)}%)?", key='venda_turbo_check')
         
         taxa_final = cb_turbo_rate if venda_turbo_selecionada and cb_turbo_rate > 0 else cb_normal_rate
-        cashback_calculado = valor_venda * taxa_final
+        cashback_calculado = para_reais(aplicar_taxa(centavos(valor_venda), taxa_final))
         st.metric(label=f"Cashback a Gerar ({int(taxa_final * 100)}%):", value=f"R$ {cashback_calculado:.2f}")
         
         with st.form("form_venda", clear_on_submit=True):
@@ -592,7 +623,7 @@ def render_lancamento():
                     saldo_atual = st.session_state.clientes.loc[st.session_state.clientes['Nome'] == cliente_resgate, 'Cashback Disponível'].iloc[0]
                     st.info(f"Saldo Disponível para {cliente_resgate}: R$ {saldo_atual:.2f}")
                     
-                    max_resgate_disp = valor_venda_resgate * 0.50
+                    max_resgate_disp = para_reais(aplicar_taxa(centavos(valor_venda_resgate), 0.50))
                     st.warning(f"Resgate Máximo Permitido (50% da venda): R$ {max_resgate_disp:.2f}")
                 else:
                     st.warning("Cliente não encontrado ou saldo insuficiente para resgate.")
@@ -1015,6 +1046,7 @@ def cashback_system():
     # Carregamento de todos os DFs
     if 'clientes' not in st.session_state or 'cashback_tab_atual' not in st.session_state:
         st.session_state.clientes, st.session_state.lancamentos, st.session_state.produtos_turbo = carregar_dados()
+        registrar_hashes_cashback()
         st.session_state.pedidos = carregar_dados_pedidos() 
         st.session_state.cashback_tab_atual = "Home"
 
@@ -4,7 +4,6 @@ import streamlit as st
 import pandas as pd
 from datetime import date, datetime, timedelta
 import json
-import ast
 
 # ==============================================================================
 # 🚨 Bloco de Importação das Funções Auxiliares do utils.py
@@ -13,18 +12,20 @@ import ast
 from utils import (
     inicializar_produtos,
     carregar_livro_caixa,
-    parse_date_yyyy_mm_dd,
     ler_codigo_barras_api,
     callback_salvar_novo_produto,
     to_float,
     salvar_produtos_no_github,
-    save_data_github_produtos,
 )
 
 from constants_and_css import (
     FATOR_CARTAO,
-    COMMIT_MESSAGE_PROD,
-    ARQ_PRODUTOS
+)
+from vendas_utils import itens_venda
+from schema_utils import adicionar_categorias
+from estoque_utils import (
+    arvore_variacoes, estoque_em, indice_produtos_sessao, ler_detalhes_grade, linhas_movimento,
+    substituir_produtos_sessao
 )
 
 # ==============================================================================
@@ -55,7 +56,7 @@ def relatorio_produtos():
     produtos['Validade'] = pd.to_datetime(produtos['Validade'], errors='coerce').dt.date
 
     df_movimentacoes = carregar_livro_caixa()
-    vendas = df_movimentacoes[df_movimentacoes["Tipo"] == "Entrada"].copy()
+    df_itens = itens_venda(df_movimentacoes)
 
     with st.expander("⚙️ Configurações de Alerta", expanded=False):
         col_c1, col_c2, col_c3 = st.columns(3)
@@ -117,26 +118,10 @@ def relatorio_produtos():
     st.markdown("---")
 
     st.markdown(f"#### 📦 Alerta de Produtos Parados (Sem venda nos últimos {dias_sem_venda} dias)")
-    vendas_list = []
-    for index, row in vendas.iterrows():
-        produtos_json = row["Produtos Vendidos"]
-        if pd.notna(produtos_json) and produtos_json:
-            try:
-                items = ast.literal_eval(produtos_json)
-                if isinstance(items, list):
-                    for item in items:
-                         produto_id = str(item.get("Produto_ID"))
-                         if produto_id and produto_id != "None":
-                            vendas_list.append({
-                                "Data": parse_date_yyyy_mm_dd(row["Data"]),
-                                "IDProduto": produto_id
-                            })
-            except Exception:
-                continue
-    if vendas_list:
-        vendas_flat = pd.DataFrame(vendas_list)
-        vendas_flat["Data"] = pd.to_datetime(vendas_flat["Data"], errors="coerce")
-        ultima_venda = vendas_flat.groupby("IDProduto")["Data"].max().reset_index()
+    vendas_flat = df_itens[df_itens["Produto_ID"] != ""]
+    if not vendas_flat.empty:
+        datas_venda = pd.to_datetime(vendas_flat["Data"], errors="coerce")
+        ultima_venda = datas_venda.groupby(vendas_flat["Produto_ID"]).max().reset_index()
         ultima_venda.columns = ["IDProduto", "UltimaVenda"]
     else:
         ultima_venda = pd.DataFrame(columns=["IDProduto", "UltimaVenda"])
@@ -157,19 +142,34 @@ def relatorio_produtos():
             use_container_width=True, hide_index=True
         )
 
+    st.markdown("---")
+
+    st.markdown("#### 📅 Estoque em uma data")
+    data_consulta = st.date_input("Estoque no fim do dia", value=date.today(), key="data_estoque_em")
+    # Último snapshot até a data + movimentos seguintes, pelo livro de movimentos de estoque
+    estoque_na_data = estoque_em(data_consulta)
+    if estoque_na_data.empty:
+        st.info("Nenhum movimento de estoque registrado até esta data.")
+    else:
+        df_estoque_data = produtos[["ID", "Nome", "Quantidade"]].assign(ID=produtos["ID"].astype(str).str.strip())
+        df_estoque_data = df_estoque_data[df_estoque_data["ID"].isin(estoque_na_data.index)]
+        df_estoque_data = df_estoque_data.rename(columns={"Quantidade": "Atual"})
+        df_estoque_data.insert(2, "Na Data", df_estoque_data["ID"].map(estoque_na_data).astype(int))
+        st.dataframe(df_estoque_data, use_container_width=True, hide_index=True)
+
 
 def gestao_produtos():
     produtos = inicializar_produtos().copy()
     st.header("📦 Gestão de Produtos e Estoque")
 
-    # Evita sobrescrever o CSV remoto se não houver produtos
+    # O arquivo de produtos só é regravado quando um produto muda: vendas e estornos do Livro Caixa
+    # vão para o livro de movimentos de estoque, sem regravar o cadastro a cada exibição da página
     if produtos is not None and not produtos.empty:
         # Garante que a coluna exista antes de salvar (necessário para persistência)
         if "DescricaoLonga" not in produtos.columns:
             produtos["DescricaoLonga"] = ""
-        save_data_github_produtos(produtos, ARQ_PRODUTOS, COMMIT_MESSAGE_PROD)
     else:
-        st.warning("⚠️ Nenhum produto carregado — nada foi salvo no GitHub para evitar sobrescrita.")
+        st.warning("⚠️ Nenhum produto carregado.")
 
     tab_cadastro, tab_lista, tab_relatorio = st.tabs(["📝 Cadastro de Produtos", "📑 Lista & Busca", "📈 Relatório e Alertas"])
 
@@ -315,6 +315,8 @@ def gestao_produtos():
 
     with tab_lista:
         st.subheader("📑 Lista & Busca de Produtos")
+        # Grade lida uma vez (detalhes em colunas, variações agrupadas por PaiID e estoque somado por pai)
+        arvore = arvore_variacoes(produtos)
         with st.expander("🔍 Pesquisar produto", expanded=True):
             criterio = st.selectbox("Pesquisar por:", ["Nome", "Marca", "Código de Barras", "Valor", "Detalhe de Grade (Cor, Tamanho, etc.)"])
             termo = st.text_input("Digite para buscar:")
@@ -335,13 +337,7 @@ def gestao_produtos():
                         st.warning("Digite um número válido para buscar por valor.")
                         produtos_filtrados = produtos.copy()
                 elif criterio == "Detalhe de Grade (Cor, Tamanho, etc.)":
-                    def search_details(details_json):
-                        if pd.isna(details_json) or not details_json: return False
-                        try:
-                            details = ast.literal_eval(details_json) if isinstance(details_json, str) else details_json
-                            return any(termo_lower in str(v).lower() for v in details.values()) if isinstance(details, dict) else False
-                        except: return False
-                    produtos_filtrados = produtos[produtos["DetalhesGrade"].apply(search_details)]
+                    produtos_filtrados = produtos[arvore["busca"].str.contains(termo_lower, regex=False)]
             if "PaiID" not in produtos_filtrados.columns: produtos_filtrados["PaiID"] = None
             if "CashbackPercent" not in produtos_filtrados.columns: produtos_filtrados["CashbackPercent"] = 0.0
             if "DetalhesGrade" not in produtos_filtrados.columns: produtos_filtrados["DetalhesGrade"] = "{}"
@@ -358,13 +354,6 @@ def gestao_produtos():
             produtos_pai = produtos_filtrados[produtos_filtrados["PaiID"].isnull() | (produtos_filtrados["PaiID"] == '')]
             produtos_filho = produtos_filtrados[produtos_filtrados["PaiID"].notnull() & (produtos_filtrados["PaiID"] != '')]
 
-            def format_details(details_json):
-                if pd.isna(details_json) or not details_json: return "—"
-                try:
-                    details = ast.literal_eval(details_json) if isinstance(details_json, str) else details_json
-                    return "<br>".join([f"**{k.split('/')[0][:1]}:** {v}" for k, v in details.items() if v]) if isinstance(details, dict) else "—"
-                except: return "—"
-
             for index, pai in produtos_pai.iterrows():
                 with st.container(border=True):
                     c = st.columns([1, 3, 1, 1, 1.5, 1, 1.5, 0.5, 0.5])
@@ -374,9 +363,10 @@ def gestao_produtos():
                         except Exception: c[0].write("—")
                     else: c[0].write("—")
                     c[1].markdown(f"**{pai['Nome']}**<br><small>Marca: {pai['Marca']} | Cat: {pai['Categoria']}</small>", unsafe_allow_html=True)
-                    estoque_total = pai['Quantidade']
-                    filhos_do_pai = produtos_filho[produtos_filho["PaiID"] == str(pai["ID"])]
-                    if not filhos_do_pai.empty: estoque_total = filhos_do_pai['Quantidade'].sum()
+                    id_pai = str(pai["ID"]).strip()
+                    # Variações do pai pela árvore (só as que passaram pela busca); estoque total já somado
+                    filhos_do_pai = produtos_filho.loc[[r for r in arvore["filhos"].get(id_pai, []) if r in produtos_filho.index]]
+                    estoque_total = arvore["estoque_pai"].get(id_pai, pai['Quantidade'])
                     c[2].markdown(f"**{estoque_total}**")
 
                     validade_formatada = str(pai['Validade']) if pd.notna(pai['Validade']) else "—"
@@ -390,12 +380,12 @@ def gestao_produtos():
                         valor_cashback = pv * (cashback_pai / 100)
                         c[5].markdown(f'**{cashback_pai:.1f}%**<br><small>R$ {f"{valor_cashback:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")}</small>', unsafe_allow_html=True)
                     else: c[5].write("—")
-                    c[6].markdown(format_details(pai.get('DetalhesGrade', None)), unsafe_allow_html=True)
+                    c[6].markdown(arvore["resumo"].get(index, "—"), unsafe_allow_html=True)
                     eid = str(pai["ID"])
                     if c[7].button("✏️", key=f"edit_pai_{index}_{eid}", help="Editar produto"): st.session_state["edit_prod"] = eid; st.rerun()
                     if c[8].button("🗑️", key=f"del_pai_{index}_{eid}", help="Excluir produto"):
                         products = produtos[(produtos["ID"] != eid) & (produtos["PaiID"] != eid)]
-                        st.session_state["produtos"] = products
+                        substituir_produtos_sessao(products, removidos=[eid, *indice_produtos_sessao().filhos(eid)])
                         if salvar_produtos_no_github(products, f"Exclusão do produto pai {pai.get('Nome', 'Desconhecido')}"): inicializar_produtos.clear()
                         st.rerun()
                     if not filhos_do_pai.empty:
@@ -418,12 +408,12 @@ def gestao_produtos():
                                     valor_cashback_var = pv_var * (cashback_var / 100)
                                     c_var[5].markdown(f'**{cashback_var:.1f}%**<br><small>R$ {f"{valor_cashback_var:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")}</small>', unsafe_allow_html=True)
                                 else: c_var[5].write("—")
-                                c_var[6].markdown(format_details(var.get('DetalhesGrade', None)), unsafe_allow_html=True)
+                                c_var[6].markdown(arvore["resumo"].get(index_var, "—"), unsafe_allow_html=True)
                                 eid_var = str(var["ID"])
                                 if c_var[7].button("✏️", key=f"edit_filho_{index_var}_{eid_var}", help="Editar variação"): st.session_state["edit_prod"] = eid_var; st.rerun()
                                 if c_var[8].button("🗑️", key=f"del_filho_{index_var}_{eid_var}", help="Excluir variação"):
                                     products = produtos[produtos["ID"] != eid_var]
-                                    st.session_state["produtos"] = products
+                                    substituir_produtos_sessao(products, removidos=[eid_var])
                                     if salvar_produtos_no_github(products, f"Exclusão da variação {var.get('Nome', 'Desconhecida')}"): inicializar_produtos.clear()
                                     st.rerun()
 
@@ -433,15 +423,7 @@ def gestao_produtos():
                 if not row_df.empty:
                     row = row_df.iloc[0]
                     st.subheader(f"Editar produto ID: {eid} ({row['Nome']})")
-                    current_details_grade = {}
-                    try:
-                        details_str = row.get("DetalhesGrade", "{}")
-                        if pd.notna(details_str) and isinstance(details_str, str):
-                            current_details_grade = ast.literal_eval(details_str)
-                        elif isinstance(details_str, dict):
-                            current_details_grade = details_str
-                    except:
-                        pass # Mantém current_details_grade como {}
+                    current_details_grade = ler_detalhes_grade(row.get("DetalhesGrade", "{}"))
 
                     c1, c2, c3 = st.columns(3)
                     with c1:
@@ -520,6 +502,8 @@ def gestao_produtos():
                         # Converte o status do toggle (True/False) para o texto ("SIM"/"NAO") a ser salvo
                         valor_turbo_para_salvar = "SIM" if novo_status_turbo else "NAO"
 
+                        # Marca/Categoria são category: um nome novo precisa entrar nas categorias antes da atribuição
+                        produtos = adicionar_categorias(produtos, {"Marca": nova_marca.strip(), "Categoria": nova_cat.strip()})
                         # Adicione "PromocaoEspecial" à lista de colunas e o valor_turbo_para_salvar à lista de valores
                         produtos.loc[produtos["ID"] == str(eid), 
                                      ["Nome", "Marca", "Categoria", "Quantidade", "PrecoCusto", 
@@ -534,8 +518,17 @@ def gestao_produtos():
                                           valor_turbo_para_salvar # <- VALOR ADICIONADO
                                           ]
 
-                        st.session_state["produtos"] = produtos
-                        if salvar_produtos_no_github(produtos, "Atualizando produto"): inicializar_produtos.clear()
+                        # Mudança de quantidade na edição entra no livro de movimentos como ajuste manual,
+                        # gravado junto com o produto: se um falhar, a edição inteira não vale
+                        qtd_anterior = int(row["Quantidade"])
+                        ajuste = linhas_movimento(
+                            {"ajuste": [(str(eid), int(nova_qtd) - qtd_anterior)]}, origem="gestao_produtos",
+                            observacao=f"Edição do produto {novo_nome.strip()}", saldo_anterior={str(eid): qtd_anterior}
+                        )
+                        if not salvar_produtos_no_github(produtos, "Atualizando produto", movimentos=ajuste):
+                            st.error("❌ Edição não salva: produto e estoque continuam como estavam.")
+                            st.stop()
+                        substituir_produtos_sessao(produtos, editados=[eid])
                         del st.session_state["edit_prod"]
                         st.rerun()
 
@@ -4,15 +4,12 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")
 import streamlit as st
 import pandas as pd
 from datetime import date, datetime, timedelta
-import json
-import ast
 import hashlib
 import plotly.express as px
 
 from utils import (
     inicializar_produtos,
     carregar_livro_caixa,
-    ajustar_estoque,
     to_float,
     salvar_produtos_no_github,
     parse_date_yyyy_mm_dd,
@@ -22,6 +19,7 @@ from utils import (
     salvar_promocoes_no_github,
 )
 from constants_and_css import FATOR_CARTAO
+from vendas_utils import itens_venda
 
 
 def gestao_promocoes():
@@ -40,28 +38,10 @@ def gestao_promocoes():
 
     # Carrega o livro caixa para análise de produtos parados
     df_movimentacoes = carregar_livro_caixa()
-    vendas = df_movimentacoes[df_movimentacoes["Tipo"] == "Entrada"].copy() 
-
-    vendas_list = []
-    for _, row in vendas.iterrows():
-        produtos_json = row.get("Produtos Vendidos") 
-        if pd.notna(produtos_json) and produtos_json:
-            try:
-                try:
-                    items = json.loads(produtos_json)
-                except (json.JSONDecodeError, TypeError):
-                    items = ast.literal_eval(produtos_json)
-                if isinstance(items, list):
-                    for item in items:
-                        produto_id = str(item.get("Produto_ID"))
-                        if produto_id and produto_id != "None":
-                            vendas_list.append(
-                                {"Data": parse_date_yyyy_mm_dd(row["Data"]), "IDProduto": produto_id}
-                            )
-            except Exception:
-                continue
-
-    vendas_flat = pd.DataFrame(vendas_list, columns=["Data", "IDProduto"]) if vendas_list else pd.DataFrame(columns=["Data", "IDProduto"])
+    df_itens = itens_venda(df_movimentacoes)
+    vendas_flat = df_itens.loc[df_itens["Produto_ID"] != "", ["Data", "Produto_ID"]].rename(
+        columns={"Produto_ID": "IDProduto"}
+    )
 
     # --- CADASTRAR ---
     with st.expander("➕ Cadastrar promoção", expanded=False):
@@ -9,6 +9,8 @@ import io, os
 import json
 import hashlib
 import ast
+import uuid
+import numpy as np
 import plotly.express as px
 import base64
 import calendar 
@@ -16,6 +18,31 @@ from datetime import datetime, date
 
 # Note: Assumindo que constants_and_css está importando render_utils, caso contrário, será necessário corrigir.
 from constants_and_css import * # Importação explícita de funções de renderização para garantir que estão definidas
+from storage_utils import get_storage
+from gravacao_utils import enfileirar_commit
+from cache_utils import buscar_csv_com_cache, depende_de, invalidar_arquivos
+from snapshot_utils import snapshot
+from dinheiro_utils import aplicar_taxa, arredondar_reais, centavos, para_centavos, para_reais
+from estoque_utils import (
+    aplicar_estoque_do_livro, anexar_movimentos, indice_produtos_sessao, mensagem_estoque_insuficiente,
+    movimentos_de_itens, preparar_transacao_estoque, substituir_produtos_sessao
+)
+from schema_utils import (
+    ESQUEMA_COMPRAS, ESQUEMA_LIVRO_CAIXA, aplicar_categorias, aplicar_esquema, converter_coluna, converter_datas,
+    ler_csv_rapido, projetar_para_gravacao
+)
+from http_utils import github_repo, http_post
+from vendas_utils import (
+    carregar_itens_venda, itens_venda, itens_venda_para_gravar, itens_venda_mensais, itens_da_transacao,
+    chaves_vendas, extrair_itens, ler_produtos_vendidos
+)
+from ledger_utils import (
+    nome_particao, marcar_particoes_alteradas, particoes_alteradas, limpar_particoes_alteradas, baixar_particoes,
+    ARQ_MANIFESTO, buscar_manifesto, manifesto_da_listagem, atualizar_manifesto, registrar_manifesto, manifesto_para_json,
+    SaldoAcumulado, saldo_acumulado_sessao, atualizar_saldo_sessao,
+    ARQ_ROLLUP, tipar_rollup, ler_rollup_csv, calcular_rollup, atualizar_rollup, rollup_dos_meses, rollup_para_csv,
+    registrar_rollup, rollup_em_memoria, resumo_comparativo, derivado_por_mes, ler_derivado_mensal
+)
 try:
     from render_utils import render_global_config, render_custom_header
 except ImportError:
@@ -48,6 +75,9 @@ ARQ_PROMOCOES = "promocoes.csv"
 ARQ_COMPRAS = "historico_compras.csv"         
 # Nome do arquivo de produtos/estoque
 ARQ_PRODUTOS = "produtos_estoque.csv" 
+# Base raw dos CSVs mensais e manifesto das partições do Livro Caixa
+URL_RAW_LIVRO_CAIXA = f"https://raw.githubusercontent.com/{OWNER}/{REPO_NAME}/{BRANCH}/"
+URL_MANIFESTO_LIVRO_CAIXA = f"{URL_RAW_LIVRO_CAIXA}{ARQ_MANIFESTO}"
 
 # NOVO: Constante para o arquivo de clientes
 
@@ -83,15 +113,6 @@ render_global_config()
 # FUNÇÕES CORE (Mantidas e verificadas para persistência)
 # ==============================================================================
 
-try:
-    from github import Github
-except ImportError:
-    class Github:
-        def __init__(self, token): pass
-        def get_repo(self, repo_name): return self
-        def update_file(self, path, msg, content, sha, branch): pass
-        def create_file(self, path, msg, content, branch): pass
-
 def get_livro_caixa_path(data_transacao: date) -> str:
     """Retorna o nome do arquivo CSV formatado como livro_caixa_AAAA_MM.csv."""
     if isinstance(data_transacao, str):
@@ -112,7 +133,7 @@ def ler_codigo_barras_api(image_bytes):
     
     try:
         files = {"f": ("barcode.png", image_bytes, "image/png")}
-        response = requests.post(URL_DECODER_ZXING, files=files, timeout=30)
+        response = http_post(URL_DECODER_ZXING, files=files, timeout=30)
         if response.status_code != 200:
             if 'streamlit' in globals(): st.error(f"❌ Erro na API ZXing. Status HTTP: {response.status_code}")
             return []
@@ -172,11 +193,12 @@ def get_livro_caixa_path(data_transacao: date) -> str:
     ano_mes = data_transacao.strftime('%Y_%m')
     return f"livro_caixa_{ano_mes}.csv"
 
+def _ler_csv_livro_caixa(texto: str) -> pd.DataFrame:
+    return ler_csv_rapido(texto, sep=",")
+
 def load_csv_github(url: str) -> pd.DataFrame | None:
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        df = pd.read_csv(StringIO(response.text), dtype=str)
+        df = buscar_csv_com_cache(url, _ler_csv_livro_caixa)
         if df.empty or len(df.columns) < 2:
             return None
         return df
@@ -192,7 +214,8 @@ def parse_date_yyyy_mm_dd(date_str):
     except:
         return None
 
-@st.cache_data(show_spinner="Carregando promoções...")
+@depende_de(ARQ_PROMOCOES)
+@snapshot(show_spinner="Carregando promoções...")
 def carregar_promocoes():
     COLUNAS_PROMO = ["ID", "IDProduto", "NomeProduto", "Desconto", "DataInicio", "DataFim"]
     url_raw = f"https://raw.githubusercontent.com/{OWNER}/{REPO_NAME}/{BRANCH}/{ARQ_PROMOCOES}"
@@ -231,23 +254,59 @@ def norm_promocoes(df):
     
     return df
 
-@st.cache_data(show_spinner="Carregando histórico de compras...")
+@depende_de(ARQ_COMPRAS)
+@snapshot(show_spinner="Carregando histórico de compras...")
 def carregar_historico_compras():
     url_raw = f"https://raw.githubusercontent.com/{OWNER}/{REPO_NAME}/{BRANCH}/{ARQ_COMPRAS}"
     df = load_csv_github(url_raw)
-    if df is None or df.empty:
-        df = pd.DataFrame(columns=COLUNAS_COMPRAS)
-    for col in COLUNAS_COMPRAS:
-        if col not in df.columns:
-            df[col] = "" 
-    return df[[col for col in COLUNAS_COMPRAS if col in df.columns]]
+    # Nomes/colunas pelo esquema; os valores continuam texto (a tela converte o que exibe)
+    return aplicar_esquema(df if df is not None and not df.empty else None, ESQUEMA_COMPRAS, tipar=False)
+
+def _concluir_estoque(estoque: dict | None):
+    """Depois da gravação: a sessão passa a usar o estoque movimentado (o livro de movimentos já foi gravado)."""
+    if estoque is None:
+        return
+    substituir_produtos_sessao(estoque["produtos"])
 
-def salvar_dados_no_github(df_completo: pd.DataFrame, commit_message: str, data_transacao: date):
+def salvar_dados_no_github(df_completo: pd.DataFrame, commit_message: str, data_transacao: date | None = None,
+                           estoque: dict | None = None):
     """
-    Salva os dados de todas as movimentações no Livro Caixa, reescrevendo todos
-    os arquivos CSV mensais necessários para garantir a integridade dos dados.
+    Salva as movimentações do Livro Caixa reescrevendo APENAS os arquivos CSV mensais
+    marcados como alterados na sessão (marcar_particoes_alteradas) mais o mês de `data_transacao`.
+    Sem nenhuma marcação, reescreve todos os meses presentes no DataFrame.
+    No backend SQLite o Livro Caixa é uma única tabela (indexada por Data), sem arquivos mensais.
+    Com `estoque` (preparar_transacao_estoque), os movimentos de estoque vão para o fim do livro de movimentos
+    no mesmo commit no GitHub ou na mesma transação no banco local; o arquivo de produtos não é regravado.
+    Só depois disso a sessão passa a usar o estoque movimentado.
     """
-    
+
+    # Meses a regravar: os marcados na sessão + o mês da transação informada
+    particoes = particoes_alteradas()
+    if data_transacao is not None and nome_particao(data_transacao):
+        particoes.add(nome_particao(data_transacao))
+
+    storage = get_storage()
+    if storage.local:
+        try:
+            # Só as colunas canônicas: saldo, cor, índices e Data_dt são recalculados na leitura
+            df_salvar = projetar_para_gravacao(df_completo, ESQUEMA_LIVRO_CAIXA)
+            with storage.transacao():
+                storage.gravar(PATH_DIVIDAS, df_salvar, commit_message)
+                df_itens = itens_venda_para_gravar(df_salvar)
+                if df_itens is not None:
+                    storage.gravar(ARQ_ITENS_VENDA, df_itens, commit_message)
+                _gravar_rollup_local(storage, df_salvar, particoes, commit_message)
+                if estoque is not None:
+                    anexar_movimentos(estoque["movimentos"], commit_message)
+            limpar_particoes_alteradas(particoes)
+            _concluir_estoque(estoque)
+            invalidar_arquivos(PATH_DIVIDAS, ARQ_ITENS_VENDA, ARQ_ROLLUP)
+            st.success(f"📁 Movimentações salvas no {storage.nome}!")
+            return True
+        except Exception as e:
+            st.error(f"❌ Erro ao salvar no {storage.nome}: {e}")
+            return False
+
     # 1. Prepara o DataFrame para iteração e filtragem
     df_temp_data = df_completo.copy()
     
@@ -255,30 +314,19 @@ def salvar_dados_no_github(df_completo: pd.DataFrame, commit_message: str, data_
     df_temp_data['Data_dt'] = pd.to_datetime(df_temp_data['Data'], errors='coerce')
     df_temp_data.dropna(subset=['Data_dt'], inplace=True)
     
-    # Identifica todos os meses únicos que precisam de atualização
-    unique_months = df_temp_data['Data_dt'].dt.to_period('M').unique()
-    
     try:
-        from github import Github
-        g = Github(TOKEN)
-        repo = g.get_repo(f"{OWNER}/{REPO_NAME}")
-        
-        updated_files_count = 0
-        
-        # 2. Itera sobre cada mês único presente no DataFrame e salva o arquivo
-        for month_period in unique_months:
-            
-            target_year = month_period.year
-            target_month = month_period.month
+        # 2. Gera o CSV de cada mês alterado
+        arquivos_mensais = {}
+        dfs_mensais = {}
+        grupos_mensais = {}
+        for month_period, df_mes_especifico in df_temp_data.groupby(df_temp_data['Data_dt'].dt.to_period('M')):
             
             # Determina o nome do arquivo: Ex: "livro_caixa_2025_10.csv"
-            file_path = f"livro_caixa_{target_year}_{target_month:02d}.csv"
-            
-            # Filtra o DataFrame para conter APENAS os dados daquele mês
-            df_mes_especifico = df_temp_data[
-                (df_temp_data['Data_dt'].dt.year == target_year) &
-                (df_temp_data['Data_dt'].dt.month == target_month)
-            ].copy()
+            file_path = f"livro_caixa_{month_period.year}_{month_period.month:02d}.csv"
+            grupos_mensais[file_path] = df_mes_especifico
+            if particoes and file_path not in particoes:
+                continue # Mês intocado: o arquivo no GitHub já está correto
+            df_mes_especifico = df_mes_especifico.copy()
 
             # Prepara as colunas de data para serem salvas como string 'YYYY-MM-DD'
             for col_date in ['Data', 'Data Pagamento']:
@@ -288,29 +336,56 @@ def salvar_dados_no_github(df_completo: pd.DataFrame, commit_message: str, data_
                         lambda x: x.strftime('%Y-%m-%d') if pd.notnull(x) else ''
                     )
             
-            # Remove a coluna auxiliar de datetime
-            df_mes_especifico.drop(columns=['Data_dt'], errors='ignore', inplace=True)
-
-            # Gera o conteúdo CSV
-            csv_string = df_mes_especifico.to_csv(index=False, encoding="utf-8-sig")
-
-            try:
-                # Tenta obter o conteúdo do arquivo mensal atual
-                contents = repo.get_contents(file_path, ref=BRANCH)
-                # Se o arquivo já existe, atualiza-o
-                repo.update_file(contents.path, commit_message, csv_string, contents.sha, branch=BRANCH)
-                updated_files_count += 1
-            except Exception:
-                # Se o arquivo não existe, cria um novo
-                repo.create_file(file_path, commit_message, csv_string, branch=BRANCH)
-                updated_files_count += 1
+            # Só as colunas canônicas (sai a Data_dt auxiliar e qualquer coluna de exibição)
+            df_mes_especifico = projetar_para_gravacao(df_mes_especifico, ESQUEMA_LIVRO_CAIXA)
+
+            arquivos_mensais[file_path] = df_mes_especifico.to_csv(index=False, encoding="utf-8-sig")
+            dfs_mensais[file_path] = df_mes_especifico
+
+        # Mês alterado que ficou sem linhas (ex.: última movimentação excluída): grava só o cabeçalho
+        colunas_csv = ESQUEMA_LIVRO_CAIXA["colunas"]
+        for file_path in particoes - set(arquivos_mensais):
+            arquivos_mensais[file_path] = pd.DataFrame(columns=colunas_csv).to_csv(index=False, encoding="utf-8-sig")
+
+        # Manifesto: atualiza só as entradas dos meses regravados (na 1ª vez, monta a partir da listagem)
+        manifesto = buscar_manifesto(URL_MANIFESTO_LIVRO_CAIXA)
+        if manifesto is None:
+            repo = github_repo(TOKEN, f"{OWNER}/{REPO_NAME}")
+            shas = {c.name: c.sha for c in repo.get_contents("", ref=BRANCH)
+                    if c.name.startswith("livro_caixa_") and c.name.endswith(".csv")}
+            manifesto = manifesto_da_listagem(shas, grupos_mensais)
+        manifesto = atualizar_manifesto(manifesto, arquivos_mensais, dfs_mensais, derivados=[ARQ_ITENS_VENDA, ARQ_ROLLUP])
+        meses_gravados = set(arquivos_mensais)
+        updated_files_count = len(meses_gravados)
+        arquivos_mensais[ARQ_MANIFESTO] = manifesto_para_json(manifesto)
+
+        # Itens de venda normalizados, por mês (itens_venda_AAAA_MM.csv): só os meses regravados vão no commit
+        for nome, df_itens_mes in itens_venda_mensais(df_completo, meses_gravados).items():
+            arquivos_mensais[nome] = df_itens_mes.to_csv(index=False, encoding="utf-8-sig")
+
+        # Agregados do relatório comparativo: recalcula e grava (rollup_livro_caixa_AAAA_MM.csv) só os meses regravados
+        rollup = atualizar_rollup(carregar_rollup_livro_caixa(), df_completo, meses_gravados)
+        for nome, rollup_mes in derivado_por_mes(rollup, ARQ_ROLLUP, meses_gravados).items():
+            arquivos_mensais[nome] = rollup_para_csv(rollup_mes)
+
+        # Movimentos de estoque da venda/estorno: no mesmo commit, nunca um sem o outro
+        if estoque is not None:
+            anexar_movimentos(estoque["movimentos"], commit_message, arquivos_commit=arquivos_mensais)
+
+        # Todos os meses (e o manifesto) vão em UM único commit, feito em segundo plano pela fila de gravação
+        job_id = enfileirar_commit(TOKEN, OWNER, REPO_NAME, BRANCH, arquivos_mensais, commit_message)
+        registrar_manifesto(manifesto)
+        registrar_rollup(rollup, manifesto)
+        # Os meses só saem de vez das marcas quando o commit for confirmado (voltam se a fila descartar o job)
+        limpar_particoes_alteradas(meses_gravados, job_id=job_id)
+        _concluir_estoque(estoque)
 
         # 3. Finaliza a operação
         
-        # Limpa o cache para forçar a releitura de todos os arquivos na próxima vez
-        carregar_livro_caixa.clear()
+        # Limpa só os caches que dependem dos arquivos gravados (livro caixa, itens e agregados)
+        invalidar_arquivos(PATH_DIVIDAS, ARQ_ITENS_VENDA, ARQ_ROLLUP)
         
-        st.success(f"📁 Movimentações salvas e sincronizadas! ({updated_files_count} arquivo(s) mensal(is) atualizado(s) no GitHub.)")
+        st.success(f"📁 Movimentações salvas! ({updated_files_count} arquivo(s) mensal(is) sendo enviado(s) ao GitHub em segundo plano.)")
         return True
 
     except Exception as e:
@@ -319,39 +394,115 @@ def salvar_dados_no_github(df_completo: pd.DataFrame, commit_message: str, data_
         return False
 
 
-@st.cache_data(show_spinner="Carregando dados de todos os meses...")
+def _gravar_rollup_local(storage, df_livro: pd.DataFrame, particoes, commit_message: str):
+    """
+    Banco local: troca só as linhas dos meses das partições (DELETE ... WHERE MesAno IN + INSERT).
+    Tabela ainda vazia ou salvamento sem partições: grava o rollup inteiro.
+    """
+    if particoes and storage.tem_dados(ARQ_ROLLUP):
+        meses, recalculado = rollup_dos_meses(df_livro, particoes)
+        storage.substituir(ARQ_ROLLUP, recalculado, "MesAno", meses, commit_message)
+    else:
+        storage.gravar(ARQ_ROLLUP, atualizar_rollup(carregar_rollup_livro_caixa(), df_livro, particoes), commit_message)
+
+
+def registrar_movimentacao(df_completo: pd.DataFrame, nova_movimentacao: dict, commit_message: str, data_transacao: date,
+                           estoque: dict | None = None):
+    """
+    Persiste UMA nova movimentação. No banco local faz apenas INSERTs;
+    no GitHub regrava os arquivos mensais via salvar_dados_no_github.
+    Banco local ainda vazio (histórico só no GitHub): a primeira gravação semeia a tabela com o
+    df_completo inteiro, também via salvar_dados_no_github; só depois as novas linhas viram INSERT.
+    Os movimentos de `estoque` (preparar_transacao_estoque) vão junto, como em salvar_dados_no_github.
+    """
+    storage = get_storage()
+    if not storage.local or not storage.tem_dados(PATH_DIVIDAS):
+        return salvar_dados_no_github(df_completo, commit_message, data_transacao, estoque=estoque)
+    try:
+        with storage.transacao():
+            storage.inserir(PATH_DIVIDAS, pd.DataFrame([nova_movimentacao]), commit_message)
+            if storage.tem_dados(ARQ_ITENS_VENDA):
+                df_itens_novos = extrair_itens(chaves_vendas(pd.DataFrame([nova_movimentacao])))
+                if not df_itens_novos.empty:
+                    storage.inserir(ARQ_ITENS_VENDA, df_itens_novos, commit_message)
+            else:
+                # Tabela de itens ainda não semeada: grava os itens de todas as vendas, não só desta
+                df_itens = itens_venda_para_gravar(projetar_para_gravacao(df_completo, ESQUEMA_LIVRO_CAIXA))
+                if df_itens is not None:
+                    storage.gravar(ARQ_ITENS_VENDA, df_itens, commit_message)
+            _gravar_rollup_local(storage, df_completo, [nome_particao(data_transacao)], commit_message)
+            if estoque is not None:
+                anexar_movimentos(estoque["movimentos"], commit_message)
+        limpar_particoes_alteradas([nome_particao(data_transacao)])
+        _concluir_estoque(estoque)
+        invalidar_arquivos(PATH_DIVIDAS, ARQ_ITENS_VENDA, ARQ_ROLLUP)
+        st.success(f"📁 Movimentação registrada no {storage.nome}!")
+        return True
+    except Exception as e:
+        st.error(f"❌ Erro ao salvar no {storage.nome}: {e}")
+        return False
+
+
+@depende_de(PATH_DIVIDAS)
+@snapshot(show_spinner="Carregando dados de todos os meses...")
 def carregar_livro_caixa():
     """
     Busca todos os arquivos CSV mensais do Livro Caixa no GitHub (padrão: livro_caixa_AAAA_MM.csv),
     combina-os em um único DataFrame e garante que todas as colunas padrão existam.
     """
     all_monthly_dfs = []
-    
-    try:
-        # Usamos a biblioteca PyGithub para listar os arquivos do repositório
-        # ... (restante do código de busca do GitHub) ...
-        g = Github(TOKEN)
-        repo = g.get_repo(f"{OWNER}/{REPO_NAME}")
-        contents = repo.get_contents("", ref=BRANCH) # Pega o conteúdo da pasta raiz
-        
-        # Filtra a lista de conteúdo para encontrar apenas os arquivos CSV do livro caixa
-        csv_files = [c for c in contents if c.name.startswith("livro_caixa_") and c.name.endswith(".csv")]
-        
-        if not csv_files:
-            # Se nenhum arquivo for encontrado, retorna um DataFrame vazio com a estrutura correta
-            return pd.DataFrame(columns=COLUNAS_PADRAO_COMPLETO)
-            
-        # Itera sobre os arquivos encontrados e carrega os dados de cada um
-        for file in csv_files:
-            url_raw = file.download_url
-            df_monthly = load_csv_github(url_raw) # Reutiliza a função de carregamento individual
-            if df_monthly is not None and not df_monthly.empty:
-                all_monthly_dfs.append(df_monthly)
 
-    except Exception as e:
-        # 1. Trata a exceção (opcional: pode logar ou mostrar um erro no Streamlit)
-        # st.error(f"Erro ao carregar arquivos do GitHub: {e}")
-        pass # Apenas ignora o erro e tenta continuar/retornar um DF vazio.
+    storage = get_storage()
+    if storage.local:
+        try:
+            df_local = storage.ler(PATH_DIVIDAS)
+            if df_local is not None and not df_local.empty:
+                all_monthly_dfs.append(df_local)
+        except Exception as e:
+            st.error(f"❌ Erro ao ler o Livro Caixa do {storage.nome}: {e}")
+
+    # Banco local vazio: busca os CSVs mensais do GitHub (a primeira gravação popula o banco)
+    if not all_monthly_dfs:
+        try:
+            # O manifesto diz quais meses existem; sem ele, lista a raiz do repositório (modo antigo)
+            manifesto = buscar_manifesto(URL_MANIFESTO_LIVRO_CAIXA)
+            if manifesto is not None:
+                urls_mensais = {
+                    nome: f"{URL_RAW_LIVRO_CAIXA}{nome}"
+                    for nome, info in manifesto["particoes"].items() if info.get("linhas") != 0
+                }
+                shas = None
+            else:
+                # Usamos a biblioteca PyGithub para listar os arquivos do repositório
+                repo = github_repo(TOKEN, f"{OWNER}/{REPO_NAME}")
+                contents = repo.get_contents("", ref=BRANCH) # Pega o conteúdo da pasta raiz
+            
+                # Filtra a lista de conteúdo para encontrar apenas os arquivos CSV do livro caixa
+                csv_files = [c for c in contents if c.name.startswith("livro_caixa_") and c.name.endswith(".csv")]
+                urls_mensais = {c.name: c.download_url for c in csv_files}
+                shas = {c.name: c.sha for c in csv_files}
+        
+            if not urls_mensais:
+                # Se nenhum arquivo for encontrado, retorna um DataFrame vazio com a estrutura correta
+                return pd.DataFrame(columns=COLUNAS_PADRAO_COMPLETO)
+            
+            # Baixa todos os meses em paralelo (tempo ~ o do arquivo mais lento) e concatena uma vez só.
+            # SHAs da listagem (atuais no repositório): mês sem mudança sai do snapshot Parquet, sem download.
+            # Os do manifesto não servem para isso (uma edição manual do CSV não atualiza o manifesto).
+            dfs_mensais, falhas = baixar_particoes(urls_mensais, _ler_csv_livro_caixa, shas=shas)
+            if shas is not None:
+                # Guarda o manifesto montado da listagem; ele é gravado no próximo salvamento
+                registrar_manifesto(manifesto_da_listagem(shas, dfs_mensais))
+            for df_monthly in dfs_mensais.values():
+                if not df_monthly.empty and len(df_monthly.columns) >= 2:
+                    all_monthly_dfs.append(df_monthly)
+            if falhas:
+                st.warning(f"⚠️ {len(falhas)} arquivo(s) mensal(is) não carregado(s): {', '.join(falhas)}. Os demais meses foram carregados.")
+
+        except Exception as e:
+            # 1. Trata a exceção (opcional: pode logar ou mostrar um erro no Streamlit)
+            # st.error(f"Erro ao carregar arquivos do GitHub: {e}")
+            pass # Apenas ignora o erro e tenta continuar/retornar um DF vazio.
 
     # 2. Lógica de RETORNO da função (DEVE ESTAR FORA DO 'try/except')
     if not all_monthly_dfs:
@@ -371,8 +522,43 @@ def carregar_livro_caixa():
     cols_to_return = COLUNAS_PADRAO_COMPLETO
     return df_final[[col for col in cols_to_return if col in df_final.columns]]
 
+@depende_de(ARQ_ROLLUP, PATH_DIVIDAS)
+@snapshot()
+def carregar_rollup_livro_caixa() -> pd.DataFrame:
+    """
+    Agregados do relatório comparativo (dia × loja × tipo × categoria): tabela do banco local,
+    cópia do último salvamento deste processo ou arquivos mensais no GitHub.
+    Se ainda não existirem, são calculados uma vez a partir do Livro Caixa completo.
+    """
+    storage = get_storage()
+    if storage.local:
+        try:
+            df_rollup = storage.ler(ARQ_ROLLUP)
+            if df_rollup is not None:
+                return tipar_rollup(df_rollup)
+        except Exception as e:
+            st.error(f"❌ Erro ao ler os agregados do {storage.nome}: {e}")
+    else:
+        manifesto = buscar_manifesto(URL_MANIFESTO_LIVRO_CAIXA)
+        rollup = rollup_em_memoria(manifesto)
+        if rollup is not None:
+            return rollup.copy()
+        try:
+            # Versões mensais (rollup_livro_caixa_AAAA_MM.csv) + arquivo único antigo dos meses ainda não regravados
+            rollup = ler_derivado_mensal(ARQ_ROLLUP, manifesto, lambda nome: f"{URL_RAW_LIVRO_CAIXA}{nome}", ler_rollup_csv)
+            if rollup is not None:
+                return tipar_rollup(rollup)
+        except Exception:
+            pass  # Arquivos ainda não criados: calcula abaixo
+    return calcular_rollup(carregar_livro_caixa())
+
 @st.cache_data(show_spinner=False)
-def processar_dataframe(df):
+def processar_dataframe(df, calcular_saldo: bool = True):
+    """
+    Normaliza tipos e colunas auxiliares do Livro Caixa.
+    Com calcular_saldo=False a coluna 'Saldo Acumulado' fica zerada para ser preenchida
+    pela estrutura incremental da sessão (saldo_acumulado_sessao).
+    """
     for col in COLUNAS_PADRAO:
         if col not in df.columns: df[col] = ""
     for col in ["RecorrenciaID", "TransacaoPaiID"]:
@@ -380,12 +566,14 @@ def processar_dataframe(df):
 
     if df.empty: return pd.DataFrame(columns=COLUNAS_COMPLETAS_PROCESSADAS)
     df_proc = df.copy()
-    df_proc["Valor"] = pd.to_numeric(df_proc["Valor"], errors="coerce").fillna(0.0)
-    df_proc["Data"] = pd.to_datetime(df_proc["Data"], errors='coerce').dt.date
+    formatos = ESQUEMA_LIVRO_CAIXA["formatos_data"]
+    # Valor exato em centavos (aceita também "1.234,56"); a coluna continua em reais para exibição
+    df_proc["Valor"] = para_reais(para_centavos(df_proc["Valor"]))
     
     # --- INÍCIO DA CORREÇÃO ---
-    # 1. Converte a coluna 'Data' para datetime
-    df_proc["Data_dt"] = pd.to_datetime(df_proc["Data"], errors='coerce')
+    # 1. Converte a coluna 'Data' para datetime (uma vez, pelo formato do esquema; o dia vira 'Data')
+    df_proc["Data_dt"] = converter_datas(df_proc["Data"], formatos["Data"]).dt.normalize()
+    df_proc["Data"] = df_proc["Data_dt"].dt.date
     
     # 2. Remove a linha que estava descartando os registros (dropna)
     # df_proc.dropna(subset=['Data_dt'], inplace=True) 
@@ -396,38 +584,37 @@ def processar_dataframe(df):
 
     # --- FIM DA CORREÇÃO ---
     
-    df_proc["Data Pagamento"] = pd.to_datetime(df_proc["Data Pagamento"], errors='coerce').dt.date
+    df_proc["Data Pagamento"] = converter_coluna(df_proc["Data Pagamento"], "data", formatos["Data Pagamento"])
     
     df_proc = df_proc.reset_index(drop=False)
     df_proc.rename(columns={'index': 'original_index'}, inplace=True)
     df_proc['Saldo Acumulado'] = 0.0
     
     # A lógica do saldo permanece a mesma, usando apenas 'Realizada' para o cálculo.
-    df_realizadas = df_proc[df_proc['Status'] == 'Realizada'].copy()
-    if not df_realizadas.empty:
-        df_realizadas_sorted_asc = df_realizadas.sort_values(by=['Data_dt', 'original_index'], ascending=[True, True]).reset_index(drop=True)
-        df_realizadas_sorted_asc['TEMP_SALDO'] = df_realizadas_sorted_asc['Valor'].cumsum()
-        df_proc = pd.merge(df_proc, df_realizadas_sorted_asc[['original_index', 'TEMP_SALDO']], on='original_index', how='left')
-        df_proc['Saldo Acumulado'] = df_proc['TEMP_SALDO'].fillna(method='ffill').fillna(0)
-        df_proc.drop(columns=['TEMP_SALDO'], inplace=True, errors='ignore')
+    if calcular_saldo:
+        df_proc['Saldo Acumulado'] = SaldoAcumulado.construir(df_proc).coluna_saldo(df_proc)
         
     df_proc = df_proc.sort_values(by="Data_dt", ascending=False).reset_index(drop=True)
     df_proc.insert(0, 'ID Visível', df_proc.index + 1)
-    df_proc['Cor_Valor'] = df_proc.apply(lambda row: 'green' if row['Tipo'] == 'Entrada' and row['Valor'] >= 0 else 'red', axis=1)
+    df_proc['Cor_Valor'] = pd.Categorical(
+        np.where((df_proc['Tipo'] == 'Entrada') & (df_proc['Valor'] >= 0), 'green', 'red'), categories=['green', 'red']
+    )
     
     # Adiciona TransacaoPaiID para processamento
     if 'TransacaoPaiID' not in df_proc.columns:
         df_proc['TransacaoPaiID'] = ''
-        
-    return df_proc
+
+    # Loja, Tipo, Status, Forma de Pagamento e Categoria como category (um valor por categoria, não por linha)
+    return aplicar_categorias(df_proc, ESQUEMA_LIVRO_CAIXA)
 
 def calcular_resumo(df):
     df_realizada = df[df['Status'] == 'Realizada']
     if df_realizada.empty: return 0.0, 0.0, 0.0
-    total_entradas = df_realizada[df_realizada["Tipo"] == "Entrada"]["Valor"].sum()
-    total_saidas = abs(df_realizada[df_realizada["Tipo"] == "Saída"]["Valor"].sum()) 
-    saldo = df_realizada["Valor"].sum()
-    return total_entradas, total_saidas, saldo
+    # Somas exatas em centavos
+    valores = para_centavos(df_realizada["Valor"])
+    total_entradas = int(valores[df_realizada["Tipo"] == "Entrada"].sum())
+    total_saidas = abs(int(valores[df_realizada["Tipo"] == "Saída"].sum()))
+    return para_reais(total_entradas), para_reais(total_saidas), para_reais(int(valores.sum()))
 
 def calcular_valor_em_aberto(linha):
     """Calcula o valor absoluto e arredondado para 2 casas decimais de uma linha do DataFrame."""
@@ -439,8 +626,9 @@ def calcular_valor_em_aberto(linha):
         else:
             return 0.0
             
-        valor_float = float(valor_raw) if pd.notna(valor_raw) and not isinstance(valor_raw, pd.Series) else 0.0
-        return round(abs(valor_float), 2)
+        if isinstance(valor_raw, pd.Series) or pd.isna(valor_raw):
+            return 0.0
+        return para_reais(abs(centavos(valor_raw)))
     except Exception:
         return 0.0
 
@@ -493,7 +681,8 @@ def calcular_nivel(total_gasto: float) -> str:
     else:
         return "Bronze 🥉"
 
-@st.cache_data(show_spinner="Carregando clientes e cashback...")
+@depende_de(ARQ_CLIENTES_CASH)
+@snapshot(show_spinner="Carregando clientes e cashback...")
 def carregar_clientes_cash():
     """Carrega o histórico de clientes e cashback (GitHub primeiro) e renomeia as colunas."""
     df = None
@@ -533,11 +722,6 @@ def carregar_clientes_cash():
 
 def salvar_clientes_cash_github(df: pd.DataFrame, commit_message: str):
     """Salva o DataFrame de Clientes no GitHub, preservando todas as colunas originais do CSV."""
-    try:
-        from github import Github
-    except ImportError:
-        pass 
-        
     df_temp = df.copy()
 
     # ===================================================================
@@ -571,15 +755,10 @@ def salvar_clientes_cash_github(df: pd.DataFrame, commit_message: str):
     df_temp = df_temp[colunas_finais_csv]
 
     try:
-        g = Github(TOKEN)
-        repo = g.get_repo(f"{OWNER}/{REPO_NAME}")
         csv_string = df_temp.to_csv(index=False, encoding="utf-8-sig")
         
-        try:
-            contents = repo.get_contents(ARQ_CLIENTES_CASH, ref=BRANCH)
-            repo.update_file(contents.path, commit_message, csv_string, contents.sha, branch=BRANCH)
-        except Exception:
-            repo.create_file(ARQ_CLIENTES_CASH, commit_message, csv_string, branch=BRANCH)
+        # Gravação em segundo plano: a fila faz o commit (sem GET do SHA + PUT bloqueando a tela)
+        enfileirar_commit(TOKEN, OWNER, REPO_NAME, BRANCH, {ARQ_CLIENTES_CASH: csv_string}, commit_message)
         
         carregar_clientes_cash.clear()
         return True
@@ -587,6 +766,7 @@ def salvar_clientes_cash_github(df: pd.DataFrame, commit_message: str):
     except Exception as e:
         return False
 
+@depende_de(ARQ_PRODUTOS, ARQ_MOVIMENTOS_ESTOQUE, ARQ_SNAPSHOTS_ESTOQUE)
 @st.cache_data(show_spinner="Carregando produtos do estoque...")
 def inicializar_produtos():
     COLUNAS_PRODUTOS = [
@@ -603,6 +783,8 @@ def inicializar_produtos():
         for col in COLUNAS_PRODUTOS:
             if col not in df_base.columns: df_base[col] = ''
         df_base["Quantidade"] = pd.to_numeric(df_base["Quantidade"], errors='coerce').fillna(0).astype(int)
+        # Estoque pelo livro de movimentos (snapshot + cauda) nos produtos que já estão nele
+        df_base = aplicar_estoque_do_livro(df_base)
         df_base["PrecoCusto"] = pd.to_numeric(df_base["PrecoCusto"], errors='coerce').fillna(0.0)
         df_base["PrecoVista"] = pd.to_numeric(df_base["PrecoVista"], errors='coerce').fillna(0.0)
         df_base["PrecoCartao"] = pd.to_numeric(df_base["PrecoCartao"], errors='coerce').fillna(0.0)
@@ -613,22 +795,6 @@ def inicializar_produtos():
         st.session_state.produtos = df_base
     return st.session_state.produtos
 
-def ajustar_estoque(id_produto, quantidade, operacao="debitar"):
-    produtos_df = st.session_state.produtos
-    idx_produto = produtos_df[produtos_df["ID"] == id_produto].index
-    if not idx_produto.empty:
-        idx = idx_produto[0]
-        qtd_atual = produtos_df.loc[idx, "Quantidade"]
-        if operacao == "debitar":
-            nova_qtd = qtd_atual - quantidade
-            produtos_df.loc[idx, "Quantidade"] = max(0, nova_qtd)
-            return True
-        elif operacao == "creditar":
-            nova_qtd = qtd_atual + quantidade
-            produtos_df.loc[idx, "Quantidade"] = nova_qtd
-            return True
-    return False
-
 def salvar_produtos_no_github(dataframe, commit_message):
     return True
 
@@ -673,7 +839,7 @@ def callback_salvar_novo_produto(produtos, tipo_produto, nome, marca, categoria,
             validade, foto_url, codigo_barras
         )
         if save_csv_github(produtos, ARQ_PRODUTOS, f"Novo produto simples: {nome} (ID {new_id})"):
-            st.session_state.produtos = produtos
+            substituir_produtos_sessao(produtos)
             inicializar_produtos.clear()
             st.success(f"Produto '{nome}' cadastrado com sucesso!")
             # Limpa campos do formulário simples
@@ -717,7 +883,7 @@ def callback_salvar_novo_produto(produtos, tipo_produto, nome, marca, categoria,
                 
         if cont_variacoes > 0:
             if save_csv_github(produtos, ARQ_PRODUTOS, f"Novo produto com grade: {nome} ({cont_variacoes} variações)"):
-                st.session_state.produtos = produtos
+                substituir_produtos_sessao(produtos)
                 inicializar_produtos.clear()
                 st.success(f"Produto '{nome}' com {cont_variacoes} variações cadastrado com sucesso!")
                 # Limpa campos do formulário complexo
@@ -733,7 +899,7 @@ def callback_salvar_novo_produto(produtos, tipo_produto, nome, marca, categoria,
         else:
             # Se não adicionou variações, exclui o pai criado (or avisa)
             produtos = produtos[produtos["ID"] != pai_id]
-            st.session_state.produtos = produtos
+            substituir_produtos_sessao(produtos)
             st.error("Nenhuma variação válida foi fornecida. O produto principal não foi salvo.")
             return False
     return False
@@ -798,44 +964,11 @@ def get_most_sold_products(df_movimentacoes):
     CORRIGIDO: Tratamento de erro robusto para garantir a chave 'Produto_ID'.
     """
     
-    # 1. Filtra apenas as transações de Entrada (vendas) que foram Realizadas
-    df_vendas = df_movimentacoes[
-        (df_movimentacoes["Tipo"] == "Entrada") & 
-        (df_movimentacoes["Status"] == "Realizada") &
-        (df_movimentacoes["Produtos Vendidos"].notna()) &
-        (df_movimentacoes["Produtos Vendidos"] != "")
-    ].copy()
+    # 1. Itens vendidos (tabela itens_venda: o JSON de 'Produtos Vendidos' já vem desempacotado)
+    df_itens = itens_venda(df_movimentacoes)
 
-    if df_vendas.empty:
-        # Garante que o DataFrame de saída tenha as colunas esperadas para o merge
-        return pd.DataFrame(columns=["Produto_ID", "Quantidade Total Vendida"])
-
-    vendas_list = []
-    
-    # 2. Desempacota o JSON de Produtos Vendidos
-    for produtos_json in df_vendas["Produtos Vendidos"]:
-        try:
-            # Tenta usar json.loads, mas usa ast.literal_eval como fallback
-            try:
-                produtos = json.loads(produtos_json)
-            except (json.JSONDecodeError, TypeError):
-                produtos = ast.literal_eval(produtos_json)
-            
-            if isinstance(produtos, list):
-                for item in produtos:
-                    # CORREÇÃO: Garante que 'Produto_ID' existe antes de tentar acessá-lo.
-                    # Se não existir (dados antigos), pula o item.
-                    produto_id = str(item.get("Produto_ID"))
-                    if produto_id and produto_id != "None":
-                         vendas_list.append({
-                            "Produto_ID": produto_id,
-                            "Quantidade": to_float(item.get("Quantidade", 0))
-                        })
-        except Exception:
-            # Ignora linhas com JSON de produto totalmente malformado
-            continue
-            
-    df_vendas_detalhada = pd.DataFrame(vendas_list)
+    # 2. Apenas vendas Realizadas com 'Produto_ID' (itens de dados antigos sem ID são ignorados)
+    df_vendas_detalhada = df_itens[(df_itens["Status"] == "Realizada") & (df_itens["Produto_ID"] != "")]
     
     if df_vendas_detalhada.empty:
         # Garante a coluna Produto_ID mesmo que vazia para o merge na homepage
@@ -1029,40 +1162,13 @@ def gestao_promocoes():
     
     # Recarrega as vendas para a lógica de produtos parados
     df_movimentacoes = carregar_livro_caixa()
-    vendas = df_movimentacoes[df_movimentacoes["Tipo"] == "Entrada"].copy()
     
     # --- PRODUTOS COM VENDA (para análise de inatividade) ---
-    vendas_list = []
-    for index, row in vendas.iterrows():
-        produtos_json = row["Produtos Vendidos"]
-        if pd.notna(produtos_json) and produtos_json:
-            try:
-                # Tenta usar json.loads, mas usa ast.literal_eval como fallback
-                try:
-                    items = json.loads(produtos_json)
-                except (json.JSONDecodeError, TypeError):
-                    items = ast.literal_eval(produtos_json)
-                
-                # CORREÇÃO: Garante que 'items' é uma lista e itera com segurança
-                if isinstance(items, list):
-                    for item in items:
-                         produto_id = str(item.get("Produto_ID"))
-                         if produto_id and produto_id != "None":
-                            vendas_list.append({
-                                "Data": parse_date_yyyy_mm_dd(row["Data"]), 
-                                "IDProduto": produto_id
-                            })
-            except Exception:
-                continue
-            
-    # CORREÇÃO: Adiciona a verificação de lista vazia antes de criar o DataFrame e chamar dropna
-    if vendas_list:
-        vendas_flat = pd.DataFrame(vendas_list)
-        # O dropna é seguro aqui porque a lista não está vazia e 'IDProduto' é garantido no for loop.
-        vendas_flat = vendas_flat.dropna(subset=["IDProduto"])
-    else:
-        # Retorna um DataFrame vazio, mas com a coluna esperada, para evitar KeyErrors
-        vendas_flat = pd.DataFrame(columns=["Data", "IDProduto"])
+    # Itens já normalizados (itens_venda): só os que têm 'Produto_ID'
+    df_itens = itens_venda(df_movimentacoes)
+    vendas_flat = df_itens.loc[df_itens["Produto_ID"] != "", ["Data", "Produto_ID"]].rename(
+        columns={"Produto_ID": "IDProduto"}
+    )
     
 
     st.header("🏷️ Promoções")
@@ -1349,7 +1455,7 @@ def relatorio_produtos():
 
     produtos = inicializar_produtos().copy()
     df_movimentacoes = carregar_livro_caixa()
-    vendas = df_movimentacoes[df_movimentacoes["Tipo"] == "Entrada"].copy()
+    df_itens = itens_venda(df_movimentacoes)
 
     # --- Configurações de Alerta ---
     with st.expander("⚙️ Configurações de Alerta", expanded=False):
@@ -1427,28 +1533,11 @@ def relatorio_produtos():
     # --- 3. Produtos Parados (Sem Vendas) ---
     st.markdown(f"#### 📦 Alerta de Produtos Parados (Sem venda nos últimos {dias_sem_venda} dias)")
 
-    # 1. Processa vendas para encontrar a última venda de cada produto
-    vendas_list = []
-    for index, row in vendas.iterrows():
-        produtos_json = row["Produtos Vendidos"]
-        if pd.notna(produtos_json) and produtos_json:
-            try:
-                items = ast.literal_eval(produtos_json)
-                if isinstance(items, list):
-                    for item in items:
-                         produto_id = str(item.get("Produto_ID"))
-                         if produto_id and produto_id != "None":
-                            vendas_list.append({
-                                "Data": parse_date_yyyy_mm_dd(row["Data"]), 
-                                "IDProduto": produto_id
-                            })
-            except Exception:
-                continue
-    
-    if vendas_list:
-        vendas_flat = pd.DataFrame(vendas_list)
-        vendas_flat["Data"] = pd.to_datetime(vendas_flat["Data"], errors="coerce")
-        ultima_venda = vendas_flat.groupby("IDProduto")["Data"].max().reset_index()
+    # 1. Última venda de cada produto direto da tabela de itens (sem ler o JSON linha a linha)
+    vendas_flat = df_itens[df_itens["Produto_ID"] != ""]
+    if not vendas_flat.empty:
+        datas_venda = pd.to_datetime(vendas_flat["Data"], errors="coerce")
+        ultima_venda = datas_venda.groupby(vendas_flat["Produto_ID"]).max().reset_index()
         ultima_venda.columns = ["IDProduto", "UltimaVenda"]
     else:
         ultima_venda = pd.DataFrame(columns=["IDProduto", "UltimaVenda"])
@@ -1485,8 +1574,7 @@ def gestao_produtos():
     # Título da Página
     st.header("📦 Gestão de Produtos e Estoque") # Mantém o st.header para o título da seção
 
-    # Lógica de Salvamento Automático para sincronizar alterações feitas pelo Livro Caixa
-    save_data_github_produtos(produtos, ARQ_PRODUTOS, COMMIT_MESSAGE_PROD)
+    # Vendas do Livro Caixa movimentam o estoque pelo livro de movimentos: nada a regravar aqui
 
 
     # ================================
@@ -1790,7 +1878,7 @@ def gestao_produtos():
                     if c[6].button("🗑️", key=f"del_pai_{index}_{eid}", help="Excluir produto"):
                         produtos = produtos[produtos["ID"] != eid]
                         produtos = produtos[produtos["PaiID"] != eid]
-                        st.session_state["produtos"] = produtos
+                        substituir_produtos_sessao(produtos, removidos=[eid, *indice_produtos_sessao().filhos(eid)])
                         
                         nome_pai = str(pai.get('Nome', 'Produto Desconhecido'))
                         if salvar_produtos_no_github(produtos, f"Exclusão do produto pai {nome_pai}"):
@@ -1841,7 +1929,7 @@ def gestao_produtos():
 
                                 if c_var[6].button("🗑️", key=f"del_filho_{index_var}_{eid_var}", help="Excluir variação"):
                                     products = produtos[produtos["ID"] != eid_var]
-                                    st.session_state["produtos"] = products
+                                    substituir_produtos_sessao(products, removidos=[eid_var])
                                     
                                     nome_var = str(var.get('Nome', 'Variação Desconhecida'))
                                     if salvar_produtos_no_github(products, f"Exclusão da variação {nome_var}"):
@@ -1905,7 +1993,7 @@ def gestao_produtos():
                                 nova_foto.strip(),
                                 str(novo_cb).strip()
                             ]
-                            st.session_state["produtos"] = produtos
+                            substituir_produtos_sessao(produtos, editados=[eid])
                             if salvar_produtos_no_github(produtos, "Atualizando produto"):
                                 inicializar_produtos.clear()
                                 
@@ -2274,12 +2362,18 @@ def livro_caixa():
         st.session_state.aba_ativa_livro_caixa = abas_validas[0]
 
     df_dividas = st.session_state.df
-    df_exibicao = processar_dataframe(df_dividas)
+    df_exibicao = processar_dataframe(df_dividas, calcular_saldo=False)
+    # Saldo mantido de forma incremental na sessão (só é reconstruído se o DataFrame mudou por fora)
+    df_exibicao['Saldo Acumulado'] = saldo_acumulado_sessao(df_exibicao).coluna_saldo(df_exibicao)
 
     produtos_para_venda = produtos[produtos["PaiID"].notna() | produtos["PaiID"].isnull()].copy()
     opcoes_produtos = [""] + produtos_para_venda.apply(
         lambda row: f"{row.ID} | {row.Nome} ({row.Marca}) | Estoque: {row.Quantidade}", axis=1
     ).tolist()
+    # ID -> opção do selectbox (o código de barras lido vira duas consultas de dicionário, sem varrer a lista)
+    opcao_por_id = {}
+    for id_opcao, opcao in zip(produtos_para_venda["ID"].astype(str).str.strip(), opcoes_produtos[1:]):
+        opcao_por_id.setdefault(id_opcao, opcao)
     OPCAO_MANUAL = "Adicionar Item Manual (Sem Controle de Estoque)"
     opcoes_produtos.append(OPCAO_MANUAL)
 
@@ -2287,18 +2381,10 @@ def livro_caixa():
         if ' | ' in opcoes_str: return opcoes_str.split(' | ')[0]
         return None
     
-    def encontrar_opcao_por_cb(codigo_barras, produtos_df, opcoes_produtos_list):
+    def encontrar_opcao_por_cb(codigo_barras, indice, opcao_por_id):
         if not codigo_barras: return None
-        
-        produto_encontrado = produtos_df[produtos_df["CodigoBarras"] == codigo_barras]
-        
-        if not produto_encontrado.empty:
-            produto_id = produto_encontrado.iloc[0]["ID"]
-            
-            for opcao in opcoes_produtos_list:
-                if opcao.startswith(f"{produto_id} |"):
-                    return opcao
-        return None
+        produto_id = indice.id_por_codigo(codigo_barras)
+        return opcao_por_id.get(produto_id) if produto_id else None
         
     if "input_nome_prod_manual" not in st.session_state: st.session_state.input_nome_prod_manual = ""
     if "input_qtd_prod_manual" not in st.session_state: st.session_state.input_qtd_prod_manual = 1.0
@@ -2581,7 +2667,7 @@ def livro_caixa():
                         c_cashback = cliente_ativo['cashback']
 
                         if c_cashback >= 20.00:
-                            max_resgate_permitido = round(valor_compra_atual * 0.5, 2)
+                            max_resgate_permitido = para_reais(aplicar_taxa(centavos(valor_compra_atual), 0.5))
                             max_resgate_real = min(c_cashback, max_resgate_permitido, valor_compra_atual)
                             st.session_state.cashback_a_usar = st.number_input(
                                 "💸 Usar Cashback (Desconto)",
@@ -2620,7 +2706,7 @@ def livro_caixa():
                     
                     index_selecionado = 0
                     if st.session_state.get("cb_lido_livro_caixa"): 
-                        opcao_encontrada = encontrar_opcao_por_cb(st.session_state.cb_lido_livro_caixa, produtos_para_venda, opcoes_produtos)
+                        opcao_encontrada = encontrar_opcao_por_cb(st.session_state.cb_lido_livro_caixa, indice_produtos_sessao(), opcao_por_id)
                         if opcao_encontrada:
                             index_selecionado = opcoes_produtos.index(opcao_encontrada)
                             st.toast(f"Produto correspondente ao CB encontrado!")
@@ -2739,12 +2825,39 @@ def livro_caixa():
                     valor_a_salvar = valor_base - cashback_resgatado
                     categoria_final = "" # Entradas não possuem categoria de custo
 
+                # ID estável da transação (chave da tabela itens_venda e origem dos movimentos de estoque);
+                # a edição mantém o ID original (linhas antigas, sem ID, ganham um novo)
+                transaction_id = uuid.uuid4().hex
+                if edit_mode and 'TransactionID' in st.session_state.df.columns and st.session_state.edit_id in st.session_state.df.index:
+                    id_existente = st.session_state.df.loc[st.session_state.edit_id, 'TransactionID']
+                    if pd.notna(id_existente) and str(id_existente).strip():
+                        transaction_id = id_existente
+
+                # Estoque da venda em UMA transação: débito dos itens da venda realizada e, na edição,
+                # estorno dos itens da versão anterior. Validado antes de gravar qualquer coisa (inclusive o cashback).
+                movimentos_estoque = {"estorno": [], "venda": []}
+                if tipo == "Entrada" and status_selecionado == "Realizada":
+                    movimentos_estoque["venda"] = movimentos_de_itens(st.session_state.lista_produtos, -1)
+                if edit_mode and st.session_state.edit_id in st.session_state.df.index:
+                    linha_anterior = st.session_state.df.loc[st.session_state.edit_id]
+                    if linha_anterior.get("Tipo") == "Entrada" and linha_anterior.get("Status") == "Realizada":
+                        itens_anteriores = itens_da_transacao(carregar_itens_venda(), linha_anterior)
+                        movimentos_estoque["estorno"] = movimentos_de_itens(itens_anteriores, +1)
+                estoque_venda = None
+                if any(movimentos_estoque.values()):
+                    estoque_venda, faltantes = preparar_transacao_estoque(
+                        st.session_state.produtos, movimentos_estoque, data_input, origem=transaction_id
+                    )
+                    if estoque_venda is None:
+                        st.error(mensagem_estoque_insuficiente(faltantes))
+                        st.stop()
+
                 # Lógica de atualização de cashback (mantida)
                 if tipo == "Entrada" and status_selecionado == "Realizada" and cliente:
                     # ... (seu código original de gestão de cashback) ...
                     # Esta parte não precisa de alteração.
                     valor_base_compra = valor_base 
-                    cashback_ganho = round(valor_base_compra * 0.03, 2)
+                    cashback_ganho = para_reais(aplicar_taxa(centavos(valor_base_compra), 0.03))
                     
                     df_clientes_upd = st.session_state.df_clientes.copy()
                     
@@ -2753,9 +2866,10 @@ def livro_caixa():
 
                         if cliente_idx_list:
                             idx = cliente_idx_list[0]
-                            df_clientes_upd.loc[idx, "Cashback"] -= cashback_resgatado
-                            df_clientes_upd.loc[idx, "Cashback"] += cashback_ganho
-                            df_clientes_upd.loc[idx, "TotalGasto"] += valor_base_compra
+                            df_clientes_upd.loc[idx, "Cashback"] = arredondar_reais(
+                                df_clientes_upd.loc[idx, "Cashback"] - cashback_resgatado + cashback_ganho
+                            )
+                            df_clientes_upd.loc[idx, "TotalGasto"] = arredondar_reais(df_clientes_upd.loc[idx, "TotalGasto"] + valor_base_compra)
                             df_clientes_upd.loc[idx, "Nivel"] = calcular_nivel(df_clientes_upd.loc[idx, "TotalGasto"])
                             msg_cashback = f"Cashback para {cliente}: Resgate R${cashback_resgatado:,.2f}, Ganho R${cashback_ganho:,.2f}"
                         else:
@@ -2780,19 +2894,28 @@ def livro_caixa():
                     "Produtos Vendidos": produtos_vendidos_json,
                     "Categoria": categoria_final,
                     "Status": status_selecionado,
-                    "Data Pagamento": data_pagamento_final.isoformat() if data_pagamento_final else None
+                    "Data Pagamento": data_pagamento_final.isoformat() if data_pagamento_final else None,
+                    "TransactionID": transaction_id
                 }
 
                 if edit_mode:
                     # (Seu código de edição existente)
+                    # Marca o mês antigo e o novo: a data pode ter mudado de mês na edição
+                    data_antiga = df_movimentacoes_upd.loc[st.session_state.edit_id, 'Data'] if st.session_state.edit_id in df_movimentacoes_upd.index else None
+                    marcar_particoes_alteradas(data_antiga, data_input)
                     df_movimentacoes_upd.loc[st.session_state.edit_id] = nova_movimentacao
                     msg_commit = "Movimentação editada"
+                    salvo = salvar_dados_no_github(df_movimentacoes_upd, msg_commit, data_input, estoque=estoque_venda)
                 else:
                     df_movimentacoes_upd = pd.concat([df_movimentacoes_upd, pd.DataFrame([nova_movimentacao])], ignore_index=True)
                     msg_commit = "Nova movimentação"
-                
-                if salvar_dados_no_github(df_movimentacoes_upd, msg_commit, data_input):
+                    marcar_particoes_alteradas(data_input)
+                    salvo = registrar_movimentacao(df_movimentacoes_upd, nova_movimentacao, msg_commit, data_input, estoque=estoque_venda)
+
+                if salvo:
                     st.success("Movimentação salva com sucesso!")
+                    indice_salvo = st.session_state.edit_id if edit_mode else df_movimentacoes_upd.index[-1]
+                    atualizar_saldo_sessao(st.session_state.df, df_movimentacoes_upd, indice_salvo, data_input, valor_a_salvar, status_selecionado)
                     st.session_state.df = df_movimentacoes_upd
                     st.session_state.lista_produtos = []
                     st.session_state.edit_id = None
@@ -2869,7 +2992,7 @@ def livro_caixa():
         st.subheader(f"🏠 Resumo Rápido por Loja (Mês de {primeiro_dia_mes.strftime('%m/%Y')} - Realizado)")
         
         # [Bloco de Resumo por Loja]
-        df_resumo_loja = df_mes_atual_realizado.groupby('Loja')['Valor'].agg(['sum', lambda x: x[x >= 0].sum(), lambda x: abs(x[x < 0].sum())]).reset_index()
+        df_resumo_loja = df_mes_atual_realizado.groupby('Loja', observed=True)['Valor'].agg(['sum', lambda x: x[x >= 0].sum(), lambda x: abs(x[x < 0].sum())]).reset_index()
         df_resumo_loja.columns = ['Loja', 'Saldo', 'Entradas', 'Saídas']
         
         if not df_resumo_loja.empty:
@@ -3019,23 +3142,28 @@ def livro_caixa():
                              data_movimentacao_excluida = date.today()
                         
                         
+                        estoque_estorno = None
                         if row['Status'] == 'Realizada' and row['Tipo'] == 'Entrada':
                             try:
-                                produtos_vendidos_antigos = ast.literal_eval(row['Produtos Vendidos'])
-                                for item in produtos_vendidos_antigos:
-                                    # Restaura o estoque
-                                    if item.get("Produto_ID"): ajustar_estoque(item["Produto_ID"], item["Quantidade"], "creditar")
-                                if salvar_produtos_no_github(st.session_state.produtos, "Reversão de estoque por exclusão de venda"):
-                                    inicializar_produtos.clear()
+                                # Itens da venda pela tabela itens_venda (TransacaoID), sem reler o JSON
+                                itens_antigos = itens_da_transacao(carregar_itens_venda(), row)
+                                # Restaura o estoque de todos os itens de uma vez (gravado junto com a exclusão)
+                                movimentos_estoque = movimentos_de_itens(itens_antigos, +1)
+                                if movimentos_estoque:
+                                    estoque_estorno, _ = preparar_transacao_estoque(
+                                        st.session_state.produtos, {"estorno": movimentos_estoque},
+                                        origem=row.get('TransactionID', '')
+                                    )
                             except: 
                                 pass
 
                         # 2. Exclui a linha do DataFrame da sessão
                         st.session_state.df = st.session_state.df.drop(row['original_index'], errors='ignore')
+                        marcar_particoes_alteradas(data_movimentacao_excluida)
 
                         # 3. Chama a função de salvamento com os TRÊS argumentos
-                        if salvar_dados_no_github(st.session_state.df, COMMIT_MESSAGE_DELETE, data_movimentacao_excluida):
-                            st.cache_data.clear()
+                        # salvar_dados_no_github já invalida os caches do Livro Caixa (e os do estoque, quando há estorno)
+                        if salvar_dados_no_github(st.session_state.df, COMMIT_MESSAGE_DELETE, data_movimentacao_excluida, estoque=estoque_estorno):
                             st.rerun()
                 else:
                     st.info("Selecione uma movimentação no menu acima para ver detalhes e opções de edição/exclusão.")
@@ -3076,32 +3204,14 @@ def livro_caixa():
 
             if st.button("📊 Gerar Relatório Comparativo", use_container_width=True, type="primary"):
                 
-                df_relatorio = df_exibicao[
-                    (df_exibicao['Status'] == 'Realizada') &
-                    (df_exibicao['Loja'].isin(lojas_selecionadas)) &
-                    (df_exibicao['Data'] >= data_inicio_rel) &
-                    (df_exibicao['Data'] <= data_fim_rel)
-                ].copy()
-
-                if tipo_movimentacao != "Ambos":
-                    df_relatorio = df_relatorio[df_relatorio['Tipo'] == tipo_movimentacao]
+                # Lê só os agregados materializados (sem tocar nas movimentações)
+                df_agrupado = resumo_comparativo(
+                    carregar_rollup_livro_caixa(), data_inicio_rel, data_fim_rel, lojas_selecionadas, tipo_movimentacao
+                )
                 
-                if df_relatorio.empty:
+                if df_agrupado.empty:
                     st.warning("Nenhum dado encontrado com os filtros selecionados.")
                 else:
-                    df_relatorio['MesAno'] = df_relatorio['Data_dt'].dt.to_period('M').astype(str)
-                    
-                    df_agrupado = df_relatorio.groupby('MesAno').apply(lambda x: pd.Series({
-                        'Entradas': x[x['Valor'] > 0]['Valor'].sum(),
-                        'Saídas': abs(x[x['Valor'] < 0]['Valor'].sum())
-                    })).reset_index()
-
-                    df_agrupado['Saldo'] = df_agrupado['Entradas'] - df_agrupado['Saídas']
-                    
-                    df_agrupado = df_agrupado.sort_values(by='MesAno').reset_index(drop=True)
-                    df_agrupado['Crescimento Entradas (%)'] = (df_agrupado['Entradas'].pct_change() * 100).fillna(0)
-                    df_agrupado['Crescimento Saídas (%)'] = (df_agrupado['Saídas'].pct_change() * 100).fillna(0)
-                    
                     st.markdown("---")
                     st.subheader("Resultados do Relatório")
 
@@ -3242,7 +3352,7 @@ def livro_caixa():
                     concluir = st.form_submit_button("✅ Registrar Pagamento", use_container_width=True, type="primary")
 
                     if concluir:
-                        valor_restante = round(valor_em_aberto - valor_pago, 2)
+                        valor_restante = para_reais(centavos(valor_em_aberto) - centavos(valor_pago))
                         idx_original = original_idx_concluir
                         
                         if idx_original not in st.session_state.df.index:
@@ -3251,6 +3361,24 @@ def livro_caixa():
                             return
 
                         row_original = st.session_state.df.loc[idx_original].copy()
+
+                        # Quitação total de uma venda debita o estoque: validado antes de mexer no Livro Caixa
+                        estoque_quitacao = None
+                        if valor_restante <= 0.01 and row_original["Tipo"] == "Entrada" and row_original["Produtos Vendidos"]:
+                            itens_vendidos = itens_da_transacao(carregar_itens_venda(), row_original)
+                            if itens_vendidos.empty and not ler_produtos_vendidos(row_original['Produtos Vendidos']):
+                                st.warning("⚠️ Venda concluída, mas falha no débito do estoque (JSON inválido).")
+                            else:
+                                estoque_quitacao, faltantes = preparar_transacao_estoque(
+                                    st.session_state.produtos, {"venda": movimentos_de_itens(itens_vendidos, -1)},
+                                    data_conclusao, origem=row_original.get('TransactionID', '')
+                                )
+                                if estoque_quitacao is None:
+                                    st.error(mensagem_estoque_insuficiente(faltantes))
+                                    st.stop()
+
+                        # Quitação mexe no mês da dívida original e no mês do pagamento
+                        marcar_particoes_alteradas(row_original['Data'], data_conclusao)
                         
                         # 1. Cria a transação de pagamento (Realizada)
                         # O valor deve ter o sinal correto (Entrada é positivo, Saída é negativo)
@@ -3290,22 +3418,13 @@ def livro_caixa():
                             # Exclui a linha original pendente (pois o pagamento total já foi registrado como nova transação)
                             st.session_state.df = st.session_state.df.drop(idx_original, errors='ignore')
                             
-                            # Débito de Estoque (Apenas para Entrada)
-                            # O débito de estoque só deve ocorrer se a transação original for a venda (Tipo Entrada)
-                            if row_original["Tipo"] == "Entrada" and row_original["Produtos Vendidos"]:
-                                try:
-                                    produtos_vendidos = ast.literal_eval(row_original['Produtos Vendidos'])
-                                    for item in produtos_vendidos:
-                                        if item.get("Produto_ID"): ajustar_estoque(item["Produto_ID"], item["Quantidade"], "debitar")
-                                    if salvar_produtos_no_github(st.session_state.produtos, f"Débito de estoque por conclusão total {row_original['Cliente']}"): inicializar_produtos.clear()
-                                except: st.warning("⚠️ Venda concluída, mas falha no débito do estoque (JSON inválido).")
+                            # Débito de Estoque (Apenas para Entrada): já calculado acima, vai no mesmo salvamento
                                 
                             commit_msg = f"Pagamento total de R$ {valor_pago:,.2f} da dívida {row_original['Cliente'].split(' (')[0]}."
                             
                         
-                        if salvar_dados_no_github(st.session_state.df, commit_msg):
+                        if salvar_dados_no_github(st.session_state.df, commit_msg, estoque=estoque_quitacao):
                             st.session_state.divida_parcial_id = None
-                            st.cache_data.clear()
                             st.rerun()
                 else:
                     st.info("Selecione uma dívida válida para prosseguir com o pagamento.")
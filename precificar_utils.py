@@ -2,7 +2,6 @@
 
 import streamlit as st
 import pandas as pd
-import requests
 from fpdf import FPDF
 from io import BytesIO, StringIO
 import base64
@@ -10,6 +9,10 @@ import hashlib
 import ast
 import numpy as np # Necessário para pd.util.hash_pandas_object
 
+from cache_utils import buscar_csv_com_cache
+from dinheiro_utils import aplicar_taxa, para_centavos, para_reais
+from http_utils import http_post
+
 
 # ===============================
 # CONSTANTES GLOBAIS
@@ -114,7 +117,7 @@ def enviar_pdf_telegram(pdf_bytesio, df_produtos: pd.DataFrame, thread_id=None):
     if thread_id is not None:
         data_doc["message_thread_id"] = thread_id
     
-    resp_doc = requests.post(url_doc, data=data_doc, files=files_doc)
+    resp_doc = http_post(url_doc, data=data_doc, files=files_doc)
     resp_doc_json = resp_doc.json()
     
     if not resp_doc_json.get("ok"):
@@ -135,7 +138,7 @@ def enviar_pdf_telegram(pdf_bytesio, df_produtos: pd.DataFrame, thread_id=None):
             if thread_id is not None:
                 data_photo["message_thread_id"] = thread_id
 
-            resp_photo = requests.post(url_photo, data=data_photo)
+            resp_photo = http_post(url_photo, data=data_photo)
             resp_photo_json = resp_photo.json()
 
             if resp_photo_json.get("ok"):
@@ -216,11 +219,15 @@ def processar_dataframe(df: pd.DataFrame, frete_total: float, custos_extras: flo
 
     df = df.copy()
 
-    for col in ["Qtd", "Custo Unitário", "Margem (%)", "Custos Extras Produto"]:
+    for col in ["Qtd", "Margem (%)"]:
         if col in df.columns:
             df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0.0)
         elif col not in df.columns:
             df[col] = 0.0
+    # Valores monetários em centavos (aceita "12,50"/"1.234,56"); voltam a reais exatos no fim
+    custo_centavos = para_centavos(df["Custo Unitário"]) if "Custo Unitário" in df.columns else pd.Series(0, index=df.index)
+    extras_centavos = (para_centavos(df["Custos Extras Produto"]) if "Custos Extras Produto" in df.columns
+                       else pd.Series(0, index=df.index))
             
     qtd_total = df["Qtd"].sum()
     rateio_unitario = 0
@@ -232,15 +239,20 @@ def processar_dataframe(df: pd.DataFrame, frete_total: float, custos_extras: flo
     else:
         pass
 
-    df["Custo Total Unitário"] = df["Custo Unitário"] + df["Custos Extras Produto"]
+    total_centavos = custo_centavos + extras_centavos
+    df["Custo Unitário"] = para_reais(custo_centavos)
+    df["Custos Extras Produto"] = para_reais(extras_centavos)
+    df["Custo Total Unitário"] = para_reais(total_centavos)
 
     if "Margem (%)" not in df.columns:
         df["Margem (%)"] = margem_fixa
     
     df["Margem (%)"] = df["Margem (%)"].apply(lambda x: x if pd.notna(x) else margem_fixa)
 
-    df["Preço à Vista"] = df["Custo Total Unitário"] * (1 + df["Margem (%)"] / 100)
-    df["Preço no Cartão"] = df["Preço à Vista"] / 0.8872
+    # Preços arredondados ao centavo (meio centavo para cima), como são cobrados
+    vista_centavos = aplicar_taxa(total_centavos, 1 + df["Margem (%)"] / 100)
+    df["Preço à Vista"] = para_reais(vista_centavos)
+    df["Preço no Cartão"] = para_reais(aplicar_taxa(vista_centavos, 1 / 0.8872))
 
     cols_to_keep = [
         "Produto", "Qtd", "Custo Unitário", "Custos Extras Produto", 
@@ -253,13 +265,13 @@ def processar_dataframe(df: pd.DataFrame, frete_total: float, custos_extras: flo
     return df_final
     
 # 4. load_csv_github
+def _ler_csv_precificacao(texto: str) -> pd.DataFrame:
+    return pd.read_csv(StringIO(texto))
+
 def load_csv_github(url: str) -> pd.DataFrame:
-    """Carrega um arquivo CSV diretamente do GitHub."""
+    """Carrega um arquivo CSV diretamente do GitHub (revalidando pelo cache HTTP/ETag)."""
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        df = pd.read_csv(StringIO(response.text))
-        return df
+        return buscar_csv_com_cache(url, _ler_csv_precificacao)
     except Exception as e:
         st.error(f"Erro ao carregar CSV do GitHub: {e}")
         return pd.DataFrame()
@@ -0,0 +1,354 @@
+# schema_utils.py
+from io import BytesIO, StringIO
+
+import numpy as np
+import pandas as pd
+
+from constants_and_css import (
+    COLUNAS_PADRAO_COMPLETO, COLUNAS_PRODUTOS_COMPLETAS, COLUNAS_COMPRAS, COLUNAS_CASHBACK,
+    ARQ_PRODUTOS, ARQ_COMPRAS, ARQ_CASHBACK, PATH_DIVIDAS, ARQ_MOVIMENTOS_ESTOQUE, ARQ_SNAPSHOTS_ESTOQUE,
+    LOJAS_DISPONIVEIS, FORMAS_PAGAMENTO, CATEGORIAS_SAIDA, NIVEIS_CASHBACK
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # Sem pyarrow: leitura pelo engine C do pandas
+    pa = None
+    pa_csv = None
+
+# Formato gravado pelo app; valores fora dele caem na inferência do pandas (só essas linhas)
+FORMATO_DATA = "%Y-%m-%d"
+SEPARADORES_CSV = (",", ";", "\t", "|")
+
+
+# =================================================================================
+# 📐 Esquemas declarativos (colunas, tipos, formatos de data, categorias e nomes antigos)
+# =================================================================================
+# tipos: "texto" (padrão), "float", "int", "bool", "data" (datetime.date) ou "datetime" (datetime64)
+# padroes: valor para vazios/NaN em colunas de texto
+# aliases: nomes antigos/alternativos da coluna (comparados sem diferenciar maiúsculas, com '_' no lugar de ' ')
+# categorias: colunas de baixa cardinalidade -> categorias fixas (dtype category; ver aplicar_categorias)
+# derivadas: colunas recalculadas na leitura (exibição); nunca vão para o arquivo (ver projetar_para_gravacao)
+ESQUEMA_LIVRO_CAIXA = {
+    "arquivo": PATH_DIVIDAS,
+    "colunas": COLUNAS_PADRAO_COMPLETO + ["TransactionID"],
+    "tipos": {"Valor": "float", "Data": "data", "Data Pagamento": "data"},
+    "formatos_data": {"Data": FORMATO_DATA, "Data Pagamento": FORMATO_DATA},
+    "categorias": {
+        "Loja": LOJAS_DISPONIVEIS, "Forma de Pagamento": FORMAS_PAGAMENTO, "Tipo": ["Entrada", "Saída"],
+        "Categoria": CATEGORIAS_SAIDA, "Status": ["Realizada", "Pendente"],
+    },
+    "padroes": {},
+    "aliases": {
+        "Valor": ["Valor Total"],
+        "Data": ["Data de Lancamento", "Data Lancamento", "Data da Transacao"],
+        "Status": ["Status da Transacao", "Status Transacao"],
+    },
+    "derivadas": ["original_index", "index", "Data_dt", "Cor_Valor", "ID Visível", "Saldo Acumulado", "Produtos Resumo"],
+}
+
+ESQUEMA_PRODUTOS = {
+    "arquivo": ARQ_PRODUTOS,
+    "colunas": COLUNAS_PRODUTOS_COMPLETAS,
+    "tipos": {
+        "Quantidade": "int", "PrecoCusto": "float", "PrecoVista": "float", "PrecoCartao": "float",
+        "Validade": "data", "CashbackPercent": "float",
+    },
+    "formatos_data": {"Validade": FORMATO_DATA},
+    "categorias": {"Marca": [], "Categoria": []},
+    "padroes": {"DetalhesGrade": "{}"},
+    "aliases": {},
+}
+
+ESQUEMA_COMPRAS = {
+    "arquivo": ARQ_COMPRAS,
+    "colunas": COLUNAS_COMPRAS,
+    "tipos": {"Data": "data", "Quantidade": "int", "Valor Total": "float"},
+    "formatos_data": {"Data": FORMATO_DATA},
+    "categorias": {"Cor": []},
+    "padroes": {},
+    "aliases": {},
+}
+
+ESQUEMA_CASHBACK = {
+    "arquivo": ARQ_CASHBACK,
+    "colunas": COLUNAS_CASHBACK,
+    "tipos": {"Saldo_Cashback": "float", "Total_Gasto": "float"},
+    "formatos_data": {},
+    "categorias": {"Nivel": list(NIVEIS_CASHBACK)},
+    "padroes": {},
+    "aliases": {},
+}
+
+# Página de Cashback: mesmo clientes_cash.csv, com as colunas do programa de fidelidade
+ESQUEMA_CLIENTES_CASHBACK = {
+    "arquivo": "clientes_cash.csv",
+    "colunas": ["Nome", "Apelido/Descrição", "Telefone", "Cashback Disponível", "Gasto Acumulado",
+                "Nivel Atual", "Indicado Por", "Primeira Compra Feita"],
+    "tipos": {"Cashback Disponível": "float", "Gasto Acumulado": "float", "Primeira Compra Feita": "bool"},
+    "formatos_data": {},
+    "categorias": {"Nivel Atual": []},
+    "padroes": {"Nivel Atual": "Prata", "Indicado Por": ""},
+    "aliases": {},
+}
+
+ESQUEMA_LANCAMENTOS_CASHBACK = {
+    "arquivo": "lancamentos.csv",
+    "colunas": ["Data", "Cliente", "Tipo", "Valor Venda/Resgate", "Valor Cashback", "Venda Turbo"],
+    "tipos": {"Data": "data"},
+    "formatos_data": {"Data": FORMATO_DATA},
+    "categorias": {"Tipo": [], "Venda Turbo": ["Sim", "Não"]},
+    "padroes": {"Venda Turbo": "Não"},
+    "aliases": {},
+}
+
+# Data = data do movimento (dia da venda/compra); Seq = ordem de gravação (os snapshots cobrem até um Seq)
+ESQUEMA_MOVIMENTOS_ESTOQUE = {
+    "arquivo": ARQ_MOVIMENTOS_ESTOQUE,
+    "colunas": ["Seq", "Data", "Produto_ID", "Delta", "Tipo", "Origem", "Observacao", "Registrado"],
+    "tipos": {"Seq": "int", "Data": "datetime", "Delta": "int"},
+    "formatos_data": {"Data": FORMATO_DATA},
+    "categorias": {"Tipo": ["compra", "venda", "ajuste", "estorno"]},
+    "padroes": {"Produto_ID": "", "Origem": "", "Observacao": ""},
+    "aliases": {},
+}
+
+ESQUEMA_SNAPSHOTS_ESTOQUE = {
+    "arquivo": ARQ_SNAPSHOTS_ESTOQUE,
+    "colunas": ["Seq", "Data", "Produto_ID", "Quantidade"],
+    "tipos": {"Seq": "int", "Data": "datetime", "Quantidade": "int"},
+    "formatos_data": {"Data": FORMATO_DATA},
+    "categorias": {},
+    "padroes": {"Produto_ID": ""},
+    "aliases": {},
+}
+
+ESQUEMA_PRODUTOS_TURBO = {
+    "arquivo": "produtos_turbo.csv",
+    "colunas": ["Nome Produto", "Data Início", "Data Fim", "Ativo"],
+    "tipos": {"Data Início": "datetime", "Data Fim": "datetime", "Ativo": "bool"},
+    "formatos_data": {"Data Início": FORMATO_DATA, "Data Fim": FORMATO_DATA},
+    "categorias": {},
+    "padroes": {},
+    "aliases": {},
+}
+
+
+def _normalizar_nome(coluna) -> str:
+    """'Valor Total', 'VALOR_TOTAL' e 'valor total' viram a mesma chave."""
+    return str(coluna).strip().upper().replace(" ", "_")
+
+
+def aliases_normalizados(esquema: dict, coluna: str) -> list[str]:
+    """Nomes antigos de `coluna` no formato MAIÚSCULAS/UNDERSCORE (para DataFrames já normalizados)."""
+    return [_normalizar_nome(a) for a in esquema["aliases"].get(coluna, [])]
+
+
+# =================================================================================
+# ⚡ Leitura de CSV em uma passada (pyarrow quando disponível)
+# =================================================================================
+def detectar_separador(texto: str) -> str:
+    """Separador mais frequente na linha de cabeçalho (sem o csv.Sniffer)."""
+    fim = texto.find("\n")
+    cabecalho = texto[:fim if fim >= 0 else 500]
+    contagens = {sep: cabecalho.count(sep) for sep in SEPARADORES_CSV}
+    melhor = max(contagens, key=contagens.get)
+    return melhor if contagens[melhor] else ","
+
+
+def _tipo_texto_pandas():
+    """Mesmo dtype de texto do read_csv(dtype=str) (pandas 3); None no pandas 2.x (object)."""
+    try:
+        return pd.StringDtype("pyarrow", na_value=np.nan)
+    except TypeError:
+        return None
+
+
+_TIPO_TEXTO = _tipo_texto_pandas() if pa is not None else None
+
+
+def tabela_para_pandas(tabela) -> pd.DataFrame:
+    """Tabela pyarrow -> DataFrame com o mesmo dtype de texto do read_csv (dicionários viram category)."""
+    if _TIPO_TEXTO is not None:
+        return tabela.to_pandas(types_mapper={pa.string(): _TIPO_TEXTO}.get)
+    return tabela.to_pandas().fillna(np.nan)
+
+
+def _ler_com_pyarrow(texto: str, sep: str) -> pd.DataFrame:
+    dados = texto.encode("utf-8")
+    opcoes_leitura = pa_csv.ParseOptions(delimiter=sep)
+    nomes = pa_csv.read_csv(BytesIO(dados[:dados.find(b"\n") + 1] or dados), parse_options=opcoes_leitura).column_names
+    tabela = pa_csv.read_csv(
+        BytesIO(dados), parse_options=opcoes_leitura,
+        # Tudo como texto e vazio como nulo: igual ao read_csv(dtype=str)
+        convert_options=pa_csv.ConvertOptions(column_types={n: pa.string() for n in nomes}, strings_can_be_null=True),
+    )
+    return tabela_para_pandas(tabela)
+
+
+def ler_csv_rapido(texto: str, sep: str | None = None) -> pd.DataFrame:
+    """
+    Converte o texto CSV em DataFrame com todas as colunas como texto (equivale a read_csv(dtype=str)).
+    Usa o leitor do pyarrow quando disponível; casos que ele não aceita (quebra de linha dentro de aspas,
+    linhas com colunas a mais, arquivo vazio) voltam ao engine C do pandas.
+    """
+    texto = texto.lstrip("\ufeff")
+    sep = sep or detectar_separador(texto)
+    if pa_csv is not None and texto.strip():
+        try:
+            return _ler_com_pyarrow(texto, sep)
+        except Exception:
+            pass
+    return pd.read_csv(StringIO(texto), dtype=str, sep=sep)
+
+
+# =================================================================================
+# 🔁 Conversão de tipos pelo esquema (vetorizada, uma vez por coluna)
+# =================================================================================
+def converter_datas(serie: pd.Series, formato: str | None = FORMATO_DATA) -> pd.Series:
+    """Texto -> datetime64 pelo formato declarado; só os valores fora do formato passam pela inferência."""
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    if formato is None or not pd.api.types.is_string_dtype(serie):  # ex.: objetos date já convertidos
+        return pd.to_datetime(serie, errors="coerce")
+    datas = pd.to_datetime(serie, format=formato, errors="coerce")
+    posicoes = np.flatnonzero(datas.isna().to_numpy())
+    if not len(posicoes):
+        return datas
+    restantes = serie.iloc[posicoes]
+    texto = restantes.astype(str).str.strip()
+    posicoes = posicoes[(restantes.notna() & (texto != "") & (texto.str.lower() != "nan")).to_numpy()]
+    if len(posicoes):
+        datas = datas.copy()
+        datas.iloc[posicoes] = pd.to_datetime(serie.iloc[posicoes], format="mixed", errors="coerce").to_numpy()
+    return datas
+
+
+def converter_coluna(serie: pd.Series, tipo: str, formato: str | None = FORMATO_DATA, padrao=None) -> pd.Series:
+    if tipo == "float":
+        return pd.to_numeric(serie, errors="coerce").fillna(0.0).astype(float, copy=False)
+    if tipo == "int":
+        return pd.to_numeric(serie, errors="coerce").fillna(0).astype(int)
+    if tipo == "bool":
+        return serie.astype(str).str.strip().str.lower().map({"true": True, "false": False}).fillna(False).astype(bool)
+    if tipo == "data":
+        return converter_datas(serie, formato).dt.date
+    if tipo == "datetime":
+        return converter_datas(serie, formato)
+    if padrao is not None:
+        return serie.fillna(padrao).replace({"": padrao, "nan": padrao})
+    return serie
+
+
+def renomear_colunas(df: pd.DataFrame, esquema: dict) -> pd.DataFrame:
+    """Coloca os nomes do esquema em colunas lidas em outra caixa, com '_' ou com um nome antigo (alias)."""
+    destino = {}
+    for coluna in esquema["colunas"]:
+        destino[_normalizar_nome(coluna)] = coluna
+        for alias in esquema["aliases"].get(coluna, []):
+            destino.setdefault(_normalizar_nome(alias), coluna)
+    renomear, usados = {}, set(df.columns)
+    for coluna in df.columns:
+        novo = destino.get(_normalizar_nome(coluna))
+        if novo is not None and novo != coluna and novo not in usados:
+            renomear[coluna] = novo
+            usados.add(novo)
+    return df.rename(columns=renomear) if renomear else df
+
+
+def aplicar_esquema(df: pd.DataFrame | None, esquema: dict, tipar: bool = True) -> pd.DataFrame:
+    """
+    Uma passada do texto lido até o DataFrame do esquema: nomes (aliases), colunas faltantes,
+    tipos e ordem das colunas. Com tipar=False só ajusta nomes/colunas (mantém texto).
+    """
+    if df is None:
+        df = pd.DataFrame(columns=esquema["colunas"])
+    df = renomear_colunas(df, esquema)
+    faltando = [c for c in esquema["colunas"] if c not in df.columns]
+    if faltando:
+        df = df.assign(**{c: "" for c in faltando})
+    df = df[esquema["colunas"]].copy()
+    if not tipar:
+        return df
+    formatos = esquema["formatos_data"]
+    for coluna in esquema["colunas"]:
+        tipo = esquema["tipos"].get(coluna, "texto")
+        padrao = esquema["padroes"].get(coluna)
+        if tipo != "texto" or padrao is not None:
+            df[coluna] = converter_coluna(df[coluna], tipo, formatos.get(coluna, FORMATO_DATA), padrao)
+    return df
+
+
+
+# =================================================================================
+# 🗂️ Categorias (texto repetido guardado uma vez por valor) e relatório de memória
+# =================================================================================
+def categorizar(serie: pd.Series, fixas=()) -> pd.Series:
+    """
+    Texto -> category com as categorias fixas na ordem declarada, seguidas dos valores lidos fora delas
+    (ordenados; nada se perde). Vazios continuam NaN.
+    """
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie
+    fixas = list(dict.fromkeys(fixas))
+    extras = sorted(set(serie.dropna().unique()) - set(fixas), key=str)
+    return pd.Series(pd.Categorical(serie, categories=fixas + extras), index=serie.index, name=serie.name)
+
+
+def aplicar_categorias(df: pd.DataFrame, esquema: dict) -> pd.DataFrame:
+    """Converte para category as colunas declaradas em esquema["categorias"] que existirem no DataFrame."""
+    for coluna, fixas in esquema["categorias"].items():
+        if coluna in df.columns:
+            df[coluna] = categorizar(df[coluna], fixas)
+    return df
+
+
+def adicionar_categorias(df: pd.DataFrame, valores: dict) -> pd.DataFrame:
+    """Antes de atribuir um valor novo a uma coluna category ({coluna: valor}), inclui-o nas categorias."""
+    for coluna, valor in valores.items():
+        if coluna in df.columns and isinstance(df[coluna].dtype, pd.CategoricalDtype) \
+                and valor not in df[coluna].cat.categories and pd.notna(valor):
+            df[coluna] = df[coluna].cat.add_categories([valor])
+    return df
+
+
+def relatorio_memoria(frames: dict) -> pd.DataFrame:
+    """{nome: DataFrame} -> linhas, colunas e MB em memória (deep) por frame, com a parte em texto (object/str) e em category."""
+    linhas = []
+    for nome, df in frames.items():
+        if not isinstance(df, pd.DataFrame):
+            continue
+        por_coluna = df.memory_usage(deep=True, index=False)
+        categorias = [c for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)]
+        texto = [c for c in df.columns if c not in categorias
+                 and (pd.api.types.is_object_dtype(df[c]) or pd.api.types.is_string_dtype(df[c]))]
+        linhas.append({
+            "Frame": nome, "Linhas": len(df), "Colunas": len(df.columns),
+            "MB": round(por_coluna.sum() / 2**20, 3),
+            "MB texto": round(por_coluna[texto].sum() / 2**20, 3),
+            "MB category": round(por_coluna[categorias].sum() / 2**20, 3),
+        })
+    return pd.DataFrame(linhas, columns=["Frame", "Linhas", "Colunas", "MB", "MB texto", "MB category"])
+
+
+# =================================================================================
+# 💾 Projeção para gravação (só as colunas canônicas vão para o arquivo)
+# =================================================================================
+def colunas_derivadas(colunas, esquema: dict) -> list:
+    """Colunas de `colunas` que são derivadas no esquema (comparadas sem diferenciar maiúsculas/underscore)."""
+    derivadas = {_normalizar_nome(c) for c in esquema.get("derivadas", [])}
+    return [c for c in colunas if _normalizar_nome(c) in derivadas]
+
+
+def projetar_para_gravacao(df: pd.DataFrame, esquema: dict) -> pd.DataFrame:
+    """
+    DataFrame (cru ou já processado para exibição) -> só as colunas canônicas do esquema, na ordem do esquema.
+    Colunas derivadas (saldo, cor, índices, datetime auxiliar) são recalculadas na leitura e não são gravadas.
+    Os valores não são convertidos (datas/números saem como o to_csv os escreve).
+    """
+    df = renomear_colunas(df, esquema)
+    faltando = [c for c in esquema["colunas"] if c not in df.columns]
+    if faltando:
+        df = df.assign(**{c: "" for c in faltando})
+    return df[esquema["colunas"]]
@@ -0,0 +1,142 @@
+# snapshot_utils.py
+import functools
+import logging
+import threading
+import time
+
+import pandas as pd
+import streamlit as st
+
+from http_utils import get_script_run_ctx
+from schema_utils import relatorio_memoria
+
+logger = logging.getLogger(__name__)
+
+# Idade a partir da qual o snapshot é revalidado em segundo plano (quem lê recebe o atual na hora)
+TTL_SNAPSHOT = 300
+
+# Visões sem cópia dependem de Copy-on-Write (padrão no pandas 3; no 2.x precisa ser ligado)
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
+
+def _visao(valor):
+    """DataFrame/Series: visão rasa (Copy-on-Write copia só o que a sessão alterar). Outros tipos: o próprio valor."""
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        return valor.copy(deep=False)
+    return valor
+
+
+# =================================================================================
+# 📸 Snapshots somente-leitura compartilhados entre sessões (stale-while-revalidate)
+# =================================================================================
+class CacheSnapshots:
+    """
+    Um valor por loader para o processo inteiro (em vez de uma cópia por chamada do st.cache_data).
+    - Primeira leitura: carrega na hora (única espera; leituras simultâneas aguardam a mesma carga).
+    - Snapshot vencido: devolve o atual e revalida numa thread; falha mantém o anterior.
+    - invalidar(): descarta o snapshot (próxima leitura recarrega, já vendo o que foi gravado).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entradas = {}   # chave -> {"valor", "carregado_em", "atualizando"}
+        self._cargas = {}     # chave -> Lock da carga síncrona
+        self._geracao = {}    # chave -> n; muda a cada invalidação (descarta revalidações antigas)
+        self._tempos = {}     # chave -> segundos da última carga (síncrona ou em segundo plano)
+
+    def obter(self, chave: str, carregar, ttl: float, texto_spinner: str | None = None):
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is not None:
+                if time.time() - entrada["carregado_em"] > ttl and not entrada["atualizando"]:
+                    entrada["atualizando"] = True
+                    threading.Thread(
+                        target=self._revalidar, args=(chave, carregar, self._geracao.get(chave, 0)),
+                        name=f"snapshot-{chave}", daemon=True,
+                    ).start()
+                return entrada["valor"]
+            trava = self._cargas.setdefault(chave, threading.Lock())
+
+        with trava:
+            with self._lock:
+                entrada = self._entradas.get(chave)
+                if entrada is not None:
+                    return entrada["valor"]
+                geracao = self._geracao.get(chave, 0)
+            if texto_spinner and get_script_run_ctx(suppress_warning=True) is not None:
+                with st.spinner(texto_spinner):
+                    valor = self._carregar_medindo(chave, carregar)
+            else:
+                valor = self._carregar_medindo(chave, carregar)
+            self._guardar(chave, valor, geracao)
+            return valor
+
+    def _carregar_medindo(self, chave: str, carregar):
+        inicio = time.perf_counter()
+        valor = carregar()
+        segundos = time.perf_counter() - inicio
+        with self._lock:
+            self._tempos[chave] = segundos
+        logger.debug("%s carregado em %.0f ms", chave, segundos * 1000)
+        return valor
+
+    def tempos_de_carga(self) -> dict:
+        """{loader: segundos da última carga}."""
+        with self._lock:
+            return dict(self._tempos)
+
+    def relatorio_memoria(self) -> pd.DataFrame:
+        """Memória de cada snapshot DataFrame (uma cópia por processo, compartilhada pelas sessões)."""
+        with self._lock:
+            frames = {chave: entrada["valor"] for chave, entrada in self._entradas.items()}
+        return relatorio_memoria(frames)
+
+    def _guardar(self, chave: str, valor, geracao: int):
+        with self._lock:
+            if self._geracao.get(chave, 0) == geracao:
+                self._entradas[chave] = {"valor": valor, "carregado_em": time.time(), "atualizando": False}
+
+    def _revalidar(self, chave: str, carregar, geracao: int):
+        try:
+            valor = self._carregar_medindo(chave, carregar)
+        except Exception:
+            with self._lock:
+                entrada = self._entradas.get(chave)
+                if entrada is not None:  # Mantém o anterior e tenta de novo depois de outro TTL
+                    entrada["carregado_em"] = time.time()
+                    entrada["atualizando"] = False
+            return
+        self._guardar(chave, valor, geracao)
+
+    def invalidar(self, chave: str):
+        with self._lock:
+            self._entradas.pop(chave, None)
+            self._geracao[chave] = self._geracao.get(chave, 0) + 1
+
+
+@st.cache_resource(show_spinner=False)
+def get_cache_snapshots() -> CacheSnapshots:
+    """Cache de snapshots compartilhado por todas as sessões do processo."""
+    return CacheSnapshots()
+
+
+def snapshot(ttl: float = TTL_SNAPSHOT, show_spinner: str | None = None):
+    """
+    Substitui @st.cache_data em loaders sem argumentos: todas as sessões leem o mesmo snapshot
+    (visão sem cópia) e ninguém espera pela revalidação. A função ganha .clear(), como no st.cache_data,
+    então pode ser registrada com @depende_de.
+    """
+    def decorar(carregar):
+        # Pelo arquivo de origem, não pelo módulo: os scripts de pages/ rodam todos como __main__
+        codigo = getattr(carregar, "__code__", None)
+        origem = codigo.co_filename if codigo is not None else carregar.__module__
+        chave = f"{origem}:{carregar.__qualname__}"
+
+        @functools.wraps(carregar)
+        def obter():
+            return _visao(get_cache_snapshots().obter(chave, carregar, ttl, show_spinner))
+
+        obter.clear = lambda: get_cache_snapshots().invalidar(chave)
+        return obter
+    return decorar
@@ -0,0 +1,352 @@
+# storage_utils.py
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+import pandas as pd
+import streamlit as st
+
+from cache_utils import buscar_csv_com_cache, invalidar_arquivos
+from gravacao_utils import enfileirar_commit
+from http_utils import github_repo
+from schema_utils import ESQUEMA_LIVRO_CAIXA, colunas_derivadas, ler_csv_rapido, projetar_para_gravacao
+
+from constants_and_css import (
+    OWNER, REPO_NAME, BRANCH, GITHUB_TOKEN,
+    STORAGE_BACKEND, SQLITE_PATH, PATH_DIVIDAS
+)
+
+logger = logging.getLogger(__name__)
+
+# Colunas indexadas por tabela no SQLite (nomes normalizados em MAIÚSCULAS/UNDERSCORE)
+INDICES_SQLITE = {
+    "livro_caixa": ["DATA", "STATUS", "TIPO", "CLIENTE"],
+    "contas_a_pagar_receber": ["DATA", "STATUS", "TIPO", "CLIENTE"],
+    "produtos_estoque": ["ID", "CODIGOBARRAS", "PAIID"],
+    "clientes_cash": ["ID", "NOME"],
+    "historico_compras": ["DATA"],
+    "promocoes": ["ID_PROMOCAO", "ID_PRODUTO"],
+    "itens_venda": ["TRANSACAOID", "PRODUTO_ID", "DATA"],
+    "movimentos_estoque": ["SEQ", "PRODUTO_ID", "DATA"],
+    "estoque_snapshots": ["SEQ"],
+    "rollup_livro_caixa": ["MESANO"],
+}
+
+
+# =================================================================================
+# 🔍 Leitura crua de CSV (GitHub raw)
+# =================================================================================
+def baixar_csv(url: str, timeout: int = 15) -> pd.DataFrame:
+    """Baixa um CSV (revalidando pelo cache HTTP/ETag) e devolve o DataFrame com as colunas originais (tudo como texto)."""
+    return buscar_csv_com_cache(url, ler_csv_texto, timeout=timeout)
+
+
+def ler_csv_texto(texto: str) -> pd.DataFrame:
+    """Detecta o delimitador pelo cabeçalho e converte o texto CSV em DataFrame (dtype=str)."""
+    return ler_csv_rapido(texto)
+
+
+def _nome_tabela(arquivo: str) -> str:
+    """'produtos_estoque.csv' -> 'produtos_estoque'."""
+    base = arquivo.rsplit("/", 1)[-1]
+    if base.lower().endswith(".csv"):
+        base = base[:-4]
+    return "".join(ch if ch.isalnum() else "_" for ch in base)
+
+
+def _quote(identificador: str) -> str:
+    return '"' + str(identificador).replace('"', '""') + '"'
+
+
+# =================================================================================
+# 💾 Interface de armazenamento
+# =================================================================================
+class StorageBackend(ABC):
+    """Interface comum usada pelos carregar_*/salvar_*.
+
+    - ler(arquivo): DataFrame cru (colunas como gravadas, valores texto) ou None.
+    - gravar(arquivo, df, msg): substitui todo o conteúdo. Retorna "atualizado" ou "criado".
+    - inserir(arquivo, df_novas, msg): acrescenta linhas sem regravar o restante.
+    - tem_dados(arquivo): o arquivo/tabela já existe com linhas (antes do 1º inserir, semeie com gravar).
+    - substituir(arquivo, df_novas, coluna, valores, msg): troca só as linhas com `coluna` em `valores` pelas de df_novas.
+    - transacao(): agrupa várias gravações em tudo-ou-nada (no GitHub o equivalente é um único commit da fila).
+    """
+    nome = ""
+    local = False
+
+    def disponivel(self) -> bool:
+        return True
+
+    @abstractmethod
+    def ler(self, arquivo: str, url: str | None = None) -> pd.DataFrame | None:
+        ...
+
+    @abstractmethod
+    def gravar(self, arquivo: str, df: pd.DataFrame, commit_message: str) -> str:
+        ...
+
+    @abstractmethod
+    def inserir(self, arquivo: str, df_novas: pd.DataFrame, commit_message: str) -> str:
+        ...
+
+    def tem_dados(self, arquivo: str) -> bool:
+        df = self.ler(arquivo)
+        return df is not None and not df.empty
+
+    def substituir(self, arquivo: str, df_novas: pd.DataFrame, coluna: str, valores, commit_message: str) -> str:
+        df = self.ler(arquivo)
+        if df is not None and coluna in df.columns:
+            mantidas = df[~df[coluna].astype(str).isin([str(v) for v in valores])]
+            df_novas = pd.concat([mantidas, df_novas], ignore_index=True)
+        return self.gravar(arquivo, df_novas, commit_message)
+
+    @contextmanager
+    def transacao(self):
+        yield self
+
+
+class GitHubCSVStorage(StorageBackend):
+    """Comportamento original: CSV cru via HTTP e regravação do arquivo via PyGithub."""
+    nome = "GitHub"
+    local = False
+
+    def _credenciais(self):
+        try:
+            token = st.secrets.get("GITHUB_TOKEN") or st.secrets.get("github_token") or GITHUB_TOKEN
+            repo_owner = st.secrets.get("REPO_OWNER") or st.secrets.get("owner") or OWNER
+            repo_name = st.secrets.get("REPO_NAME") or st.secrets.get("repo") or REPO_NAME
+            branch = st.secrets.get("BRANCH") or BRANCH
+        except Exception:
+            token, repo_owner, repo_name, branch = GITHUB_TOKEN, OWNER, REPO_NAME, BRANCH
+        return token, repo_owner, repo_name, branch
+
+    def disponivel(self) -> bool:
+        token, _, _, _ = self._credenciais()
+        return bool(token)
+
+    def url_raw(self, arquivo: str) -> str:
+        return f"https://raw.githubusercontent.com/{OWNER}/{REPO_NAME}/{BRANCH}/{arquivo}"
+
+    def listar(self, prefixo: str = "") -> list[str]:
+        """Arquivos da raiz do repositório que começam com `prefixo` (uma chamada à API)."""
+        token, repo_owner, repo_name, branch = self._credenciais()
+        repo = github_repo(token, f"{repo_owner}/{repo_name}")
+        return sorted(c.name for c in repo.get_contents("", ref=branch) if c.name.startswith(prefixo))
+
+    def ler(self, arquivo: str, url: str | None = None) -> pd.DataFrame | None:
+        return baixar_csv(url or self.url_raw(arquivo))
+
+    def gravar(self, arquivo: str, df: pd.DataFrame, commit_message: str) -> str:
+        token, repo_owner, repo_name, branch = self._credenciais()
+        repo = github_repo(token, f"{repo_owner}/{repo_name}")
+        csv_content = df.to_csv(index=False, encoding="utf-8-sig")
+        try:
+            contents = repo.get_contents(arquivo, ref=branch)
+            repo.update_file(contents.path, commit_message, csv_content, contents.sha, branch=branch)
+            return "atualizado"
+        except Exception:
+            repo.create_file(arquivo, commit_message, csv_content, branch=branch)
+            return "criado"
+
+    def inserir(self, arquivo: str, df_novas: pd.DataFrame, commit_message: str) -> str:
+        # O CSV não tem append: baixa, concatena e regrava o arquivo inteiro.
+        try:
+            df_atual = self.ler(arquivo)
+        except Exception:
+            df_atual = None
+        if df_atual is None or df_atual.empty:
+            return self.gravar(arquivo, df_novas, commit_message)
+        return self.gravar(arquivo, pd.concat([df_atual, df_novas], ignore_index=True), commit_message)
+
+
+class SQLiteStorage(StorageBackend):
+    """Banco embarcado: uma tabela por arquivo, colunas TEXT e índices em INDICES_SQLITE."""
+    nome = "banco local"
+    local = True
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self._lock = threading.RLock()
+        self._em_transacao = False
+        self._conn = sqlite3.connect(caminho, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+
+    def _colunas(self, tabela: str) -> list[str]:
+        info = self._conn.execute(f"PRAGMA table_info({_quote(tabela)})").fetchall()
+        return [row[1] for row in info if row[1] != "_rowid"]
+
+    def _garantir_tabela(self, tabela: str, colunas: list[str]):
+        existentes = self._colunas(tabela)
+        if not existentes and not self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (tabela,)
+        ).fetchone():
+            defs = ", ".join(f"{_quote(c)} TEXT" for c in colunas)
+            self._conn.execute(
+                f"CREATE TABLE {_quote(tabela)} (_rowid INTEGER PRIMARY KEY AUTOINCREMENT{', ' + defs if defs else ''})"
+            )
+            existentes = list(colunas)
+        for col in colunas:
+            if col not in existentes:
+                self._conn.execute(f"ALTER TABLE {_quote(tabela)} ADD COLUMN {_quote(col)} TEXT")
+                existentes.append(col)
+        normalizadas = {c.upper().replace(" ", "_"): c for c in existentes}
+        for col_idx in INDICES_SQLITE.get(tabela, []):
+            col = normalizadas.get(col_idx)
+            if col:
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS {_quote(f'idx_{tabela}_{col_idx.lower()}')} "
+                    f"ON {_quote(tabela)} ({_quote(col)})"
+                )
+
+    @staticmethod
+    def _linhas(df: pd.DataFrame) -> list[tuple]:
+        valores = df.astype(object).where(pd.notna(df), None).values.tolist()
+        return [tuple(None if v is None else str(v) for v in linha) for linha in valores]
+
+    def _inserir_linhas(self, tabela: str, df: pd.DataFrame):
+        if df.empty:
+            return
+        colunas = [str(c) for c in df.columns]
+        sql = (
+            f"INSERT INTO {_quote(tabela)} ({', '.join(_quote(c) for c in colunas)}) "
+            f"VALUES ({', '.join('?' for _ in colunas)})"
+        )
+        self._conn.executemany(sql, self._linhas(df))
+
+    @contextmanager
+    def transacao(self):
+        """
+        gravar/inserir dentro do bloco vão numa única transação do SQLite: commit no fim, rollback se algo falhar
+        (ex.: Livro Caixa + estoque de uma venda). Blocos aninhados participam da transação de fora.
+        """
+        with self._lock:
+            if self._em_transacao:
+                yield self
+                return
+            self._em_transacao = True
+            try:
+                with self._conn:
+                    yield self
+            finally:
+                self._em_transacao = False
+
+    def ler(self, arquivo: str, url: str | None = None) -> pd.DataFrame | None:
+        tabela = _nome_tabela(arquivo)
+        with self._lock:
+            colunas = self._colunas(tabela)
+            if not colunas:
+                return None
+            cursor = self._conn.execute(
+                f"SELECT {', '.join(_quote(c) for c in colunas)} FROM {_quote(tabela)} ORDER BY _rowid"
+            )
+            linhas = cursor.fetchall()
+        if not linhas:
+            return None
+        return pd.DataFrame(linhas, columns=colunas, dtype=str)
+
+    def tem_dados(self, arquivo: str) -> bool:
+        tabela = _nome_tabela(arquivo)
+        with self._lock:
+            if not self._colunas(tabela):
+                return False
+            return self._conn.execute(f"SELECT 1 FROM {_quote(tabela)} LIMIT 1").fetchone() is not None
+
+    def _remover_colunas_ausentes(self, tabela: str, colunas: list[str]):
+        """Como o CSV regravado, a tabela fica só com as colunas do DataFrame (ex.: sem colunas derivadas antigas)."""
+        for col in self._colunas(tabela):
+            if col not in colunas:
+                try:
+                    self._conn.execute(f"ALTER TABLE {_quote(tabela)} DROP COLUMN {_quote(col)}")
+                except sqlite3.OperationalError:
+                    pass  # Coluna indexada ou SQLite < 3.35: fica vazia
+
+    def gravar(self, arquivo: str, df: pd.DataFrame, commit_message: str) -> str:
+        tabela = _nome_tabela(arquivo)
+        colunas = [str(c) for c in df.columns]
+        with self.transacao():
+            criado = not self._colunas(tabela)
+            self._garantir_tabela(tabela, colunas)
+            self._conn.execute(f"DELETE FROM {_quote(tabela)}")
+            self._remover_colunas_ausentes(tabela, colunas)
+            self._inserir_linhas(tabela, df)
+        return "criado" if criado else "atualizado"
+
+    def inserir(self, arquivo: str, df_novas: pd.DataFrame, commit_message: str) -> str:
+        tabela = _nome_tabela(arquivo)
+        with self.transacao():
+            criado = not self._colunas(tabela)
+            self._garantir_tabela(tabela, [str(c) for c in df_novas.columns])
+            self._inserir_linhas(tabela, df_novas)
+        return "criado" if criado else "atualizado"
+
+    def substituir(self, arquivo: str, df_novas: pd.DataFrame, coluna: str, valores, commit_message: str) -> str:
+        # DELETE ... WHERE coluna IN (...) + INSERT das novas: o restante da tabela não é regravado
+        tabela = _nome_tabela(arquivo)
+        valores = [str(v) for v in valores]
+        with self.transacao():
+            criado = not self._colunas(tabela)
+            self._garantir_tabela(tabela, [str(c) for c in df_novas.columns])
+            if valores and coluna in self._colunas(tabela):
+                self._conn.execute(
+                    f"DELETE FROM {_quote(tabela)} WHERE {_quote(coluna)} IN ({', '.join('?' for _ in valores)})", valores
+                )
+            self._inserir_linhas(tabela, df_novas)
+        return "criado" if criado else "atualizado"
+
+
+@st.cache_resource(show_spinner=False)
+def get_storage() -> StorageBackend:
+    """Retorna o backend configurado em STORAGE_BACKEND (um por processo)."""
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteStorage(SQLITE_PATH)
+    return GitHubCSVStorage()
+
+
+# =================================================================================
+# 🧽 Migração: colunas derivadas gravadas por versões antigas
+# =================================================================================
+COMMIT_MIGRACAO_DERIVADAS = "MIGRAÇÃO: remove colunas derivadas (recalculadas na leitura)"
+
+
+def migrar_colunas_derivadas(arquivos: dict) -> list[str]:
+    """
+    Regrava sem as colunas derivadas os arquivos {arquivo: esquema} que ainda as têm
+    (ex.: original_index, Data_dt, Cor_Valor, ID Visível e Saldo Acumulado no Livro Caixa).
+    Idempotente: arquivo já limpo não é regravado. No GitHub vai tudo num único commit (fila de gravação).
+    Retorna os arquivos migrados.
+    """
+    storage = get_storage()
+    migrados = {}
+    for arquivo, esquema in arquivos.items():
+        try:
+            df = storage.ler(arquivo)
+        except Exception:
+            continue  # Arquivo inexistente ou rede fora: nada a migrar agora
+        if df is not None and colunas_derivadas(df.columns, esquema):
+            migrados[arquivo] = projetar_para_gravacao(df, esquema)
+    if not migrados:
+        return []
+
+    if storage.local:
+        for arquivo, df in migrados.items():
+            storage.gravar(arquivo, df, COMMIT_MIGRACAO_DERIVADAS)
+    else:
+        token, repo_owner, repo_name, branch = storage._credenciais()
+        if not token:
+            return []
+        conteudos = {arquivo: df.to_csv(index=False, encoding="utf-8-sig") for arquivo, df in migrados.items()}
+        enfileirar_commit(token, repo_owner, repo_name, branch, conteudos, COMMIT_MIGRACAO_DERIVADAS)
+    invalidar_arquivos(*migrados)
+    return list(migrados)
+
+
+@st.cache_resource(show_spinner=False)
+def migrar_arquivos_legados() -> list[str]:
+    """Roda a migração uma vez por processo (chamada no app.py); arquivos já migrados custam só a leitura em cache."""
+    migrados = migrar_colunas_derivadas({PATH_DIVIDAS: ESQUEMA_LIVRO_CAIXA})
+    if migrados:
+        logger.info("Migração: colunas derivadas removidas de %s", ", ".join(migrados))
+    return migrados
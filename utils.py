@@ -3,24 +3,36 @@ import sys, os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta, date
-import requests
-from requests.exceptions import ConnectionError, RequestException
-from io import StringIO
 import json
 import hashlib
 import ast
 import calendar
 import os
-from github import Github 
 from constants_and_css import URL_PROMOCOES_CSV
+from storage_utils import get_storage, baixar_csv
+from vendas_utils import itens_venda
+from http_utils import http_post
+from cache_utils import depende_de, invalidar_arquivos
+from gravacao_utils import enfileirar_commit
+from snapshot_utils import snapshot
+from dinheiro_utils import aplicar_taxa, arredondar_reais, centavos, normalizar_numero, para_centavos, para_reais
+from estoque_utils import (
+    anexar_movimentos, aplicar_estoque_do_livro, estoque_em, linhas_movimento,
+    substituir_produtos_sessao
+)
+from schema_utils import (
+    ESQUEMA_CASHBACK, ESQUEMA_COMPRAS, ESQUEMA_LIVRO_CAIXA, ESQUEMA_PRODUTOS,
+    aliases_normalizados, aplicar_categorias, aplicar_esquema, converter_datas, projetar_para_gravacao
+)
 
 
 # =================================================================================
 # No arquivo utils.py, corrija o bloco para:
 from constants_and_css import (
     TOKEN, OWNER, REPO_NAME, BRANCH, GITHUB_TOKEN, GITHUB_REPO, GITHUB_BRANCH,
-    PATH_DIVIDAS, ARQ_PRODUTOS, ARQ_LOCAL, ARQ_COMPRAS, ARQ_PROMOCOES,
+    PATH_DIVIDAS, ARQ_PRODUTOS, ARQ_LOCAL, ARQ_COMPRAS, ARQ_PROMOCOES, ARQ_MOVIMENTOS_ESTOQUE, ARQ_SNAPSHOTS_ESTOQUE,
     COLUNAS_COMPRAS, 
     COLUNAS_PADRAO, 
     COLUNAS_PADRAO_COMPLETO,
@@ -39,7 +51,8 @@ def to_float(valor_str):
     try:
         if isinstance(valor_str, (int, float)):
             return float(valor_str)
-        return float(str(valor_str).replace(",", ".").strip())
+        # Aceita "12,5", "1.234,56" e "R$ 1.234,56" (mesma normalização do dinheiro_utils)
+        return float(normalizar_numero(valor_str))
     except:
         return 0.0
 
@@ -58,6 +71,23 @@ def prox_id(df, coluna_id="ID"):
                 return str(len(df) + 1)
 
 
+class AlocadorIDs:
+    """
+    IDs numéricos crescentes para inclusões em lote: o maior ID é lido uma vez (não a cada linha, como no
+    prox_id) e os seguintes saem de um contador. IDs em `usados` (ex.: produtos excluídos que continuam no
+    livro de estoque) também contam, para não serem reaproveitados.
+    """
+
+    def __init__(self, df, coluna_id="ID", usados=()):
+        ids = list(df[coluna_id]) if df is not None and coluna_id in df.columns else []
+        numeros = pd.to_numeric(pd.Series(ids + list(usados), dtype=object), errors="coerce")
+        self._ultimo = int(numeros.max()) if numeros.notna().any() else 0
+
+    def proximo(self) -> str:
+        self._ultimo += 1
+        return str(self._ultimo)
+
+
 def hash_df(df):
     df_temp = df.copy()
     for col in df_temp.select_dtypes(include=['datetime64[ns]']).columns:
@@ -93,8 +123,7 @@ def calcular_valor_em_aberto(linha):
             valor_raw = pd.to_numeric(linha['Valor'], errors='coerce')
         else:
             return 0.0
-        valor_float = float(valor_raw) if pd.notna(valor_raw) else 0.0
-        return round(abs(valor_float), 2)
+        return para_reais(abs(centavos(valor_raw))) if pd.notna(valor_raw) else 0.0
     except Exception:
         return 0.0
 
@@ -137,17 +166,7 @@ def format_produtos_resumo(produtos_json):
 # =================================================================================
 def load_csv_github(url: str) -> pd.DataFrame | None:
     try:
-        response = requests.get(url, timeout=15)
-        response.raise_for_status()
-        import csv
-        sample = response.text[:500]
-        sniffer = csv.Sniffer()
-        delimiter = ","
-        try:
-            delimiter = sniffer.sniff(sample).delimiter
-        except Exception:
-            pass
-        df = pd.read_csv(StringIO(response.text), dtype=str, sep=delimiter, encoding="utf-8-sig")
+        df = baixar_csv(url)
         # Converte para MAIÚSCULAS/UNDERSCORE, que é o padrão do DF de entrada
         df.columns = [col.upper().replace(' ', '_') for col in df.columns] 
         if df.empty:
@@ -157,6 +176,20 @@ def load_csv_github(url: str) -> pd.DataFrame | None:
         st.error(f"❌ Erro ao ler CSV do GitHub: {e}")
         return None
 
+def carregar_tabela(arquivo: str, url: str | None = None) -> pd.DataFrame | None:
+    """Lê um arquivo pelo backend configurado (GitHub ou banco local) com colunas em MAIÚSCULAS/UNDERSCORE."""
+    storage = get_storage()
+    if not storage.local:
+        return load_csv_github(url or f"https://raw.githubusercontent.com/{OWNER}/{REPO_NAME}/{BRANCH}/{arquivo}")
+    try:
+        df = storage.ler(arquivo)
+    except Exception as e:
+        st.error(f"❌ Erro ao ler '{arquivo}' do {storage.nome}: {e}")
+        return None
+    if df is not None:
+        df.columns = [col.upper().replace(' ', '_') for col in df.columns]
+    return df
+
 # =================================================================================
 # 🔧 Funções de Lógica e Persistência
 # =================================================================================
@@ -187,20 +220,19 @@ def salvar_dados_no_github(df: pd.DataFrame, commit_message: str):
     Função para salvar o Livro Caixa (movimentações) no GitHub. 
     """
     try:
-        from constants_and_css import PATH_DIVIDAS as CONST_PATH, OWNER as CONST_OWNER, REPO_NAME as CONST_REPO, BRANCH as CONST_BRANCH
-        from constants_and_css import GITHUB_TOKEN, ARQ_LOCAL
+        from constants_and_css import PATH_DIVIDAS as CONST_PATH, ARQ_LOCAL
     except Exception:
         return False
         
-    token = (st.secrets.get("GITHUB_TOKEN") or st.secrets.get("github_token") or GITHUB_TOKEN)
-    repo_owner = st.secrets.get("REPO_OWNER") or st.secrets.get("owner") or CONST_OWNER
-    repo_name = st.secrets.get("REPO_NAME") or st.secrets.get("repo") or CONST_REPO
-    branch = st.secrets.get("BRANCH") or CONST_BRANCH
+    storage = get_storage()
     csv_remote_path = CONST_PATH or "movimentacoes.csv"
     
-    if not token:
+    if not storage.disponivel():
         st.warning("⚠️ Nenhum token do GitHub encontrado. Salve manualmente.")
         return False
+
+    # O DF costuma vir de processar_dataframe: grava só as colunas canônicas (sem saldo, cor e índices)
+    df = projetar_para_gravacao(df, ESQUEMA_LIVRO_CAIXA)
         
     try:
         df.to_csv(ARQ_LOCAL, index=False, encoding="utf-8-sig") 
@@ -208,24 +240,18 @@ def salvar_dados_no_github(df: pd.DataFrame, commit_message: str):
         st.error(f"Erro ao salvar localmente: {e}")
         
     try:
-        g = Github(token)
-        repo = g.get_repo(f"{repo_owner}/{repo_name}")
-        csv_content = df.to_csv(index=False, encoding="utf-8-sig")
-        
-        try:
-            contents = repo.get_contents(csv_remote_path, ref=branch)
-            repo.update_file(contents.path, commit_message, csv_content, contents.sha, branch=branch)
-            st.success("📁 Dados atualizados no GitHub!")
-        except Exception:
-            repo.create_file(csv_remote_path, commit_message, csv_content, branch=branch)
-            st.success("📁 Arquivo de dados criado no GitHub!")
+        resultado = storage.gravar(csv_remote_path, df, commit_message)
+        if resultado == "atualizado":
+            st.success(f"📁 Dados atualizados no {storage.nome}!")
+        else:
+            st.success(f"📁 Arquivo de dados criado no {storage.nome}!")
             
         carregar_livro_caixa.clear()
         
         return True
         
     except Exception as e:
-        st.warning(f"Falha ao enviar dados para o GitHub — backup local mantido. ({e})")
+        st.warning(f"Falha ao enviar dados para o {storage.nome} — backup local mantido. ({e})")
         return False
 
 # utils.py - dentro de def processar_dataframe(df_movimentacoes: pd.DataFrame):
@@ -253,15 +279,17 @@ def processar_dataframe(df_movimentacoes: pd.DataFrame) -> pd.DataFrame:
     
     # Mapeia VALOR
     valor_col_name = 'VALOR'
-    if valor_col_name not in df_proc.columns and 'VALOR_TOTAL' in df_proc.columns:
-        valor_col_name = 'VALOR_TOTAL'
+    possible_valor_cols = aliases_normalizados(ESQUEMA_LIVRO_CAIXA, 'Valor')
+    found_valor_col = next((col for col in possible_valor_cols if col in df_proc.columns), None)
+    if valor_col_name not in df_proc.columns and found_valor_col:
+        valor_col_name = found_valor_col
     elif valor_col_name not in df_proc.columns:
         df_proc['VALOR'] = 0.0 # Cria coluna default se não encontrou o valor principal
         valor_col_name = 'VALOR' 
         
     # Mapeia DATA
     data_col_name = 'DATA'
-    possible_date_cols = ['DATA_DE_LANCAMENTO', 'DATA_LANCAMENTO', 'DATA_DA_TRANSACAO']
+    possible_date_cols = aliases_normalizados(ESQUEMA_LIVRO_CAIXA, 'Data')
     found_date_col = next((col for col in possible_date_cols if col in df_proc.columns), None)
 
     if data_col_name not in df_proc.columns and found_date_col:
@@ -272,7 +300,7 @@ def processar_dataframe(df_movimentacoes: pd.DataFrame) -> pd.DataFrame:
 
     # Mapeia STATUS (CORREÇÃO DO KEYERROR: 'STATUS')
     status_col_name = 'STATUS'
-    possible_status_cols = ['STATUS_DA_TRANSACAO', 'STATUS_TRANSACAO']
+    possible_status_cols = aliases_normalizados(ESQUEMA_LIVRO_CAIXA, 'Status')
     found_status_col = next((col for col in possible_status_cols if col in df_proc.columns), None)
     
     if status_col_name not in df_proc.columns and found_status_col:
@@ -285,20 +313,22 @@ def processar_dataframe(df_movimentacoes: pd.DataFrame) -> pd.DataFrame:
     
     # Aplica conversão nos nomes mapeados:
     df_proc["VALOR"] = pd.to_numeric(df_proc[valor_col_name], errors='coerce').fillna(0.0) 
-    df_proc["DATA"] = pd.to_datetime(df_proc[data_col_name], errors='coerce').dt.date 
+    formatos = ESQUEMA_LIVRO_CAIXA["formatos_data"]
+    datas = converter_datas(df_proc[data_col_name], formatos["Data"])
+    df_proc["DATA"] = datas.dt.date 
     
     # DATA_PAGAMENTO é menos crítica, mas precisa de tratamento de existência
     data_pagamento_col = 'DATA_PAGAMENTO'
     if data_pagamento_col in df_proc.columns:
-        df_proc[data_pagamento_col] = pd.to_datetime(df_proc[data_pagamento_col], errors='coerce').dt.date
+        df_proc[data_pagamento_col] = converter_datas(df_proc[data_pagamento_col], formatos["Data Pagamento"]).dt.date
     else:
         df_proc[data_pagamento_col] = pd.NaT 
     
-    # Cria coluna auxiliar de data para ordenação
-    df_proc["Data_dt"] = pd.to_datetime(df_proc["DATA"], errors='coerce')
+    # Cria coluna auxiliar de data para ordenação (da conversão acima, sem reconverter os objetos date)
+    df_proc["Data_dt"] = datas.dt.normalize()
     df_proc["Data_dt"] = df_proc["Data_dt"].fillna(datetime(1900, 1, 1))
     
-    df_proc['Cor_Valor'] = df_proc['VALOR'].apply(lambda x: 'green' if x >= 0 else 'red') 
+    df_proc['Cor_Valor'] = pd.Categorical(np.where(df_proc['VALOR'] >= 0, 'green', 'red'), categories=['green', 'red'])
 
     if 'ID_VISÍVEL' not in df_proc.columns or df_proc['ID_VISÍVEL'].isnull().all():
         df_proc['ID_VISÍVEL'] = range(1, len(df_proc) + 1)
@@ -323,22 +353,21 @@ def processar_dataframe(df_movimentacoes: pd.DataFrame) -> pd.DataFrame:
         'RECORRENCIAID': 'RecorrenciaID', 'TRANSACAOPAIID': 'TransacaoPaiID', 'ID_VISÍVEL': 'ID Visível', 
     }
     df_proc.rename(columns=livro_caixa_map, inplace=True, errors='ignore')
-    return df_proc
+    return aplicar_categorias(df_proc, ESQUEMA_LIVRO_CAIXA)
 def calcular_resumo(df_movimentacoes: pd.DataFrame):
     """Calcula o total de entradas, saídas e o saldo líquido de um DataFrame."""
     if df_movimentacoes is None or df_movimentacoes.empty:
         return 0.0, 0.0, 0.0
-    df = df_movimentacoes.copy()
-    df["Valor"] = pd.to_numeric(df["Valor"], errors='coerce').fillna(0.0) 
-    total_entradas = df[df['Valor'] >= 0]['Valor'].sum()
-    total_saidas = abs(df[df['Valor'] < 0]['Valor'].sum())
-    saldo = total_entradas - total_saidas
-    return round(total_entradas, 2), round(total_saidas, 2), round(saldo, 2)
+    # Soma exata em centavos (sem o desvio do float em históricos longos)
+    valores = para_centavos(df_movimentacoes["Valor"]).to_numpy()
+    total_entradas = int(valores[valores >= 0].sum())
+    total_saidas = -int(valores[valores < 0].sum())
+    return para_reais(total_entradas), para_reais(total_saidas), para_reais(total_entradas - total_saidas)
 
 def salvar_promocoes_no_github(df: pd.DataFrame, commit_message: str = "Atualiza promoções"):
     """Salva o CSV de promoções localmente e, se possível, também no GitHub."""
     try:
-        from constants_and_css import ARQ_PROMOCOES, OWNER as CONST_OWNER, REPO_NAME as CONST_REPO, BRANCH as CONST_BRANCH
+        from constants_and_css import ARQ_PROMOCOES
     except Exception as e:
         st.error(f"❌ Erro ao carregar constantes do projeto: {e}")
         return False
@@ -351,28 +380,20 @@ def salvar_promocoes_no_github(df: pd.DataFrame, commit_message: str = "Atualiza
     except Exception as e:
         st.error(f"Erro ao salvar promoções localmente: {e}")
         return False
-    token = (st.secrets.get("GITHUB_TOKEN") or st.secrets.get("github_token") or GITHUB_TOKEN)
-    repo_owner = st.secrets.get("REPO_OWNER") or st.secrets.get("owner") or CONST_OWNER
-    repo_name = st.secrets.get("REPO_NAME") or st.secrets.get("repo") or CONST_REPO
-    branch = st.secrets.get("BRANCH") or CONST_BRANCH
+    storage = get_storage()
     csv_remote_path = os.path.basename(ARQ_PROMOCOES) or "promocoes.csv"
-    if not token:
+    if not storage.disponivel():
         st.warning("⚠️ Nenhum token do GitHub encontrado — apenas backup local salvo.")
         return False
     try:
-        g = Github(token)
-        repo = g.get_repo(f"{repo_owner}/{repo_name}")
-        csv_content = df.to_csv(index=False, encoding="utf-8-sig")
-        try:
-            contents = repo.get_contents(csv_remote_path, ref=branch)
-            repo.update_file(contents.path, commit_message, csv_content, contents.sha, branch=branch)
-            st.success("📁 Promoções atualizadas no GitHub!")
-        except Exception:
-            repo.create_file(csv_remote_path, commit_message, csv_content, branch=branch)
-            st.success("📁 Arquivo de promoções criado no GitHub!")
+        resultado = storage.gravar(csv_remote_path, df, commit_message)
+        if resultado == "atualizado":
+            st.success(f"📁 Promoções atualizadas no {storage.nome}!")
+        else:
+            st.success(f"📁 Arquivo de promoções criado no {storage.nome}!")
         return True
     except Exception as e:
-        st.warning(f"Falha ao enviar promoções para o GitHub — backup local mantido. ({e})")
+        st.warning(f"Falha ao enviar promoções para o {storage.nome} — backup local mantido. ({e})")
         return False
 
 def salvar_historico_compras_no_github(df: pd.DataFrame, commit_message: str):
@@ -381,7 +402,7 @@ def salvar_historico_compras_no_github(df: pd.DataFrame, commit_message: str):
         st.warning("⚠️ Nenhum dado de compra para salvar — operação ignorada para evitar sobrescrever o CSV no GitHub.")
         return False
     try:
-        from constants_and_css import ARQ_COMPRAS, OWNER as CONST_OWNER, REPO_NAME as CONST_REPO, BRANCH as CONST_BRANCH, GITHUB_TOKEN
+        from constants_and_css import ARQ_COMPRAS
     except Exception as e:
         st.error(f"❌ Erro ao carregar constantes do projeto: {e}")
         return False
@@ -395,38 +416,33 @@ def salvar_historico_compras_no_github(df: pd.DataFrame, commit_message: str):
         return False
 
     # 2. Envio para o GitHub
-    token = (st.secrets.get("GITHUB_TOKEN") or st.secrets.get("github_token") or GITHUB_TOKEN)
-    repo_owner = st.secrets.get("REPO_OWNER") or st.secrets.get("owner") or CONST_OWNER
-    repo_name = st.secrets.get("REPO_NAME") or st.secrets.get("repo") or CONST_REPO
-    branch = st.secrets.get("BRANCH") or CONST_BRANCH
+    storage = get_storage()
     csv_remote_path = ARQ_COMPRAS
 
-    if not token:
+    if not storage.disponivel():
         st.warning("⚠️ Nenhum token do GitHub encontrado — apenas backup local foi salvo.")
         return False
     try:
-        g = Github(token)
-        repo = g.get_repo(f"{repo_owner}/{repo_name}")
-        csv_content = df.to_csv(index=False, encoding="utf-8-sig")
-
-        try:
-            contents = repo.get_contents(csv_remote_path, ref=branch)
-            repo.update_file(contents.path, commit_message, csv_content, contents.sha, branch=branch)
-            st.success("📁 Histórico de Compras atualizado no GitHub!")
-        except Exception:
-            repo.create_file(csv_remote_path, commit_message, csv_content, branch=branch)
-            st.success("📁 Arquivo de Histórico de Compras criado no GitHub!")
+        resultado = storage.gravar(csv_remote_path, df, commit_message)
+        if resultado == "atualizado":
+            st.success(f"📁 Histórico de Compras atualizado no {storage.nome}!")
+        else:
+            st.success(f"📁 Arquivo de Histórico de Compras criado no {storage.nome}!")
 
         # Limpa o cache para forçar o reload na próxima vez
         carregar_historico_compras.clear()
 
         return True
     except Exception as e:
-        st.warning(f"Falha ao enviar Histórico de Compras para o GitHub — backup local mantido. Erro: ({e})")
+        st.warning(f"Falha ao enviar Histórico de Compras para o {storage.nome} — backup local mantido. Erro: ({e})")
         return False
 
-def salvar_produtos_no_github(df: pd.DataFrame, commit_message: str):
-    """Salva o DataFrame de produtos localmente como backup e o envia para o GitHub."""
+def salvar_produtos_no_github(df: pd.DataFrame, commit_message: str, movimentos: pd.DataFrame | None = None):
+    """
+    Salva o DataFrame de produtos localmente como backup e o envia para o GitHub.
+    Com `movimentos` (linhas do livro de estoque, ex.: ajuste de quantidade na edição), produtos e movimentos
+    vão juntos: uma transação no banco local, um commit no GitHub. Se a gravação falhar, nenhum dos dois fica.
+    """
     if df is None or df.empty:
         st.warning("⚠️ Nenhum produto para salvar — operação ignorada para evitar sobrescrever o CSV no GitHub.")
         return False
@@ -436,36 +452,91 @@ def salvar_produtos_no_github(df: pd.DataFrame, commit_message: str):
     except Exception as e:
         st.error(f"Erro ao salvar produtos localmente: {e}")
         return False
-    token = (st.secrets.get("GITHUB_TOKEN") or st.secrets.get("github_token") or GITHUB_TOKEN)
-    repo_owner = st.secrets.get("REPO_OWNER") or st.secrets.get("owner") or OWNER
-    repo_name = st.secrets.get("REPO_NAME") or st.secrets.get("repo") or REPO_NAME
-    branch = st.secrets.get("BRANCH") or BRANCH
+    storage = get_storage()
     csv_remote_path = ARQ_PRODUTOS
-    if not token:
+    if not storage.disponivel():
         st.warning("⚠️ Nenhum token do GitHub encontrado — apenas backup local foi salvo.")
         return False
     try:
-        g = Github(token)
-        repo = g.get_repo(f"{repo_owner}/{repo_name}")
         df_to_save = df.copy()
         for col_camel in COLUNAS_PRODUTOS_COMPLETAS:
             if col_camel not in df_to_save.columns:
                 df_to_save[col_camel] = ''
         df_to_save = df_to_save[COLUNAS_PRODUTOS_COMPLETAS]
-        csv_content = df_to_save.to_csv(index=False, encoding="utf-8-sig")
-        try:
-            contents = repo.get_contents(csv_remote_path, ref=branch)
-            repo.update_file(contents.path, commit_message, csv_content, contents.sha, branch=branch)
-            st.success("📁 Produtos atualizados no GitHub!")
-        except Exception:
-            repo.create_file(csv_remote_path, commit_message, csv_content, branch=branch)
-            st.success("📁 Arquivo de produtos criado no GitHub!")
+        if movimentos is not None and not movimentos.empty:
+            if storage.local:
+                with storage.transacao():
+                    resultado = storage.gravar(csv_remote_path, df_to_save, commit_message)
+                    anexar_movimentos(movimentos, commit_message)
+            else:
+                arquivos = {csv_remote_path: df_to_save.to_csv(index=False, encoding="utf-8-sig")}
+                anexar_movimentos(movimentos, commit_message, arquivos_commit=arquivos)
+                token, repo_owner, repo_name, branch = storage._credenciais()
+                enfileirar_commit(token, repo_owner, repo_name, branch, arquivos, commit_message)
+                resultado = "atualizado"
+        else:
+            resultado = storage.gravar(csv_remote_path, df_to_save, commit_message)
+        if resultado == "atualizado":
+            st.success(f"📁 Produtos atualizados no {storage.nome}!")
+        else:
+            st.success(f"📁 Arquivo de produtos criado no {storage.nome}!")
         carregar_produtos.clear()
         return True
     except Exception as e:
-        st.warning(f"Falha ao enviar produtos para o GitHub — backup local mantido. Erro: ({e})")
+        st.warning(f"Falha ao enviar produtos para o {storage.nome} — backup local mantido. Erro: ({e})")
         return False
 
+def salvar_inclusao_produtos(df_produtos: pd.DataFrame, novos: list, compras: list, entradas_estoque: list, commit_message: str):
+    """
+    Inclui um lote de produtos novos com um único pd.concat e grava juntos o catálogo, as compras do lote no
+    histórico de compras e o estoque inicial no livro de movimentos: uma transação no banco local, um commit
+    no GitHub. Retorna o DataFrame de produtos atualizado, ou None se nada foi gravado.
+    """
+    produtos = pd.concat([df_produtos, pd.DataFrame(novos)], ignore_index=True)
+    try:
+        produtos.to_csv(ARQ_PRODUTOS, index=False, encoding="utf-8-sig")
+        st.toast("💾 Produtos salvos localmente!")
+    except Exception as e:
+        st.error(f"Erro ao salvar produtos localmente: {e}")
+        return None
+    storage = get_storage()
+    if not storage.disponivel():
+        st.warning("⚠️ Nenhum token do GitHub encontrado — apenas backup local foi salvo.")
+        return None
+
+    df_to_save = produtos.copy()
+    for col_camel in COLUNAS_PRODUTOS_COMPLETAS:
+        if col_camel not in df_to_save.columns:
+            df_to_save[col_camel] = ''
+    df_to_save = df_to_save[COLUNAS_PRODUTOS_COMPLETAS]
+    df_compras_novas = pd.DataFrame(compras, columns=COLUNAS_COMPRAS)
+    movimentos = linhas_movimento({"compra": entradas_estoque}, origem=ARQ_COMPRAS, observacao="Cadastro de produto")
+    try:
+        if storage.local:
+            with storage.transacao():
+                storage.gravar(ARQ_PRODUTOS, df_to_save, commit_message)
+                if not df_compras_novas.empty and storage.tem_dados(ARQ_COMPRAS):
+                    storage.inserir(ARQ_COMPRAS, df_compras_novas, commit_message)
+                elif not df_compras_novas.empty:
+                    # Tabela ainda não semeada: grava o histórico existente junto, para não escondê-lo
+                    df_compras = pd.concat([carregar_historico_compras(), df_compras_novas], ignore_index=True)
+                    storage.gravar(ARQ_COMPRAS, df_compras, commit_message)
+                anexar_movimentos(movimentos, commit_message)
+        else:
+            arquivos = {ARQ_PRODUTOS: df_to_save.to_csv(index=False, encoding="utf-8-sig")}
+            if not df_compras_novas.empty:
+                df_compras = pd.concat([carregar_historico_compras(), df_compras_novas], ignore_index=True)
+                arquivos[ARQ_COMPRAS] = df_compras.to_csv(index=False, encoding="utf-8-sig")
+            anexar_movimentos(movimentos, commit_message, arquivos_commit=arquivos)
+            token, repo_owner, repo_name, branch = storage._credenciais()
+            enfileirar_commit(token, repo_owner, repo_name, branch, arquivos, commit_message)
+    except Exception as e:
+        st.warning(f"Falha ao enviar produtos para o {storage.nome} — backup local mantido. Erro: ({e})")
+        return None
+    invalidar_arquivos(ARQ_PRODUTOS, ARQ_COMPRAS)
+    st.success(f"📁 {len(novos)} produto(s) gravado(s) no {storage.nome}!")
+    return produtos
+
 def save_data_github_produtos(df, path, commit_message):
     """Função de compatibilidade que agora chama a função de salvar correta."""
     return salvar_produtos_no_github(df, commit_message)
@@ -474,11 +545,12 @@ def save_data_github_produtos(df, path, commit_message):
 # 🆕 FUNÇÕES DE PERSISTÊNCIA E LÓGICA DO CASHBACK
 # =================================================================================
 
-@st.cache_data(show_spinner="Carregando dados de Cashback...")
+@depende_de(ARQ_CASHBACK)
+@snapshot(show_spinner="Carregando dados de Cashback...")
 def carregar_cashback():
     """Carrega o DataFrame de Cashback, com fallback."""
     url_raw = f"https://raw.githubusercontent.com/{OWNER}/{REPO_NAME}/{BRANCH}/{ARQ_CASHBACK}"
-    df = load_csv_github(url_raw)
+    df = carregar_tabela(ARQ_CASHBACK, url_raw)
     
     if df is None or df.empty:
         try:
@@ -488,17 +560,10 @@ def carregar_cashback():
             # Cria DataFrame vazio com as colunas esperadas
             df = pd.DataFrame(columns=COLUNAS_CASHBACK)
     
-    # Garante que todas as colunas existam
-    for col in COLUNAS_CASHBACK:
-        if col not in df.columns:
-            df[col] = ''
-    
-    # Normaliza tipos
+    # Colunas (inclusive as lidas em MAIÚSCULAS) e tipos pelo esquema
+    df = aplicar_esquema(df, ESQUEMA_CASHBACK)
     df["ID"] = df["ID"].astype(str)
-    df["Saldo_Cashback"] = pd.to_numeric(df["Saldo_Cashback"], errors='coerce').fillna(0.0)
-    df["Total_Gasto"] = pd.to_numeric(df["Total_Gasto"], errors='coerce').fillna(0.0)
-    
-    return df[COLUNAS_CASHBACK]
+    return df
 
 def salvar_cashback_no_github(df: pd.DataFrame, commit_message: str):
     """Salva o DataFrame de Cashback localmente e no GitHub."""
@@ -515,34 +580,25 @@ def salvar_cashback_no_github(df: pd.DataFrame, commit_message: str):
         return False
     
     # 2. Envio para o GitHub
-    token = (st.secrets.get("GITHUB_TOKEN") or st.secrets.get("github_token") or GITHUB_TOKEN)
-    repo_owner = st.secrets.get("REPO_OWNER") or st.secrets.get("owner") or OWNER
-    repo_name = st.secrets.get("REPO_NAME") or st.secrets.get("repo") or REPO_NAME
-    branch = st.secrets.get("BRANCH") or BRANCH
+    storage = get_storage()
     csv_remote_path = ARQ_CASHBACK 
     
-    if not token:
+    if not storage.disponivel():
         st.warning("⚠️ Nenhum token do GitHub encontrado — apenas backup local foi salvo.")
         return False
         
     try:
-        g = Github(token)
-        repo = g.get_repo(f"{repo_owner}/{repo_name}")
-        csv_content = df.to_csv(index=False, encoding="utf-8-sig")
-        
-        try:
-            contents = repo.get_contents(csv_remote_path, ref=branch)
-            repo.update_file(contents.path, commit_message, csv_content, contents.sha, branch=branch)
-            st.toast("📁 Cashback atualizado no GitHub!")
-        except Exception:
-            repo.create_file(csv_remote_path, commit_message, csv_content, branch=branch)
-            st.toast("📁 Arquivo de Cashback criado no GitHub!")
+        resultado = storage.gravar(csv_remote_path, df, commit_message)
+        if resultado == "atualizado":
+            st.toast(f"📁 Cashback atualizado no {storage.nome}!")
+        else:
+            st.toast(f"📁 Arquivo de Cashback criado no {storage.nome}!")
             
         carregar_cashback.clear()
         
         return True
     except Exception as e:
-        st.warning(f"Falha ao enviar Cashback para o GitHub — backup local mantido. Erro: ({e})")
+        st.warning(f"Falha ao enviar Cashback para o {storage.nome} — backup local mantido. Erro: ({e})")
         return False
 
 
@@ -575,7 +631,7 @@ def calcular_cashback_venda(valor_venda: float, cliente_id: str, df_cashback: pd
     # Obtém o percentual do nível
     percentual_cashback = NIVEIS_CASHBACK.get(nivel, {"percentual": 0.00})["percentual"]
     
-    valor_cashback = round(valor_venda * percentual_cashback, 2)
+    valor_cashback = para_reais(aplicar_taxa(centavos(valor_venda), percentual_cashback))
     
     return valor_cashback, percentual_cashback * 100, nivel
 
@@ -590,8 +646,8 @@ def creditar_cashback_e_atualizar_gasto(cliente_id: str, valor_venda: float, val
         idx = idx_cliente[0]
         
         # 1. Crédito do Cashback e Acumulação do Gasto
-        df_cashback.loc[idx, "Saldo_Cashback"] += valor_cashback
-        df_cashback.loc[idx, "Total_Gasto"] += valor_venda
+        df_cashback.loc[idx, "Saldo_Cashback"] = arredondar_reais(df_cashback.loc[idx, "Saldo_Cashback"] + valor_cashback)
+        df_cashback.loc[idx, "Total_Gasto"] = arredondar_reais(df_cashback.loc[idx, "Total_Gasto"] + valor_venda)
         
         # 2. Atualiza o Nível com base no novo Total Gasto
         novo_total_gasto = df_cashback.loc[idx, "Total_Gasto"]
@@ -604,11 +660,12 @@ def creditar_cashback_e_atualizar_gasto(cliente_id: str, valor_venda: float, val
 # 🔄 Funções de carregamento com cache
 # =================================================================================
 
-@st.cache_data(show_spinner="Carregando promoções...")
+@depende_de(ARQ_PROMOCOES)
+@snapshot(show_spinner="Carregando promoções...")
 def carregar_promocoes():
     COLUNAS_PROMO = ["ID_PROMOCAO", "ID_PRODUTO", "NOME_PRODUTO", "PRECO_ORIGINAL", "PRECO_PROMOCIONAL", "STATUS", "DATA_INICIO", "DATA_FIM"]
     url_raw = f"https://raw.githubusercontent.com/{OWNER}/{REPO_NAME}/{BRANCH}/{ARQ_PROMOCOES}"
-    df = load_csv_github(url_raw)
+    df = carregar_tabela(ARQ_PROMOCOES, url_raw)
     if df is None or df.empty:
         try:
             df = pd.read_csv(ARQ_PROMOCOES, dtype=str)
@@ -620,10 +677,11 @@ def carregar_promocoes():
             df[col] = ""
     return df[[col for col in COLUNAS_PROMO if col in df.columns]]
 
-@st.cache_data(show_spinner="Carregando dados...")
+@depende_de(PATH_DIVIDAS)
+@snapshot(show_spinner="Carregando dados...")
 def carregar_livro_caixa():
     url_raw = f"https://raw.githubusercontent.com/{OWNER}/{REPO_NAME}/{BRANCH}/{PATH_DIVIDAS}"
-    df = load_csv_github(url_raw)
+    df = carregar_tabela(PATH_DIVIDAS, url_raw)
     
     if df is None or df.empty:
         try:
@@ -642,67 +700,37 @@ def carregar_livro_caixa():
 
     return processar_dataframe(df)
 
-@st.cache_data(show_spinner="Carregando histórico de compras...")
+@depende_de(ARQ_COMPRAS)
+@snapshot(show_spinner="Carregando histórico de compras...")
 def carregar_historico_compras():
     """Carrega o histórico de compras do GitHub, com fallback para o arquivo local."""
     url_raw = f"https://raw.githubusercontent.com/{OWNER}/{REPO_NAME}/{BRANCH}/{ARQ_COMPRAS}"
-    df = load_csv_github(url_raw)
-    
-    # Use uma lista de mapeamento para os nomes finais esperados
-    colunas_esperadas = COLUNAS_COMPRAS 
+    df = carregar_tabela(ARQ_COMPRAS, url_raw)
     
     if df is None or df.empty:
         try:
             df = pd.read_csv(ARQ_COMPRAS, dtype=str)
-            
-            # Padroniza as colunas do arquivo local para facilitar o mapeamento
-            df.columns = [col.upper().replace(' ', '_') for col in df.columns]
         except Exception:
             # Em caso de falha total, cria o DF vazio com as colunas esperadas
-            return pd.DataFrame(columns=colunas_esperadas)
-    
-    # 1. Cria o mapeamento de colunas padronizadas para as colunas esperadas
-    col_mapping = {
-        col.upper().replace(' ', '_'): col
-        for col in colunas_esperadas
-    }
-    
-    # 2. Renomeia as colunas no DataFrame, usando o mapeamento
-    # Isso converte 'DATA' para 'Data', 'VALOR_TOTAL' para 'Valor Total', etc.
-    df.rename(columns=col_mapping, inplace=True)
+            return pd.DataFrame(columns=COLUNAS_COMPRAS)
     
-    # 3. Garante que TODAS as colunas esperadas existam (e na ordem correta)
-    df_final = pd.DataFrame(columns=colunas_esperadas)
-    for col in colunas_esperadas:
-        if col in df.columns:
-            df_final[col] = df[col]
-        else:
-            df_final[col] = "" # Adiciona coluna vazia se estiver faltando
-            
-    return df_final
+    # O esquema converte 'DATA' para 'Data', 'VALOR_TOTAL' para 'Valor Total', etc.,
+    # e garante TODAS as colunas esperadas (na ordem correta); os valores continuam texto
+    return aplicar_esquema(df, ESQUEMA_COMPRAS, tipar=False)
 
 # --- BLOCO DE FUNÇÕES PARA CARREGAMENTO DE PRODUTOS ---
 def processar_produtos(df_bruto):
     """FUNÇÃO 1: A ESPECIALISTA EM LIMPEZA."""
-    df = df_bruto.copy()
-    df["QUANTIDADE"] = pd.to_numeric(df.get("QUANTIDADE"), errors='coerce').fillna(0).astype(int)
-    df["PRECOCUSTO"] = pd.to_numeric(df.get("PRECOCUSTO"), errors='coerce').fillna(0.0)
-    df["PRECOVISTA"] = pd.to_numeric(df.get("PRECOVISTA"), errors='coerce').fillna(0.0)
-    df["PRECOCARTAO"] = pd.to_numeric(df.get("PRECOCARTAO"), errors='coerce').fillna(0.0)
-    df["VALIDADE"] = pd.to_datetime(df.get("VALIDADE"), errors='coerce').dt.date
-    df["CASHBACKPERCENT"] = pd.to_numeric(df.get("CASHBACKPERCENT"), errors='coerce').fillna(0.0)
-    df["DETALHESGRADE"] = df.get("DETALHESGRADE", pd.Series(dtype='str')).astype(str).replace('nan', '{}').replace('', '{}')
-    COLUNAS_PRODUTOS_UPPER = [c.upper() for c in COLUNAS_PRODUTOS_COMPLETAS]
-    df = df[[col for col in COLUNAS_PRODUTOS_UPPER if col in df.columns]]
-    camel_case_map = {c.upper(): c for c in COLUNAS_PRODUTOS_COMPLETAS}
-    df.rename(columns=camel_case_map, inplace=True, errors='ignore')
-    return df
+    # Nomes (MAIÚSCULAS -> CamelCase), tipos, datas e padrões vêm do esquema, em uma passada
+    # Marca e Categoria como category: o snapshot compartilhado guarda cada nome uma vez
+    return aplicar_categorias(aplicar_esquema(df_bruto, ESQUEMA_PRODUTOS), ESQUEMA_PRODUTOS)
 
-@st.cache_data(show_spinner="Carregando produtos do estoque...")
+@depende_de(ARQ_PRODUTOS, ARQ_MOVIMENTOS_ESTOQUE, ARQ_SNAPSHOTS_ESTOQUE)
+@snapshot(show_spinner="Carregando produtos do estoque...")
 def carregar_produtos():
     """FUNÇÃO 2: A RESPONSÁVEL PELO CARREGAMENTO."""
     st.write("🔗 URL de carregamento:", f"https://raw.githubusercontent.com/{OWNER}/{REPO_NAME}/{BRANCH}/{ARQ_PRODUTOS}")
-    df_base = load_csv_github(f"https://raw.githubusercontent.com/{OWNER}/{REPO_NAME}/{BRANCH}/{ARQ_PRODUTOS}")
+    df_base = carregar_tabela(ARQ_PRODUTOS)
     if df_base is None or df_base.empty:
         st.warning("⚠️ Falha ao carregar do GitHub. Tentando carregar o arquivo local...")
         try:
@@ -710,12 +738,9 @@ def carregar_produtos():
         except Exception as e:
             st.error(f"❌ Falha ao carregar o arquivo local ({ARQ_PRODUTOS}): {e}")
             df_base = pd.DataFrame(columns=COLUNAS_PRODUTOS)
-    df_base.columns = [col.upper() for col in df_base.columns]
-    for col in [c.upper() for c in COLUNAS_PRODUTOS_COMPLETAS]:
-        if col not in df_base.columns:
-            df_base[col] = ''
-    df_processado = processar_produtos(df_base)
-    return df_processado
+    # Colunas faltantes e nomes em qualquer caixa são resolvidos pelo esquema;
+    # a Quantidade dos produtos com movimentos vem do livro de estoque (snapshot + cauda)
+    return aplicar_estoque_do_livro(processar_produtos(df_base))
 
 def inicializar_produtos():
     """FUNÇÃO 3: A GERENTE."""
@@ -723,12 +748,13 @@ def inicializar_produtos():
         st.session_state.produtos = carregar_produtos()
     return st.session_state.produtos
 
-@st.cache_data
+@depende_de(ARQ_PROMOCOES)
+@snapshot()
 def carregar_promocoes():
     url = URL_PROMOCOES_CSV  # defina essa constante no constants_and_css.py
     try:
-        df = pd.read_csv(url, dtype=str)
-        if df.empty or len(df.columns) < 2:
+        df = get_storage().ler(ARQ_PROMOCOES, url=url)
+        if df is None or df.empty or len(df.columns) < 2:
             return pd.DataFrame(columns=["ID", "IDProduto", "NomeProduto", "Desconto", "DataInicio", "DataFim"])
         return df
     except Exception as e:
@@ -738,29 +764,11 @@ def carregar_promocoes():
 
 
 # ==================== FUNÇÕES DE LÓGICA DE NEGÓCIO (PRODUTOS/ESTOQUE) ====================
-def ajustar_estoque(id_produto, quantidade, operacao="debitar"):
-    if "produtos" not in st.session_state:
-        inicializar_produtos()
-    produtos_df = st.session_state.produtos
-    idx_produto = produtos_df[produtos_df["ID"] == id_produto].index
-    if not idx_produto.empty:
-        idx = idx_produto[0]
-        qtd_atual = produtos_df.loc[idx, "Quantidade"] 
-        if operacao == "debitar":
-            nova_qtd = qtd_atual - quantidade
-            produtos_df.loc[idx, "Quantidade"] = max(0, nova_qtd)
-            return True
-        elif operacao == "creditar":
-            nova_qtd = qtd_atual + quantidade
-            produtos_df.loc[idx, "Quantidade"] = nova_qtd
-            return True
-    return False
-
 def ler_codigo_barras_api(image_bytes):
     URL_DECODER_ZXING = "https://zxing.org/w/decode"
     try:
         files = {"f": ("barcode.png", image_bytes, "image/png")}
-        response = requests.post(URL_DECODER_ZXING, files=files, timeout=30)
+        response = http_post(URL_DECODER_ZXING, files=files, timeout=30)
         if response.status_code != 200:
             if 'streamlit' in globals():
                 st.error(f"❌ Erro na API ZXing. Status HTTP: {response.status_code}")
@@ -789,57 +797,49 @@ def callback_salvar_novo_produto(df_produtos, tipo_produto, nome, marca, categor
     if not nome:
         st.error("O nome do produto é obrigatório.")
         return False
-    
-    # Função auxiliar para adicionar linha no DF de produtos
-    def add_product_row(df, p_id, p_nome, p_marca, p_categoria, p_qtd, p_custo, p_vista, p_cartao, p_validade, p_foto, p_cb, p_pai_id=None, p_cashback=0.0, p_detalhes="{}"):
-        novo_id = prox_id(df, "ID")
-        novo = {
-            "ID": novo_id, "Nome": p_nome.strip(), "Marca": p_marca.strip(), "Categoria": p_categoria.strip(),
+
+    # IDs a partir do maior já usado (catálogo e livro de estoque), lido uma vez para o lote inteiro
+    alocador = AlocadorIDs(df_produtos, "ID", usados=estoque_em().index)
+    hoje = date.today().strftime('%Y-%m-%d')
+
+    # Função auxiliar que monta a linha de um produto novo (o DataFrame só é concatenado uma vez, no fim)
+    def nova_linha(p_nome, p_qtd, p_custo, p_vista, p_cartao, p_foto, p_cb, p_pai_id=None, p_cashback=0.0, p_detalhes="{}"):
+        return {
+            "ID": alocador.proximo(), "Nome": p_nome.strip(), "Marca": marca.strip(), "Categoria": categoria.strip(),
             "Quantidade": int(p_qtd), "PrecoCusto": to_float(p_custo), "PrecoVista": to_float(p_vista),
-            "PrecoCartao": to_float(p_cartao), "Validade": str(p_validade), "FotoURL": p_foto.strip(),
+            "PrecoCartao": to_float(p_cartao), "Validade": str(validade), "FotoURL": p_foto.strip(),
             "CodigoBarras": str(p_cb).strip(), "PaiID": str(p_pai_id).strip() if p_pai_id else "",
             "CashbackPercent": to_float(p_cashback), "DetalhesGrade": p_detalhes
         }
-        return pd.concat([df, pd.DataFrame([novo])], ignore_index=True), novo_id
-    
+
+    # Registro no histórico de compras (custo e quantidade informados)
+    def nova_compra(p_nome, p_id, p_qtd, p_custo, p_foto):
+        return {
+            "Data": hoje, "Produto": f"{p_nome} | ID: {p_id}", "Quantidade": p_qtd,
+            "Valor Total": para_reais(centavos(p_custo) * int(p_qtd)), "Cor": "#007bff", "FotoURL": p_foto.strip(),
+        }
+
     if tipo_produto == "Produto simples":
-        # 1. Adiciona o Produto Simples no DF de Produtos
-        produtos, new_id = add_product_row(
-            df_produtos, None, nome, marca, categoria, qtd, preco_custo, preco_vista,
+        # 1. Linha do Produto Simples
+        produto = nova_linha(
+            nome, qtd, preco_custo, preco_vista,
             round(to_float(preco_vista) / FATOR_CARTAO, 2) if to_float(preco_vista) > 0 else 0.0,
-            validade, foto_url, codigo_barras, p_cashback=cashback_percent
+            foto_url, codigo_barras, p_cashback=cashback_percent
         )
-        
-        # 2. Salva o DF de Produtos no GitHub
-        if salvar_produtos_no_github(produtos, f"Novo produto simples: {nome} (ID {new_id})"):
-            
-            # 3. REGISTRO NO HISTÓRICO DE COMPRAS
-            valor_custo_float = to_float(preco_custo)
-            quantidade_int = int(qtd)
-            
-            if valor_custo_float > 0 and quantidade_int > 0:
-                df_compras = carregar_historico_compras()
-                valor_total_compra = valor_custo_float * quantidade_int
-
-                nova_compra = {
-                    "Data": date.today().strftime('%Y-%m-%d'),
-                    "Produto": f"{nome} | ID: {new_id}",
-                    "Quantidade": quantidade_int,
-                    "Valor Total": valor_total_compra,
-                    "Cor": "#007bff", 
-                    "FotoURL": foto_url.strip(),
-                }
-                
-                # Garante que as colunas do DF de compra correspondem ao COLUNAS_COMPRAS
-                df_nova_compra = pd.DataFrame([nova_compra])[COLUNAS_COMPRAS] 
-                df_compras = pd.concat([df_compras, df_nova_compra], ignore_index=True)
-                
-                # Salva o Histórico de Compras no GitHub
-                salvar_historico_compras_no_github(df_compras, f"Registro de compra do novo produto simples: {nome}")
-            # FIM DO NOVO BLOCO
-            
-            st.session_state.produtos = produtos
-            carregar_produtos.clear()
+        new_id = produto["ID"]
+        valor_custo_float = to_float(preco_custo)
+        quantidade_int = int(qtd)
+        compras = []
+        if valor_custo_float > 0 and quantidade_int > 0:
+            compras.append(nova_compra(nome, new_id, quantidade_int, valor_custo_float, foto_url))
+
+        # 2. Produto, compra e estoque inicial gravados juntos
+        produtos = salvar_inclusao_produtos(
+            df_produtos, [produto], compras, [(new_id, quantidade_int)],
+            f"Novo produto simples: {nome} (ID {new_id})"
+        )
+        if produtos is not None:
+            substituir_produtos_sessao(produtos)
             st.success(f"Produto '{nome}' cadastrado com sucesso!")
             st.session_state.cad_nome = ""
             st.session_state.cad_marca = ""
@@ -855,58 +855,42 @@ def callback_salvar_novo_produto(df_produtos, tipo_produto, nome, marca, categor
         return False
     
     elif tipo_produto == "Produto com variações (grade)":
-        # 1. Adiciona o Produto PAI (com estoque 0)
-        produtos, pai_id = add_product_row(
-            df_produtos, None, nome, marca, categoria, 0, 0.0, 0.0, 0.0,
-            validade, foto_url, codigo_barras, p_pai_id=None, p_cashback=cashback_percent
-        )
-        cont_variacoes = 0
-        compras_para_historico = [] # Lista para acumular as compras das variações
+        # 1. Produto PAI (com estoque 0)
+        pai = nova_linha(nome, 0, 0.0, 0.0, 0.0, foto_url, codigo_barras, p_pai_id=None, p_cashback=cashback_percent)
+        pai_id = pai["ID"]
+        novos = [pai]
+        compras_para_historico = [] # Compras das variações
+        entradas_estoque = [] # (ID, quantidade) de cada variação, para o livro de movimentos
         
         for var in variações:
             detalhes_grade_str = str(var.get("DetalhesGrade", "{}"))
             var_qtd = int(var.get("Quantidade", 0))
             
             if var.get("Nome") and var_qtd > 0:
-                # Adiciona a variação (filho) ao DataFrame de produtos
-                produtos, var_id = add_product_row(
-                    produtos, None, f"{nome} ({var['Nome']})", marca, categoria,
-                    var_qtd, var["PrecoCusto"], var["PrecoVista"], var["PrecoCartao"],
-                    validade, var.get("FotoURL", foto_url), var.get("CodigoBarras", ""),
+                # Variação (filho) referenciando o pai
+                variacao = nova_linha(
+                    f"{nome} ({var['Nome']})", var_qtd, var["PrecoCusto"], var["PrecoVista"], var["PrecoCartao"],
+                    var.get("FotoURL", foto_url), var.get("CodigoBarras", ""),
                     p_pai_id=pai_id, p_cashback=var.get("CashbackPercent", 0.0), p_detalhes=detalhes_grade_str
                 )
-                cont_variacoes += 1
+                novos.append(variacao)
+                entradas_estoque.append((variacao["ID"], var_qtd))
                 
-                # PREPARA REGISTRO DE COMPRA DE VARIAÇÃO
                 var_custo = to_float(var["PrecoCusto"])
                 if var_custo > 0:
-                    compras_para_historico.append({
-                        "Data": date.today().strftime('%Y-%m-%d'),
-                        "Produto": f"{nome} ({var['Nome']}) | ID: {var_id}",
-                        "Quantidade": var_qtd,
-                        "Valor Total": var_custo * var_qtd,
-                        "Cor": "#007bff",
-                        "FotoURL": var.get("FotoURL", foto_url).strip(),
-                    })
+                    compras_para_historico.append(
+                        nova_compra(f"{nome} ({var['Nome']})", variacao["ID"], var_qtd, var_custo, var.get("FotoURL", foto_url))
+                    )
         
+        cont_variacoes = len(novos) - 1
         if cont_variacoes > 0:
-            # 2. Salva o DF de Produtos (Pai + Filhos)
-            if salvar_produtos_no_github(produtos, f"Novo produto com grade: {nome} ({cont_variacoes} variações)"):
-                
-                # 3. SALVAR HISTÓRICO DE COMPRAS DA GRADE
-                if compras_para_historico:
-                    df_compras = carregar_historico_compras()
-                    
-                    # Garante que as colunas do DF de compra correspondem ao COLUNAS_COMPRAS
-                    df_novas_compras = pd.DataFrame(compras_para_historico)[COLUNAS_COMPRAS] 
-                    df_compras = pd.concat([df_compras, df_novas_compras], ignore_index=True)
-                    
-                    # Salva o Histórico de Compras no GitHub
-                    salvar_historico_compras_no_github(df_compras, f"Registro de compra do novo produto com grade: {nome}")
-                # FIM DO NOVO BLOCO
-                
-                st.session_state.produtos = produtos
-                inicializar_produtos.clear()
+            # 2. Pai + filhos, compras da grade e estoque inicial gravados juntos
+            produtos = salvar_inclusao_produtos(
+                df_produtos, novos, compras_para_historico, entradas_estoque,
+                f"Novo produto com grade: {nome} ({cont_variacoes} variações)"
+            )
+            if produtos is not None:
+                substituir_produtos_sessao(produtos)
                 st.success(f"Produto '{nome}' com {cont_variacoes} variações cadastrado com sucesso!")
                 st.session_state.cad_nome = ""
                 st.session_state.cad_marca = ""
@@ -919,9 +903,6 @@ def callback_salvar_novo_produto(df_produtos, tipo_produto, nome, marca, categor
                 return True
             return False
         else:
-            # Remove o produto pai se nenhuma variação foi salva
-            produtos = produtos[produtos["ID"] != pai_id]
-            st.session_state.produtos = produtos
             st.error("Nenhuma variação válida foi fornecida. O produto principal não foi salvo.")
             return False
             
@@ -970,32 +951,8 @@ def callback_adicionar_estoque(prod_id, prod_nome, qtd, preco, custo, estoque_di
 # ==================== FUNÇÕES DE ANÁLISE (HOMEPAGE) ====================
 @st.cache_data(show_spinner="Calculando mais vendidos...")
 def get_most_sold_products(df_movimentacoes):
-    df_vendas = df_movimentacoes[
-        (df_movimentacoes["Tipo"] == "Entrada") & 
-        (df_movimentacoes["Status"] == "Realizada") & 
-        (df_movimentacoes["Produtos Vendidos"].notna()) & 
-        (df_movimentacoes["Produtos Vendidos"] != "")
-    ].copy()
-    if df_vendas.empty:
-        return pd.DataFrame(columns=["Produto_ID", "Quantidade Total Vendida"])
-    vendas_list = []
-    for produtos_json in df_vendas["Produtos Vendidos"]: 
-        try:
-            try:
-                produtos = json.loads(produtos_json)
-            except (json.JSONDecodeError, TypeError):
-                produtos = ast.literal_eval(produtos_json)
-            if isinstance(produtos, list):
-                for item in produtos:
-                    produto_id = str(item.get("Produto_ID"))
-                    if produto_id and produto_id != "None":
-                        vendas_list.append({
-                            "Produto_ID": produto_id,
-                            "Quantidade": to_float(item.get("Quantidade", 0))
-                        })
-        except Exception:
-            continue
-    df_vendas_detalhada = pd.DataFrame(vendas_list)
+    df_itens = itens_venda(df_movimentacoes)
+    df_vendas_detalhada = df_itens[(df_itens["Status"] == "Realizada") & (df_itens["Produto_ID"] != "")]
     if df_vendas_detalhada.empty:
         return pd.DataFrame(columns=["Produto_ID", "Quantidade Total Vendida"])
     df_mais_vendidos = df_vendas_detalhada.groupby("Produto_ID")["Quantidade"].sum().reset_index()
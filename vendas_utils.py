@@ -0,0 +1,188 @@
+# vendas_utils.py
+import ast
+import json
+
+import pandas as pd
+import streamlit as st
+
+from cache_utils import depende_de
+from constants_and_css import ARQ_ITENS_VENDA
+from ledger_utils import ARQ_MANIFESTO, buscar_manifesto, derivado_por_mes, ler_derivado_mensal
+from storage_utils import get_storage, ler_csv_texto
+
+# Uma linha por item vendido, derivada de "Produtos Vendidos" no momento da gravação
+COLUNAS_ITENS_VENDA = [
+    "TransacaoID", "Versao", "Data", "Status", "Produto_ID", "Produto",
+    "Quantidade", "Preco_Unitario", "Custo_Unitario"
+]
+
+
+# =================================================================================
+# 🧾 Leitura do JSON de "Produtos Vendidos" (único ponto de parse)
+# =================================================================================
+def ler_produtos_vendidos(produtos_json) -> list:
+    """Converte o texto de 'Produtos Vendidos' em lista de dicts (json.loads, com fallback para o formato antigo)."""
+    if produtos_json is None or (not isinstance(produtos_json, (list, str))) or produtos_json == "":
+        return []
+    if isinstance(produtos_json, list):
+        return produtos_json
+    try:
+        try:
+            produtos = json.loads(produtos_json)
+        except (json.JSONDecodeError, TypeError):
+            produtos = ast.literal_eval(produtos_json)
+    except Exception:
+        return []
+    return produtos if isinstance(produtos, list) else []
+
+
+def _hash_textos(textos: pd.Series) -> pd.Series:
+    """Hash vetorizado (64 bits, em hexa) de uma Series de textos."""
+    hashes = pd.util.hash_pandas_object(textos, index=False).values
+    return pd.Series([f"{h:016x}" for h in hashes.tolist()], index=textos.index)
+
+
+def chaves_vendas(df_movimentacoes: pd.DataFrame) -> pd.DataFrame:
+    """
+    Vendas (Entrada com 'Produtos Vendidos') com TransacaoID e Versao.
+    TransacaoID vem de 'TransactionID' quando existe; nas linhas antigas é derivado do conteúdo.
+    Versao muda quando Data, Status ou os produtos da venda mudam.
+    """
+    colunas = ["TransacaoID", "Versao", "Data", "Status", "Produtos Vendidos"]
+    if df_movimentacoes is None or df_movimentacoes.empty or "Produtos Vendidos" not in df_movimentacoes.columns:
+        return pd.DataFrame(columns=colunas)
+
+    produtos = df_movimentacoes["Produtos Vendidos"]
+    vendas = df_movimentacoes[
+        (df_movimentacoes["Tipo"] == "Entrada") & produtos.notna() & (produtos.astype(str).str.strip() != "")
+    ]
+    if vendas.empty:
+        return pd.DataFrame(columns=colunas)
+
+    datas = pd.to_datetime(vendas["Data"], errors="coerce").dt.strftime("%Y-%m-%d").fillna("")
+    status = vendas["Status"].fillna("").astype(str)
+    conteudo = datas + "|" + status + "|" + vendas["Produtos Vendidos"].astype(str)
+    versoes = _hash_textos(conteudo)
+
+    base_legado = (datas + "|" + vendas["Cliente"].fillna("").astype(str) + "|"
+                   + vendas["Valor"].astype(str) + "|" + vendas["Produtos Vendidos"].astype(str))
+    # Vendas idênticas repetidas recebem IDs distintos pela ordem de ocorrência
+    ocorrencia = base_legado.groupby(base_legado).cumcount().astype(str)
+    ids = _hash_textos(base_legado + "#" + ocorrencia)
+    if "TransactionID" in vendas.columns:
+        ids_gravados = vendas["TransactionID"].fillna("").astype(str).str.strip()
+        ids = ids_gravados.where(ids_gravados != "", ids)
+
+    return pd.DataFrame({
+        "TransacaoID": ids.values,
+        "Versao": versoes.values,
+        "Data": datas.values,
+        "Status": status.values,
+        "Produtos Vendidos": vendas["Produtos Vendidos"].values,
+    })
+
+
+def extrair_itens(vendas: pd.DataFrame) -> pd.DataFrame:
+    """Desnormaliza as vendas (saída de chaves_vendas) em uma linha por item."""
+    linhas = []
+    for venda in vendas.itertuples(index=False):
+        for item in ler_produtos_vendidos(venda[4]):
+            if not isinstance(item, dict):
+                continue
+            produto_id = str(item.get("Produto_ID", "") or "")
+            linhas.append((
+                venda[0], venda[1], venda[2], venda[3],
+                "" if produto_id == "None" else produto_id,
+                str(item.get("Produto", "") or ""),
+                item.get("Quantidade", 0), item.get("Preço Unitário", 0), item.get("Custo Unitário", 0),
+            ))
+    return _tipar_itens(pd.DataFrame(linhas, columns=COLUNAS_ITENS_VENDA))
+
+
+def _tipar_itens(df: pd.DataFrame) -> pd.DataFrame:
+    for col in COLUNAS_ITENS_VENDA:
+        if col not in df.columns:
+            df[col] = ""
+    df = df[COLUNAS_ITENS_VENDA].copy()
+    for col in ["TransacaoID", "Versao", "Data", "Status", "Produto_ID", "Produto"]:
+        df[col] = df[col].fillna("").astype(str)
+    for col in ["Quantidade", "Preco_Unitario", "Custo_Unitario"]:
+        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0.0)
+    return df
+
+
+# =================================================================================
+# 🔄 Sincronização (só as vendas novas/alteradas são lidas)
+# =================================================================================
+def sincronizar_itens_venda(df_itens: pd.DataFrame | None, df_movimentacoes: pd.DataFrame) -> tuple[pd.DataFrame, bool]:
+    """
+    Deixa a tabela de itens igual às vendas do Livro Caixa: mantém os itens cujas (TransacaoID, Versao)
+    continuam valendo, descarta os de vendas excluídas/alteradas e lê o JSON apenas das vendas que faltam.
+    Retorna (itens, houve_alteracao).
+    """
+    df_itens = _tipar_itens(df_itens if df_itens is not None else pd.DataFrame(columns=COLUNAS_ITENS_VENDA))
+    vendas = chaves_vendas(df_movimentacoes)
+
+    # Chaves como object: isin via tabela hash (bem mais rápido que no dtype string do pandas)
+    chave_vendas = (vendas["TransacaoID"] + "|" + vendas["Versao"]).astype(object)
+    chave_itens = (df_itens["TransacaoID"] + "|" + df_itens["Versao"]).astype(object)
+
+    manter = chave_itens.isin(chave_vendas)
+    faltando = vendas[~chave_vendas.isin(chave_itens[manter])]
+    if manter.all() and faltando.empty:
+        return df_itens, False
+
+    novos = extrair_itens(faltando)
+    partes = [p for p in (df_itens[manter], novos) if not p.empty]
+    itens = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=COLUNAS_ITENS_VENDA)
+    return _tipar_itens(itens), True
+
+
+@depende_de(ARQ_ITENS_VENDA)
+@st.cache_data(show_spinner=False)
+def carregar_itens_venda() -> pd.DataFrame:
+    """
+    Tabela itens_venda gravada (GitHub ou banco local); vazia se ainda não existir.
+    No GitHub vem das versões mensais (itens_venda_AAAA_MM.csv) e, para os meses ainda não regravados, do arquivo único.
+    """
+    storage = get_storage()
+    try:
+        if storage.local:
+            df = storage.ler(ARQ_ITENS_VENDA)
+        else:
+            manifesto = buscar_manifesto(storage.url_raw(ARQ_MANIFESTO))
+            df = ler_derivado_mensal(ARQ_ITENS_VENDA, manifesto, storage.url_raw, ler_csv_texto)
+    except Exception:
+        df = None
+    return _tipar_itens(df if df is not None else pd.DataFrame(columns=COLUNAS_ITENS_VENDA))
+
+
+@depende_de(ARQ_ITENS_VENDA)
+@st.cache_data(show_spinner=False)
+def itens_venda(df_movimentacoes: pd.DataFrame) -> pd.DataFrame:
+    """Itens vendidos correspondentes ao DataFrame informado (usa a tabela gravada e lê só o que falta)."""
+    itens, _ = sincronizar_itens_venda(carregar_itens_venda(), df_movimentacoes)
+    return itens
+
+
+def itens_venda_para_gravar(df_movimentacoes: pd.DataFrame) -> pd.DataFrame | None:
+    """Tabela atualizada para ir junto do salvamento do Livro Caixa; None se nada mudou."""
+    itens, alterou = sincronizar_itens_venda(carregar_itens_venda(), df_movimentacoes)
+    return itens if alterou else None
+
+
+def itens_venda_mensais(df_movimentacoes: pd.DataFrame, particoes) -> dict:
+    """{itens_venda_AAAA_MM.csv: itens do mês} das partições regravadas (livro_caixa_AAAA_MM.csv), para o mesmo commit."""
+    itens, _ = sincronizar_itens_venda(carregar_itens_venda(), df_movimentacoes)
+    return derivado_por_mes(itens, ARQ_ITENS_VENDA, particoes)
+
+
+def itens_da_transacao(df_itens: pd.DataFrame, linha_movimentacao) -> pd.DataFrame:
+    """Itens de uma linha do Livro Caixa (ex.: para estornar estoque na exclusão)."""
+    vendas = chaves_vendas(pd.DataFrame([dict(linha_movimentacao)]))
+    if vendas.empty:
+        return df_itens.iloc[0:0]
+    transacao_id = vendas["TransacaoID"].iloc[0]
+    encontrados = df_itens[df_itens["TransacaoID"] == transacao_id]
+    # Linha antiga que ainda não está na tabela: lê direto (uma venda só)
+    return encontrados if not encontrados.empty else extrair_itens(vendas)